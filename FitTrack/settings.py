@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro, para que o tempo total inclua os demais middlewares
+    'core.metricas.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,12 +91,46 @@ DATABASES = {
     }
 }
 
+# Cache
+# Sem CACHE_URL usa memória local do processo (desenvolvimento e testes); com
+# CACHE_URL (ex.: redis://localhost:6379/0) usa qualquer servidor compatível com
+# o protocolo Redis, o que requer o pacote `redis`.
+
+CACHE_URL = config('CACHE_URL', default='')
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Tempo de vida, em segundos, das respostas da API guardadas em cache
+FITTRACK_CACHE_TTL = config('FITTRACK_CACHE_TTL', default=300, cast=int)
+
 REST_FRAMEWORK = {
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.NamespaceVersioning',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.api.v1.authentication.PrincipalJWTAuthentication',
+    ),
+    # orjson quando instalado, com a mesma saída do JSONRenderer/JSONParser padrão
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.api.v1.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.api.v1.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_LANGUAGE': 'pt-br',
     'DEFAULT_REGION': 'BR',
@@ -104,8 +140,20 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'core.api.v1.serializers.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.api.v1.serializers.TokenRefreshSerializer',
 }
 
+# Autentica pelas claims do token sem buscar o usuário no banco a cada requisição.
+# Usuários desativados deixam de ser aceitos em até FITTRACK_TOKEN_USER_TTL segundos.
+FITTRACK_STATELESS_JWT = config('FITTRACK_STATELESS_JWT', default=False, cast=bool)
+FITTRACK_TOKEN_USER_TTL = config('FITTRACK_TOKEN_USER_TTL', default=30, cast=int)
+
+# Perfil das requisições (core.metricas): fração amostrada (0 desliga) e quantas
+# execuções do mesmo SQL em uma requisição contam como suspeita de N+1.
+FITTRACK_PROFILING_SAMPLE_RATE = config('FITTRACK_PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+FITTRACK_PROFILING_DUPLICATE_THRESHOLD = config('FITTRACK_PROFILING_DUPLICATE_THRESHOLD', default=5, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
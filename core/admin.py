@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TipoPlano, Treino, Dieta, Cliente, HistoricoTreino, HistoricoDieta, Exercicio, Refeicao, TrocaExercicio, TrocaRefeicao
+from .models import TipoPlano, Treino, Dieta, Cliente, HistoricoTreino, HistoricoDieta, Exercicio, Refeicao, TrocaExercicio, TrocaRefeicao, ExecucaoRotina
 
 # Register your models here.
 admin.site.register(TipoPlano)
@@ -12,3 +12,4 @@ admin.site.register(Exercicio)
 admin.site.register(Refeicao)
 admin.site.register(TrocaExercicio)
 admin.site.register(TrocaRefeicao)
+admin.site.register(ExecucaoRotina)
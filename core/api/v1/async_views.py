@@ -0,0 +1,190 @@
+"""
+Leitura assíncrona (ASGI) das rotas mais acessadas: list e retrieve de
+treinos, dietas, exercícios, refeições e clientes, em /api/v1/async/.
+
+As viewsets do DRF são síncronas: sob ASGI, cada requisição inteira roda em uma
+thread via sync_to_async. Estas visões rodam no próprio event loop, com
+autenticação, permissões, cache e consultas nas variantes assíncronas
+(`aauthenticate`, `aget`, `acount`, `aaggregate`, `aiterator`). O escopo de
+visibilidade, o plano de consulta, o serializer, a paginação, o cache de
+respostas e os validadores condicionais são os da viewset correspondente, de
+modo que o corpo das respostas é o mesmo das rotas síncronas.
+"""
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import InvalidPage
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, NotFound, PermissionDenied
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from core.cache import aget_versions, record
+from .authentication import aget_principal
+from .mixins import CachedResponseMixin, ValuesListMixin
+
+
+class AsyncReadView(View):
+    """
+    List (`detail=False`) ou retrieve (`detail=True`) assíncrono de `viewset_class`.
+
+    A viewset é instanciada apenas como fonte de configuração: get_queryset,
+    get_permissions, get_serializer e o paginator são síncronos mas não acessam
+    o banco, desde que o Principal já esteja resolvido e o plano de consulta
+    carregue tudo o que o serializer lê.
+    """
+    viewset_class = None
+    basename = None
+    detail = False
+    http_method_names = ['get', 'options']
+
+    def get_viewset(self, request, kwargs):
+        viewset = self.viewset_class(
+            action='retrieve' if self.detail else 'list', basename=self.basename, detail=self.detail,
+        )
+        viewset.args = ()
+        viewset.kwargs = kwargs
+        viewset.format_kwarg = None
+        viewset.headers = {}
+        # Sem autenticadores: o usuário é definido por `authenticate`, antes de qualquer acesso a request.user
+        viewset.request = Request(request)
+        return viewset
+
+    async def authenticate(self, viewset):
+        request = viewset.request
+        for authenticator in viewset.get_authenticators():
+            result = await authenticator.aauthenticate(request)
+            if result is not None:
+                request.user, request.auth = result
+                return
+        request.user, request.auth = AnonymousUser(), None
+
+    async def check_permissions(self, viewset, obj=None):
+        request = viewset.request
+        await aget_principal(request)
+        for permission in viewset.get_permissions():
+            if obj is None:
+                allowed = permission.has_permission(request, viewset)
+            else:
+                allowed = permission.has_object_permission(request, viewset, obj)
+            if not allowed:
+                if not request.user.is_authenticated:
+                    raise NotAuthenticated()
+                raise PermissionDenied(detail=getattr(permission, 'message', None),
+                                       code=getattr(permission, 'code', None))
+
+    async def paginate(self, viewset, queryset):
+        paginator = viewset.paginator
+        if paginator is None:
+            return None
+        request = viewset.request
+        paginator.request = request
+        page_size = paginator.get_page_size(request)
+        if not page_size:
+            return None
+        django_paginator = paginator.django_paginator_class(queryset, page_size)
+        # count é uma cached_property: preenchida aqui, o Paginator não consulta o banco
+        django_paginator.count = await queryset.acount()
+        page_number = paginator.get_page_number(request, django_paginator)
+        try:
+            paginator.page = django_paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        return [obj async for obj in paginator.page.object_list.aiterator()]
+
+    async def list(self, viewset):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        values = await queryset.order_by().aaggregate(**viewset.get_list_aggregates())
+        etag, last_modified = viewset.make_list_validators(values)
+        not_modified = get_conditional_response(viewset.request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        values_serializer = viewset.get_values_serializer() if isinstance(viewset, ValuesListMixin) else None
+        if values_serializer is not None:
+            queryset = viewset.get_values_queryset(queryset, values_serializer)
+            serialize = values_serializer.to_representation
+        else:
+            serialize = lambda objects: viewset.get_serializer(objects, many=True).data
+        page = await self.paginate(viewset, queryset)
+        if page is not None:
+            response = viewset.get_paginated_response(serialize(page))
+        else:
+            response = Response(serialize([obj async for obj in queryset.aiterator()]))
+        return viewset._set_validators(response, etag, last_modified)
+
+    async def get_object(self, viewset):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        lookup_url_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+        try:
+            obj = await queryset.aget(**{viewset.lookup_field: viewset.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        except (TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        await self.check_permissions(viewset, obj)
+        return obj
+
+    async def retrieve(self, viewset):
+        instance = await self.get_object(viewset)
+        etag, last_modified = viewset.get_object_validators(instance)
+        not_modified = get_conditional_response(viewset.request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        return viewset._set_validators(Response(viewset.get_serializer(instance).data), etag, last_modified)
+
+    async def cached_response(self, viewset, handler):
+        if not isinstance(viewset, CachedResponseMixin) or viewset.action not in viewset.cache_actions:
+            return await handler(viewset)
+        _, cliente_id = viewset.get_cache_scope()
+        key = viewset.get_cache_key(await aget_versions(viewset.cache_dependencies, cliente_id))
+        entry = await cache.aget(key)
+        if entry is not None:
+            record(hit=True)
+            return viewset.response_from_cache(viewset.request, entry)
+
+        record(hit=False)
+        response = await handler(viewset)
+        if response.status_code == status.HTTP_200_OK:
+            await cache.aset(key, viewset.make_cache_entry(response), settings.FITTRACK_CACHE_TTL)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def handle_exception(self, viewset, exc):
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            exc.auth_header = viewset.get_authenticate_header(viewset.request)
+        response = viewset.get_exception_handler()(exc, viewset.get_exception_handler_context())
+        if response is None:
+            raise exc
+        return response
+
+    def render(self, viewset, response):
+        """
+        Renderiza com o primeiro renderer da viewset (JSON) e devolve um
+        HttpResponse comum: um Response do DRF faria o handler ASGI renderizá-lo
+        em uma thread.
+        """
+        if not isinstance(response, Response):
+            return response
+        renderer = viewset.renderer_classes[0]()
+        response.accepted_renderer = renderer
+        response.accepted_media_type = renderer.media_type
+        response.renderer_context = viewset.get_renderer_context()
+        rendered = HttpResponse(response.rendered_content, status=response.status_code)
+        for name, value in response.items():
+            rendered[name] = value
+        return rendered
+
+    async def get(self, request, **kwargs):
+        viewset = self.get_viewset(request, kwargs)
+        try:
+            await self.authenticate(viewset)
+            await self.check_permissions(viewset)
+            response = await self.cached_response(viewset, self.retrieve if self.detail else self.list)
+        except Exception as exc:
+            response = self.handle_exception(viewset, exc)
+        return self.render(viewset, response)
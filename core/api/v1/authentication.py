@@ -0,0 +1,213 @@
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from core.models import Perfil
+
+ROLE_CLAIM = 'role'
+PERFIL_ID_CLAIM = 'perfil_id'
+CLIENTE_ID_CLAIM = 'cliente_id'
+USERNAME_CLAIM = 'username'
+IS_STAFF_CLAIM = 'is_staff'
+IS_SUPERUSER_CLAIM = 'is_superuser'
+
+# user_id -> (is_active, expira_em); cache local do processo para o modo stateless
+_active_users = {}
+
+
+class Principal:
+    """Identidade resolvida uma única vez por requisição (papel, perfil e cliente do usuário)."""
+    __slots__ = ('user_id', 'role', 'perfil_id', 'cliente_id', 'is_superuser', 'is_staff')
+
+    STAFF_ROLES = (Perfil.ADMIN, Perfil.NUTRICIONISTA, Perfil.PERSONAL)
+
+    def __init__(self, user_id=None, role=None, perfil_id=None, cliente_id=None, is_superuser=False, is_staff=False):
+        self.user_id = user_id
+        self.role = role
+        self.perfil_id = perfil_id
+        self.cliente_id = cliente_id
+        self.is_superuser = is_superuser
+        self.is_staff = is_staff
+
+    def has_role(self, *roles):
+        return self.role in roles
+
+    @property
+    def is_admin(self):
+        return self.is_superuser or self.role == Perfil.ADMIN
+
+    @property
+    def is_cliente(self):
+        # Equivalente ao antigo `perfil.tipo == 'cliente' and hasattr(perfil, 'cliente')`
+        return self.role == Perfil.CLIENTE and self.cliente_id is not None
+
+    @property
+    def is_team(self):
+        return self.is_superuser or self.role in self.STAFF_ROLES
+
+    @classmethod
+    def from_user(cls, user):
+        if user is None or not user.is_authenticated:
+            return cls()
+        perfil = (Perfil.all_objects.filter(usuario_id=user.pk)
+                  .values_list('id', 'tipo', 'cliente__id')
+                  .first())
+        perfil_id, role, cliente_id = perfil or (None, None, None)
+        return cls(user.pk, role, perfil_id, cliente_id, user.is_superuser, user.is_staff)
+
+    @classmethod
+    async def afrom_user(cls, user):
+        if user is None or not user.is_authenticated:
+            return cls()
+        perfil = await (Perfil.all_objects.filter(usuario_id=user.pk)
+                        .values_list('id', 'tipo', 'cliente__id')
+                        .afirst())
+        perfil_id, role, cliente_id = perfil or (None, None, None)
+        return cls(user.pk, role, perfil_id, cliente_id, user.is_superuser, user.is_staff)
+
+    @classmethod
+    def from_token(cls, user, token):
+        return cls(
+            user.pk,
+            token.get(ROLE_CLAIM),
+            token.get(PERFIL_ID_CLAIM),
+            token.get(CLIENTE_ID_CLAIM),
+            user.is_superuser,
+            user.is_staff,
+        )
+
+
+def get_principal(request):
+    """Retorna o Principal da requisição, resolvendo-o (uma query) apenas na primeira chamada."""
+    principal = getattr(request, 'principal', None)
+    if principal is None or principal.user_id != getattr(request.user, 'pk', None):
+        principal = Principal.from_user(request.user)
+        request.principal = principal
+    return principal
+
+
+async def aget_principal(request):
+    principal = getattr(request, 'principal', None)
+    if principal is None or principal.user_id != getattr(request.user, 'pk', None):
+        principal = await Principal.afrom_user(request.user)
+        request.principal = principal
+    return principal
+
+
+def add_principal_claims(token, user):
+    principal = Principal.from_user(user)
+    token[ROLE_CLAIM] = principal.role
+    token[PERFIL_ID_CLAIM] = principal.perfil_id
+    token[CLIENTE_ID_CLAIM] = principal.cliente_id
+    token[USERNAME_CLAIM] = user.get_username()
+    token[IS_STAFF_CLAIM] = user.is_staff
+    token[IS_SUPERUSER_CLAIM] = user.is_superuser
+    return token
+
+
+def is_user_active(user_id):
+    """Consulta `is_active` no máximo uma vez por FITTRACK_TOKEN_USER_TTL segundos por usuário."""
+    now = time.monotonic()
+    cached = _active_users.get(user_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    is_active = User.objects.filter(pk=user_id, is_active=True).exists()
+    _active_users[user_id] = (is_active, now + settings.FITTRACK_TOKEN_USER_TTL)
+    return is_active
+
+
+async def ais_user_active(user_id):
+    now = time.monotonic()
+    cached = _active_users.get(user_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    is_active = await User.objects.filter(pk=user_id, is_active=True).aexists()
+    _active_users[user_id] = (is_active, now + settings.FITTRACK_TOKEN_USER_TTL)
+    return is_active
+
+
+def revoke_token_user(user_id):
+    # Invalida imediatamente neste processo; nos demais, em até FITTRACK_TOKEN_USER_TTL segundos
+    _active_users[user_id] = (False, time.monotonic() + settings.FITTRACK_TOKEN_USER_TTL)
+
+
+def get_request_user(request):
+    """Retorna o User do banco mesmo quando a requisição foi autenticada com um TokenUser."""
+    if isinstance(request.user, TokenUser):
+        return User.objects.get(pk=request.user.pk)
+    return request.user
+
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication que anexa o Principal à requisição.
+
+    Por padrão o Principal é resolvido pelo banco (uma consulta indexada), para
+    que mudanças de papel ou um Cliente criado após o login valham já na
+    próxima requisição. Com FITTRACK_STATELESS_JWT ativo, as claims assinadas
+    do token são usadas como estão e a busca do usuário também é evitada.
+    `aauthenticate` faz o mesmo com o ORM assíncrono, para as visões ASGI.
+    """
+
+    def get_user(self, validated_token):
+        # Modo stateless: monta o usuário a partir das claims assinadas, sem buscar auth_user
+        if settings.FITTRACK_STATELESS_JWT and ROLE_CLAIM in validated_token.payload:
+            user = TokenUser(validated_token)
+            if not is_user_active(user.pk):
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            return user
+        return super().get_user(validated_token)
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+        user, validated_token = result
+        if isinstance(user, TokenUser):
+            request.principal = Principal.from_token(user, validated_token)
+        else:
+            request.principal = Principal.from_user(user)
+        return user, validated_token
+
+    async def aget_user(self, validated_token):
+        if settings.FITTRACK_STATELESS_JWT and ROLE_CLAIM in validated_token.payload:
+            user = TokenUser(validated_token)
+            if not await ais_user_active(user.pk):
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            return user
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        user = await self.aget_user(validated_token)
+        if isinstance(user, TokenUser):
+            request.principal = Principal.from_token(user, validated_token)
+        else:
+            request.principal = await Principal.afrom_user(user)
+        return user, validated_token
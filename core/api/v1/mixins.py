@@ -0,0 +1,553 @@
+import copy
+import csv
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.db import models, transaction
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from core.cache import RESPONSE_PREFIX, get_versions, invalidate_model, record
+from .authentication import get_principal
+from .serializers import SparseFieldsMixin, UnsupportedValuesField, ValuesListSerializer
+from rest_framework import serializers, status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+
+class QueryPlan:
+    """Plano declarativo de carregamento (select_related/prefetch_related/only) de um queryset."""
+
+    def __init__(self, select_related=(), prefetch_related=(), only=()):
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self.only = tuple(only)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+class QueryPlanMixin:
+    """
+    Aplica o plano de consulta da action atual ao queryset do viewset.
+
+    `query_plans` mapeia o nome da action para um QueryPlan; a chave 'default'
+    é usada quando a action não possui plano próprio.
+    """
+    query_plans = {}
+
+    def get_query_plan(self):
+        action = getattr(self, 'action', None)
+        return self.query_plans.get(action) or self.query_plans.get('default')
+
+    def apply_query_plan(self, queryset):
+        plan = self.get_query_plan()
+        if plan is None:
+            return queryset
+        return plan.apply(queryset)
+
+    def get_queryset(self):
+        return self.apply_query_plan(super().get_queryset())
+
+
+# Os campos vêm de ?fields=/?omit=, então as combinações são escolhidas pelo cliente: mantém só as mais recentes
+VALUES_SERIALIZERS_MAX = 256
+_values_serializers = OrderedDict()
+_values_serializers_lock = threading.Lock()
+
+
+def get_values_serializer(serializer):
+    """ValuesListSerializer de `serializer` (por classe e campos), ou None se não houver."""
+    key = (type(serializer), tuple((field.field_name, type(field)) for field in serializer._readable_fields))
+    with _values_serializers_lock:
+        if key in _values_serializers:
+            _values_serializers.move_to_end(key)
+            return _values_serializers[key]
+    try:
+        values_serializer = ValuesListSerializer(serializer)
+    except UnsupportedValuesField:
+        values_serializer = None
+    with _values_serializers_lock:
+        _values_serializers[key] = values_serializer
+        if len(_values_serializers) > VALUES_SERIALIZERS_MAX:
+            _values_serializers.popitem(last=False)
+    return values_serializer
+
+
+class FieldSelectionMixin:
+    """
+    Repassa `?fields=`, `?omit=` e `?expand=` (nomes separados por vírgula) ao
+    serializer nas leituras e reduz a consulta ao que ele exibe: only() com as
+    colunas dos campos selecionados e select_related apenas das relações usadas.
+
+    Continuam carregados a chave primária, as FKs do próprio modelo (usadas nas
+    permissões de objeto) e os `updated_at` dos validadores condicionais.
+    """
+    field_selection_actions = ('list', 'retrieve')
+    field_selection_params = ('fields', 'omit', 'expand')
+
+    def get_field_selection(self):
+        request = getattr(self, 'request', None)
+        if (request is None or request.method not in SAFE_METHODS
+                or getattr(self, 'action', None) not in self.field_selection_actions):
+            return {}
+        selection = {}
+        for param in self.field_selection_params:
+            value = request.query_params.get(param)
+            if value:
+                selection[param] = [name.strip() for name in value.split(',') if name.strip()]
+        return selection
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            kwargs = {**self.get_field_selection(), **kwargs}
+        return super().get_serializer(*args, **kwargs)
+
+    def get_selected_columns(self, model):
+        values_serializer = get_values_serializer(self.get_serializer())
+        if values_serializer is None:
+            return None
+        columns = {model._meta.pk.name, *values_serializer.columns}
+        columns.update(field.name for field in model._meta.concrete_fields if field.is_relation)
+        if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+            columns.add('updated_at')
+        if hasattr(self, 'get_conditional_related_fields'):
+            columns.update(self.get_conditional_related_fields())
+        return columns
+
+    def apply_query_plan(self, queryset):
+        queryset = super().apply_query_plan(queryset)
+        if not self.get_field_selection():
+            return queryset
+        columns = self.get_selected_columns(queryset.model)
+        if columns is None:
+            return queryset
+        related = {column.rsplit('__', 1)[0] for column in columns if '__' in column}
+        return queryset.select_related(None).select_related(*related).only(*columns)
+
+
+class ValuesListMixin:
+    """
+    Listagem a partir de `.values()` com ValuesListSerializer: mesma saída do
+    serializer da viewset, sem instanciar modelos nem serializers por linha.
+
+    O plano é montado uma vez por serializer (e conjunto de campos). Se algum
+    campo não puder ser lido de `.values()`, a listagem usa o serializer normal.
+    """
+    values_list_actions = ('list',)
+
+    def get_values_serializer(self):
+        if getattr(self, 'action', None) not in self.values_list_actions:
+            return None
+        return get_values_serializer(self.get_serializer())
+
+    def get_values_extra_columns(self):
+        # A paginação por cursor lê a posição de cada linha nos campos de `ordering`
+        cursor_class = getattr(self.paginator, 'cursor_pagination_class', None)
+        if cursor_class is None:
+            return ()
+        return tuple(field.lstrip('-') for field in cursor_class.ordering)
+
+    def get_values_queryset(self, queryset, values_serializer):
+        return values_serializer.values(queryset, *self.get_values_extra_columns())
+
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.get_values_queryset(self.filter_queryset(self.get_queryset()), values_serializer)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(values_serializer.to_representation(page))
+        return Response(values_serializer.to_representation(queryset))
+
+
+class _PreloadedRelated:
+    """
+    Substitui o queryset de um PrimaryKeyRelatedField por registros já carregados
+    com in_bulk: o campo só chama `get(pk=...)`, então cada item não faz consulta.
+    """
+
+    def __init__(self, model, objects):
+        self.model = model
+        self.objects = objects
+
+    def get(self, pk):
+        try:
+            key = self.model._meta.pk.to_python(pk)
+        except DjangoValidationError:
+            raise ValueError(pk)
+        try:
+            return self.objects[key]
+        except (KeyError, TypeError):
+            raise self.model.DoesNotExist
+
+
+class BulkUpsertMixin:
+    """
+    Cria e atualiza vários registros em uma única requisição e transação.
+
+    Itens com `id` atualizam o registro existente (parcialmente); itens sem `id`
+    são criados. A validação é feita item a item e, se qualquer item for
+    inválido, nada é gravado e a resposta traz a lista de erros na mesma ordem
+    do payload.
+    """
+    bulk_update_fields = ()
+
+    def bulk_upsert_saved(self, created, updated, originals):
+        """
+        Chamado na transação depois do bulk_create/bulk_update (que não disparam
+        signals); `originals` são cópias de `updated` antes das alterações.
+        """
+
+    def preload_bulk_related(self, items):
+        """
+        Carrega de uma vez (in_bulk) os registros referenciados pelas chaves
+        estrangeiras dos itens, respeitando o queryset de cada campo.
+        """
+        related = {}
+        for name, field in self.get_serializer().fields.items():
+            if field.read_only or not isinstance(field, serializers.PrimaryKeyRelatedField):
+                continue
+            queryset = field.get_queryset()
+            pk_field = queryset.model._meta.pk
+            keys = set()
+            for item in items:
+                if isinstance(item, dict) and item.get(name) is not None:
+                    try:
+                        keys.add(pk_field.to_python(item[name]))
+                    except (DjangoValidationError, TypeError):
+                        continue
+            related[name] = _PreloadedRelated(queryset.model, queryset.in_bulk(keys) if keys else {})
+        return related
+
+    def bulk_upsert(self, request):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Esperada uma lista de objetos.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Converte os ids pelo campo da chave primária ("5" -> 5); ids inválidos ou repetidos são erros do item
+        pk_field = self.get_queryset().model._meta.pk
+        keys, seen = [], set()
+        for item in request.data:
+            key = None
+            if isinstance(item, dict) and item.get('id'):
+                try:
+                    key = pk_field.to_python(item['id'])
+                except DjangoValidationError:
+                    key = {'id': ['Identificador inválido.']}
+                else:
+                    if key in seen:
+                        key = {'id': ['Registro repetido na lista.']}
+                    else:
+                        seen.add(key)
+            keys.append(key)
+        instances = self.get_queryset().in_bulk(seen)
+        related = self.preload_bulk_related(request.data)
+
+        errors, objects, to_create, to_update, originals = [], [], [], [], []
+        for item, key in zip(request.data, keys):
+            if not isinstance(item, dict):
+                errors.append({'non_field_errors': ['Esperado um objeto.']})
+                continue
+            if isinstance(key, dict):
+                errors.append(key)
+                continue
+            instance = None
+            if key is not None:
+                instance = instances.get(key)
+                if instance is None:
+                    errors.append({'id': ['Registro não encontrado.']})
+                    continue
+            serializer = self.get_serializer(instance, data=item, partial=instance is not None)
+            for name, preloaded in related.items():
+                serializer.fields[name].queryset = preloaded
+            if not serializer.is_valid():
+                errors.append(serializer.errors)
+                continue
+            errors.append({})
+            if instance is None:
+                instance = self.get_queryset().model(**serializer.validated_data)
+                to_create.append(instance)
+            else:
+                originals.append(copy.copy(instance))
+                for field, value in serializer.validated_data.items():
+                    setattr(instance, field, value)
+                to_update.append(instance)
+            objects.append(instance)
+
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            model = self.get_queryset().model
+            model.objects.bulk_create(to_create)
+            if to_update:
+                # bulk_update não aplica auto_now
+                now = timezone.now()
+                for instance in to_update:
+                    instance.updated_at = now
+                model.objects.bulk_update(to_update, [*self.bulk_update_fields, 'updated_at'])
+            # bulk_create/bulk_update não disparam signals
+            invalidate_model(model)
+            self.bulk_upsert_saved(to_create, to_update, originals)
+
+        serializer = self.get_serializer(objects, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if to_create else status.HTTP_200_OK)
+
+
+class _Echo:
+    """Buffer mínimo: o csv.writer devolve cada linha formatada em vez de acumulá-la."""
+
+    def write(self, value):
+        return value
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class StreamingExportMixin:
+    """
+    Exportação do queryset da visão (mesmo escopo de get_queryset) em NDJSON ou
+    CSV por StreamingHttpResponse, escolhida por `?formato=ndjson|csv`.
+
+    As linhas vêm de `values_list(*export_fields).iterator(chunk_size)` dentro de
+    uma transação: no PostgreSQL o cursor no servidor é lido aos poucos a partir
+    de um único snapshot, então a memória fica constante seja qual for o número
+    de registros.
+    """
+    export_fields = ()
+    export_chunk_size = 2000
+    export_content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv; charset=utf-8',
+    }
+
+    def get_export_names(self):
+        return [field.replace('__', '_') for field in self.export_fields]
+
+    def get_export_queryset(self):
+        return self.filter_queryset(self.get_queryset()).order_by('pk').values_list(*self.export_fields)
+
+    def get_export_converters(self, model):
+        """
+        (posição, conversor) das colunas de data/hora e decimal, com a mesma
+        representação dos serializers da API. O fuso é resolvido uma única vez.
+        """
+        by_type = [
+            (models.DateTimeField, serializers.DateTimeField(default_timezone=timezone.get_current_timezone())),
+            (models.DateField, serializers.DateField()),
+            (models.TimeField, serializers.TimeField()),
+            (models.DecimalField, None),
+        ]
+        converters = []
+        for position, path in enumerate(self.export_fields):
+            opts = model._meta
+            for part in path.split('__'):
+                field = opts.get_field(part)
+                if field.is_relation:
+                    opts = field.related_model._meta
+            for kind, serializer_field in by_type:
+                if isinstance(field, kind):
+                    converters.append((position, serializer_field.to_representation if serializer_field else str))
+                    break
+        return converters
+
+    def iter_export_rows(self, queryset):
+        converters = self.get_export_converters(queryset.model)
+        with transaction.atomic():
+            for row in queryset.iterator(chunk_size=self.export_chunk_size):
+                row = list(row)
+                for position, convert in converters:
+                    if row[position] is not None:
+                        row[position] = convert(row[position])
+                yield row
+
+    def _encode_ndjson(self, rows):
+        names = self.get_export_names()
+        encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+        for batch in _batched(rows, self.export_chunk_size):
+            yield ''.join(encoder.encode(dict(zip(names, row))) + '\n' for row in batch)
+
+    def _encode_csv(self, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.get_export_names())
+        for batch in _batched(rows, self.export_chunk_size):
+            yield ''.join(writer.writerow(row) for row in batch)
+
+    def stream_export(self, request):
+        formato = request.query_params.get('formato', 'ndjson')
+        if formato not in self.export_content_types:
+            return Response({'formato': [f'Use um de: {", ".join(self.export_content_types)}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        encode = self._encode_csv if formato == 'csv' else self._encode_ndjson
+        rows = self.iter_export_rows(self.get_export_queryset())
+        response = StreamingHttpResponse(encode(rows), content_type=self.export_content_types[formato])
+        response['Content-Disposition'] = f'attachment; filename="{self.basename}.{formato}"'
+        return response
+
+
+class ConditionalRequestMixin:
+    """
+    Suporte a If-None-Match em list e retrieve (e If-Modified-Since no retrieve) a partir de `updated_at`.
+
+    Na listagem o ETag vem de um único aggregate (max(updated_at) + count) sobre
+    o queryset filtrado, sem Last-Modified; no detalhe, ETag e Last-Modified vêm
+    do próprio objeto. Em ambos os casos a resposta 304 é devolvida sem
+    serializar nada. `conditional_related_fields` lista os `updated_at` de
+    relações exibidas pelo serializer (ex.: cliente_nome); as relações pedidas
+    em `?expand=` entram automaticamente.
+    """
+    conditional_related_fields = ()
+
+    def get_conditional_related_fields(self):
+        """`conditional_related_fields` mais o `updated_at` das relações embutidas com `?expand=`."""
+        fields = list(self.conditional_related_fields)
+        selection = self.get_field_selection() if hasattr(self, 'get_field_selection') else {}
+        expandable = getattr(self.get_serializer_class(), 'expandable_fields', {})
+        for name in selection.get('expand', ()):
+            field = f'{name}__updated_at'
+            if name in expandable and field not in fields:
+                fields.append(field)
+        return fields
+
+    def _make_validators(self, parts, last_modified):
+        key = '|'.join(str(part) for part in (self.request.get_full_path(), self.request.user.pk, *parts))
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        return etag, int(last_modified.timestamp()) if last_modified else None
+
+    def get_list_aggregates(self):
+        aggregates = {'count': Count('pk'), 'updated_at': Max('updated_at')}
+        for i, field in enumerate(self.get_conditional_related_fields()):
+            aggregates[f'related_{i}'] = Max(field)
+        return aggregates
+
+    def make_list_validators(self, values):
+        # Só ETag: max(updated_at) ignora as linhas removidas logicamente, então um
+        # Last-Modified não mudaria após uma remoção; a contagem no ETag muda
+        etag, _ = self._make_validators(values.values(), None)
+        return etag, None
+
+    def get_list_validators(self, queryset):
+        return self.make_list_validators(queryset.order_by().aggregate(**self.get_list_aggregates()))
+
+    def get_object_validators(self, instance):
+        timestamps = [instance.updated_at]
+        for field in self.get_conditional_related_fields():
+            value = instance
+            for attr in field.split('__'):
+                value = getattr(value, attr, None) if value is not None else None
+            timestamps.append(value)
+        return self._make_validators([instance.pk, *timestamps], max(filter(None, timestamps), default=None))
+
+    def _set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.get_list_validators(self.filter_queryset(self.get_queryset()))
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        return self._set_validators(super().list(request, *args, **kwargs), etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = self.get_object_validators(instance)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        serializer = self.get_serializer(instance)
+        return self._set_validators(Response(serializer.data), etag, last_modified)
+
+
+class CachedResponseMixin:
+    """
+    Cache das respostas de list/retrieve.
+
+    A chave combina o escopo de visibilidade do usuário (papel, superusuário,
+    staff e cliente), as versões dos modelos em `cache_dependencies` e a URL
+    completa. Só deve ser usado em viewsets cujo resultado dependa apenas desse
+    escopo. Com `cache_per_scope = False` a resposta é compartilhada por todos.
+    """
+    cache_actions = ('list', 'retrieve')
+    cache_dependencies = ()
+    cache_per_scope = True
+
+    def get_cache_scope(self):
+        if not self.cache_per_scope:
+            return 'all', None
+        principal = get_principal(self.request)
+        cliente_id = principal.cliente_id if principal.is_cliente else None
+        return f'{principal.role}:{int(principal.is_superuser)}:{int(principal.is_staff)}:{cliente_id}', cliente_id
+
+    def get_cache_key(self, versions=None):
+        # `versions` permite que as visões assíncronas leiam as versões com aget_versions
+        scope, cliente_id = self.get_cache_scope()
+        if versions is None:
+            versions = get_versions(self.cache_dependencies, cliente_id)
+        versions = '.'.join(str(v) for v in versions)
+        path = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        return f'{RESPONSE_PREFIX}:{self.basename}:{self.action}:{scope}:{versions}:{path}'
+
+    def response_from_cache(self, request, entry):
+        not_modified = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+        if not_modified is not None:
+            return not_modified
+        response = Response(entry['data'], headers=entry['headers'])
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def make_cache_entry(self, response):
+        headers = {name: response[name] for name in ('ETag', 'Last-Modified') if response.has_header(name)}
+        return {
+            'data': response.data,
+            'headers': headers,
+            'etag': headers.get('ETag'),
+            'last_modified': parse_http_date_safe(headers.get('Last-Modified', '')),
+        }
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_cache_key()
+        entry = cache.get(key)
+        if entry is not None:
+            record(hit=True)
+            return self.response_from_cache(request, entry)
+
+        record(hit=False)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, self.make_cache_entry(response), settings.FITTRACK_CACHE_TTL)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.cache_actions:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.cache_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
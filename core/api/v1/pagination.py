@@ -0,0 +1,44 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """Paginação por cursor em (created_at, id): custo constante por página, sem COUNT(*) nem OFFSET."""
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class SelectablePagination(PageNumberPagination):
+    """
+    Paginação por número de página por padrão; por cursor quando a requisição
+    envia `?pagination=cursor` (ou um `cursor` devolvido em `next`/`previous`).
+    """
+    cursor_pagination_class = CreatedAtCursorPagination
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return request.query_params.get('pagination') == 'cursor' or self.cursor_pagination_class.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            page = self.cursor_paginator.paginate_queryset(queryset, request, view)
+            self.display_page_controls = getattr(self.cursor_paginator, 'display_page_controls', False)
+            return page
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_html_context()
+        return super().get_html_context()
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
@@ -0,0 +1,35 @@
+"""
+JSONParser com o orjson, com o mesmo resultado do JSONParser do DRF.
+
+Corpos que o orjson rejeita ou leria de outro jeito (inteiros com 19 dígitos
+ou mais, que ele converte em float; 1e400; surrogates isolados; NaN) passam
+pelo JSONParser padrão, que também gera as mensagens de erro. Sem o orjson
+instalado, o parser padrão é usado sempre.
+"""
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_DIGITOS = bytes.maketrans(b'123456789', b'000000000')
+
+
+class FastJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        data = stream.read()
+        if data.translate(_DIGITOS).find(b'0' * 19) == -1:
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(data), media_type, parser_context)
@@ -1,4 +1,6 @@
 from rest_framework import permissions
+from django.contrib.auth.models import User
+from .authentication import get_principal
 
 class IsAdminUser(permissions.BasePermission):
     
@@ -6,37 +8,40 @@ class IsAdminUser(permissions.BasePermission):
 
         if request.user.is_superuser:
             return True
-        return request.user and request.user.is_authenticated and hasattr(request.user, 'perfil') and request.user.perfil.tipo == 'admin'
+        return request.user and request.user.is_authenticated and get_principal(request).role == 'admin'
 
 class IsNutricionistaUser(permissions.BasePermission):
   
     def has_permission(self, request, view):
-        return request.user and request.user.is_authenticated and hasattr(request.user, 'perfil') and request.user.perfil.tipo == 'nutricionista'
+        return request.user and request.user.is_authenticated and get_principal(request).role == 'nutricionista'
 
 class IsPersonalUser(permissions.BasePermission):
    
     def has_permission(self, request, view):
-        return request.user and request.user.is_authenticated and hasattr(request.user, 'perfil') and request.user.perfil.tipo == 'personal'
+        return request.user and request.user.is_authenticated and get_principal(request).role == 'personal'
 
 class IsClienteUser(permissions.BasePermission):
    
     def has_permission(self, request, view):
-        return request.user and request.user.is_authenticated and hasattr(request.user, 'perfil') and request.user.perfil.tipo == 'cliente'
+        return request.user and request.user.is_authenticated and get_principal(request).role == 'cliente'
 
 class IsOwnerOrStaff(permissions.BasePermission):
     
     def has_object_permission(self, request, view, obj):
         
-        if request.user.is_superuser or (hasattr(request.user, 'perfil') and request.user.perfil.tipo in ['admin', 'nutricionista', 'personal']):
+        principal = get_principal(request)
+        if principal.is_team:
             return True
-            
-        
-        if hasattr(obj, 'cliente') and hasattr(obj.cliente, 'perfil'):
-            return obj.cliente.perfil.usuario == request.user
-        elif hasattr(obj, 'usuario'):
-            return obj.usuario == request.user
-        elif hasattr(obj, 'perfil') and hasattr(obj.perfil, 'usuario'):
-            return obj.perfil.usuario == request.user
+
+        # Compara apenas IDs já carregados na instância, sem percorrer cliente -> perfil -> usuario
+        if isinstance(obj, User):
+            return obj.pk == principal.user_id
+        if hasattr(obj, 'cliente_id'):
+            return obj.cliente_id is not None and obj.cliente_id == principal.cliente_id
+        if hasattr(obj, 'usuario_id'):
+            return obj.usuario_id == principal.user_id
+        if hasattr(obj, 'perfil_id'):
+            return obj.perfil_id is not None and obj.perfil_id == principal.perfil_id
         return False
 
 class ReadOnly(permissions.BasePermission):
@@ -0,0 +1,66 @@
+"""
+JSONRenderer com o orjson, com saída byte a byte igual à do JSONRenderer do DRF.
+
+Datas, horas, Decimal e demais tipos que o JSON não tem passam pelo mesmo
+encoder do DRF (via `default`). Os casos em que o orjson escreveria outra
+coisa (floats que o json padrão põe em notação exponencial, inteiros acima de
+64 bits, chaves que não são string, indentação) são renderizados pelo
+JSONRenderer padrão, que também é usado quando o orjson não está instalado.
+Única diferença: NaN e Infinity saem como null em vez de gerar erro.
+"""
+from rest_framework.renderers import JSONRenderer
+
+from core.metricas import medir_serializacao
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_DIGITOS = bytes.maketrans(b'123456789', b'000000000')
+_FORA_DE_NUMERO = bytes(set(range(256)) - set(b'0123456789e.-":,[]{}'))
+
+
+def _float_divergente(ret):
+    """
+    Indica floats com abs < 1e-4 ou >= 1e16, que o json padrão escreve com
+    expoente (1e-05, 1e+16) e o orjson não (0.00001, 1e16). A busca é feita com
+    os dígitos trocados por 0 e sem os bytes que não fazem parte de números nem
+    separam valores: o texto fica bem menor e nenhum número é quebrado (no
+    máximo há falsos positivos, que só levam ao JSONRenderer padrão).
+    """
+    numeros = ret.translate(_DIGITOS, _FORA_DE_NUMERO)
+    if numeros.find(b'0.0000') != -1:
+        return True
+    posicao = numeros.find(b'0e')
+    while posicao != -1:
+        if numeros[posicao + 2:posicao + 3] in (b'0', b'-'):
+            return True
+        posicao = numeros.find(b'0e', posicao + 2)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    if orjson is not None:
+        orjson_options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def use_orjson(self, data, accepted_media_type, renderer_context):
+        return (orjson is not None and data is not None and self.compact and not self.ensure_ascii
+                and self.get_indent(accepted_media_type, renderer_context or {}) is None)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return medir_serializacao(self.encode, data, accepted_media_type, renderer_context)
+
+    def encode(self, data, accepted_media_type, renderer_context):
+        if not self.use_orjson(data, accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.orjson_options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if _float_divergente(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2' in ret:
+            # Como o JSONRenderer, escapa U+2028/U+2029 (válidos em JSON, mas não em JavaScript)
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -1,9 +1,11 @@
+from django.urls import re_path
 from rest_framework.routers import DefaultRouter
+from .async_views import AsyncReadView
 from .viewsets import (
     TreinoViewSet, DietaViewSet, TipoPlanoViewSet, ClienteViewSet, 
     HistoricoTreinoViewSet, HistoricoDietaViewSet, ExercicioViewSet, 
     RefeicaoViewSet, TrocaExercicioViewSet, TrocaRefeicaoViewSet,
-    UserViewSet, PerfilViewSet
+    UserViewSet, PerfilViewSet, SyncViewSet, MetricasViewSet
 )
 
 router = DefaultRouter()
@@ -21,3 +23,26 @@ router.register(r'trocas-exercicios', TrocaExercicioViewSet)
 router.register(r'trocas-refeicoes', TrocaRefeicaoViewSet)
 router.register(r'usuarios', UserViewSet)
 router.register(r'perfis', PerfilViewSet)
+router.register(r'sync', SyncViewSet, basename='sync')
+router.register(r'metricas', MetricasViewSet, basename='metricas')
+
+# Leitura assíncrona (ASGI) das rotas mais acessadas, em /api/v1/async/; as rotas acima continuam iguais
+async_routes = [
+    ('treinos', TreinoViewSet),
+    ('dietas', DietaViewSet),
+    ('exercicios', ExercicioViewSet),
+    ('refeicoes', RefeicaoViewSet),
+    ('clientes', ClienteViewSet),
+]
+
+async_urlpatterns = []
+for prefix, viewset in async_routes:
+    basename = router.get_default_basename(viewset)
+    lookup_value = getattr(viewset, 'lookup_value_regex', '[^/.]+')
+    async_urlpatterns += [
+        re_path(rf'^{prefix}/$', AsyncReadView.as_view(viewset_class=viewset, basename=basename),
+                name=f'async-{basename}-list'),
+        re_path(rf'^{prefix}/(?P<{viewset.lookup_field}>{lookup_value})/$',
+                AsyncReadView.as_view(viewset_class=viewset, basename=basename, detail=True),
+                name=f'async-{basename}-detail'),
+    ]
@@ -1,15 +1,92 @@
+import copy
+import re
+from datetime import timedelta
+from django.db import models, transaction
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from django.contrib.auth.hashers import identify_hasher
 from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.encoding import force_str
+from django.utils.hashable import make_hashable
+from rest_framework.fields import empty
+from rest_framework.validators import UniqueValidator
 from core.models import (Treino, Dieta, TipoPlano, Cliente, HistoricoTreino, 
                         HistoricoDieta, Exercicio, Refeicao, TrocaExercicio, TrocaRefeicao, Perfil)
+from core.metricas import medir_serializacao
+from core.rules import get_plan_rules
+from core.totais import ajustar_totais, contribuicao
+from .authentication import add_principal_claims
 
-class UserSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Seleção de campos por requisição: `fields` mantém só os campos listados,
+    `omit` remove campos e `expand` troca o id de uma relação pelo objeto, com
+    o serializer indicado em `expandable_fields`. As viewsets repassam os
+    parâmetros da query string (ver FieldSelectionMixin).
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, omit=None, expand=None, **kwargs):
+        self.selected_fields = fields
+        self.omitted_fields = omit
+        self.expanded_fields = expand
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        errors = {}
+        for param, names, known in (('fields', self.selected_fields, fields), ('omit', self.omitted_fields, fields),
+                                    ('expand', self.expanded_fields, self.expandable_fields)):
+            unknown = [name for name in names or () if name not in known]
+            if unknown:
+                errors[param] = [f'Campos desconhecidos: {", ".join(unknown)}.']
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        for name in self.expanded_fields or ():
+            if name in fields:
+                source = fields[name].source
+                kwargs = {'source': source} if source not in (None, name) else {}
+                fields[name] = self.expandable_fields[name](read_only=True, **kwargs)
+        if self.selected_fields is not None:
+            fields = {name: field for name, field in fields.items() if name in self.selected_fields}
+        for name in self.omitted_fields or ():
+            fields.pop(name, None)
+        return fields
+
+    def to_representation(self, instance):
+        return medir_serializacao(super().to_representation, instance)
+
+class AllObjectsUniqueMixin:
+    """
+    Valida campos únicos contra `all_objects`: o manager padrão esconde os
+    registros removidos logicamente, mas a constraint do banco continua
+    valendo para eles.
+    """
+
+    def build_field(self, field_name, info, model_class, nested_depth):
+        field_class, field_kwargs = super().build_field(field_name, info, model_class, nested_depth)
+        manager = getattr(model_class, 'all_objects', None)
+        if manager is not None and field_kwargs.get('validators'):
+            field_kwargs['validators'] = [
+                UniqueValidator(manager.all(), message=validator.message, lookup=validator.lookup)
+                if isinstance(validator, UniqueValidator) else validator
+                for validator in field_kwargs['validators']
+            ]
+        return field_class, field_kwargs
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'is_staff']
         read_only_fields = ['is_staff']
 
-class PerfilSerializer(serializers.ModelSerializer):
+class PerfilSerializer(AllObjectsUniqueMixin, SparseFieldsMixin, serializers.ModelSerializer):
     usuario = UserSerializer(read_only=True)
     tipo_display = serializers.CharField(source='get_tipo_display', read_only=True)
     
@@ -17,62 +94,429 @@ class PerfilSerializer(serializers.ModelSerializer):
         model = Perfil
         fields = ['id', 'usuario', 'tipo', 'tipo_display', 'telefone', 'data_nascimento']
 
-class TreinoSerializer(serializers.ModelSerializer):
+class ExercicioItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Exercicio
+        fields = ['nome', 'descricao']
+
+class RefeicaoItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Refeicao
+        fields = ['nome', 'descricao', 'calorias']
+
+class ClienteResumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Cliente
+        fields = ['id', 'nome', 'email']
+
+class NestedChildrenMixin:
+    """
+    Cria o registro pai e seus filhos (inseridos com bulk_create) em uma única transação.
+
+    Os filhos só podem ser enviados na criação; depois disso são gerenciados
+    pelos endpoints próprios (ex.: /exercicios/bulk/).
+    """
+    children_field = None
+    children_model = None
+    parent_field = None
+
+    def validate(self, attrs):
+        if self.instance is not None and self.children_field in attrs:
+            raise serializers.ValidationError({
+                self.children_field: f'Só pode ser enviado na criação; use /{self.children_field}/bulk/ para alterar.'
+            })
+        return super().validate(attrs)
+
+    def create(self, validated_data):
+        children = validated_data.pop(self.children_field, [])
+        with transaction.atomic(savepoint=False):
+            instance = super().create(validated_data)
+            created = self.children_model.objects.bulk_create(
+                [self.children_model(**{self.parent_field: instance}, **child) for child in children]
+            )
+            self.children_created(instance, created)
+        return instance
+
+    def children_created(self, instance, children):
+        # bulk_create não dispara signals; chamado na mesma transação
+        pass
+
+class TreinoSerializer(SparseFieldsMixin, NestedChildrenMixin, serializers.ModelSerializer):
     cliente_nome = serializers.CharField(source='cliente.nome', read_only=True)
+    exercicios = ExercicioItemSerializer(many=True, required=False, write_only=True)
+    expandable_fields = {'cliente': ClienteResumoSerializer}
+
+    children_field = 'exercicios'
+    children_model = Exercicio
+    parent_field = 'treino'
     
     class Meta:
         model = Treino
-        fields = ['id', 'nome', 'descricao', 'duracao', 'cliente', 'cliente_nome', 'created_at', 'updated_at']
+        fields = ['id', 'nome', 'descricao', 'duracao', 'cliente', 'cliente_nome', 'exercicios', 'created_at', 'updated_at']
 
-class DietaSerializer(serializers.ModelSerializer):
+class DietaSerializer(SparseFieldsMixin, NestedChildrenMixin, serializers.ModelSerializer):
     cliente_nome = serializers.CharField(source='cliente.nome', read_only=True)
+    refeicoes = RefeicaoItemSerializer(many=True, required=False, write_only=True)
+    expandable_fields = {'cliente': ClienteResumoSerializer}
+
+    children_field = 'refeicoes'
+    children_model = Refeicao
+    parent_field = 'dieta'
     
     class Meta:
         model = Dieta
-        fields = ['id', 'nome', 'descricao', 'calorias', 'cliente', 'cliente_nome', 'created_at', 'updated_at']
+        fields = ['id', 'nome', 'descricao', 'calorias', 'total_calorias', 'quantidade_refeicoes', 'cliente',
+                  'cliente_nome', 'refeicoes', 'created_at', 'updated_at']
+        read_only_fields = ['total_calorias', 'quantidade_refeicoes']
+
+    def children_created(self, instance, children):
+        ajustar_totais(atuais=[contribuicao(refeicao) for refeicao in children])
+        instance.refresh_from_db(fields=['total_calorias', 'quantidade_refeicoes', 'updated_at'])
 
-class TipoPlanoSerializer(serializers.ModelSerializer):
+class TipoPlanoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TipoPlano
         fields = '__all__'
 
-class ClienteSerializer(serializers.ModelSerializer):
+class ClienteSerializer(AllObjectsUniqueMixin, SparseFieldsMixin, serializers.ModelSerializer):
     tipo_plano_nome = serializers.CharField(source='tipo_plano.nome', read_only=True)
     perfil = PerfilSerializer(read_only=True)
+    expandable_fields = {'tipo_plano': TipoPlanoSerializer}
     
     class Meta:
         model = Cliente
         fields = ['id', 'nome', 'email', 'telefone', 'data_nascimento', 'altura', 'peso', 
                  'tipo_plano', 'tipo_plano_nome', 'data_inicio_plano', 'data_fim_plano',
                  'data_ultimo_treino', 'data_ultima_dieta',
-                 'trocas_exercicios_restantes', 'trocas_refeicoes_restantes', 'perfil']
+                 'trocas_exercicios_restantes', 'trocas_refeicoes_restantes',
+                 'treino_atualizacao_pendente', 'dieta_atualizacao_pendente',
+                 'status_plano', 'renovacao_automatica', 'perfil']
+        read_only_fields = ['treino_atualizacao_pendente', 'dieta_atualizacao_pendente', 'status_plano']
+
+class ExercicioResumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Exercicio
+        fields = ['id', 'nome', 'descricao']
+
+class RefeicaoResumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Refeicao
+        fields = ['id', 'nome', 'descricao', 'calorias']
+
+class TreinoResumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Treino
+        fields = ['id', 'nome', 'duracao']
+
+class DietaResumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Dieta
+        fields = ['id', 'nome', 'calorias']
+
+class TreinoAtualSerializer(serializers.ModelSerializer):
+    exercicios = ExercicioResumoSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Treino
+        fields = ['id', 'nome', 'descricao', 'duracao', 'created_at', 'exercicios']
+
+class DietaAtualSerializer(serializers.ModelSerializer):
+    refeicoes = RefeicaoResumoSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Dieta
+        fields = ['id', 'nome', 'descricao', 'calorias', 'total_calorias', 'created_at', 'refeicoes']
+
+class ClienteDashboardSerializer(serializers.ModelSerializer):
+    tipo_plano_nome = serializers.CharField(source='tipo_plano.nome', read_only=True)
+    trocas_ilimitadas = serializers.BooleanField(source='tipo_plano.trocas_ilimitadas', read_only=True, default=False)
+    prazo_trocas_exercicios = serializers.SerializerMethodField()
+    prazo_trocas_refeicoes = serializers.SerializerMethodField()
+    treino_atual = TreinoAtualSerializer(read_only=True, allow_null=True)
+    dieta_atual = DietaAtualSerializer(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Cliente
+        fields = ['id', 'nome', 'tipo_plano', 'tipo_plano_nome', 'data_inicio_plano', 'data_fim_plano',
+                  'data_ultimo_treino', 'data_ultima_dieta',
+                  'trocas_exercicios_restantes', 'trocas_refeicoes_restantes', 'trocas_ilimitadas',
+                  'treino_atualizacao_pendente', 'dieta_atualizacao_pendente',
+                  'prazo_trocas_exercicios', 'prazo_trocas_refeicoes', 'treino_atual', 'dieta_atual']
+
+    def _prazo_trocas(self, obj, data_inicio):
+        if obj.tipo_plano is None or data_inicio is None:
+            return None
+        return data_inicio + timedelta(days=obj.tipo_plano.periodo_trocas_dias)
+
+    def get_prazo_trocas_exercicios(self, obj):
+        return self._prazo_trocas(obj, obj.data_ultimo_treino)
+
+    def get_prazo_trocas_refeicoes(self, obj):
+        return self._prazo_trocas(obj, obj.data_ultima_dieta)
+
+class HistoricoTreinoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'cliente': ClienteResumoSerializer, 'treino': TreinoResumoSerializer}
 
-class HistoricoTreinoSerializer(serializers.ModelSerializer):
     class Meta:
         model = HistoricoTreino
         fields = '__all__'
 
-class HistoricoDietaSerializer(serializers.ModelSerializer):
+class HistoricoDietaSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'cliente': ClienteResumoSerializer, 'dieta': DietaResumoSerializer}
+
     class Meta:
         model = HistoricoDieta
         fields = '__all__'
 
-class ExercicioSerializer(serializers.ModelSerializer):
+class ExercicioSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'treino': TreinoResumoSerializer}
+
     class Meta:
         model = Exercicio
         fields = '__all__'
 
-class RefeicaoSerializer(serializers.ModelSerializer):
+class RefeicaoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'dieta': DietaResumoSerializer}
+
     class Meta:
         model = Refeicao
         fields = '__all__'
 
-class TrocaExercicioSerializer(serializers.ModelSerializer):
+class TrocaExercicioSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'cliente': ClienteResumoSerializer,
+        'exercicio_antigo': ExercicioResumoSerializer,
+        'exercicio_novo': ExercicioResumoSerializer,
+    }
+
     class Meta:
         model = TrocaExercicio
         fields = '__all__'
 
-class TrocaRefeicaoSerializer(serializers.ModelSerializer):
+class TrocaRefeicaoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'cliente': ClienteResumoSerializer,
+        'refeicao_antiga': RefeicaoResumoSerializer,
+        'refeicao_nova': RefeicaoResumoSerializer,
+    }
+
     class Meta:
         model = TrocaRefeicao
         fields = '__all__'
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # Papel, perfil e cliente vão no token para evitar a consulta ao Perfil a cada requisição
+        return add_principal_claims(super().get_token(user), user)
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    def validate(self, attrs):
+        # O refresh copiaria as claims gravadas no login; o novo access token recebe papel, perfil e cliente atuais
+        refresh = self.token_class(attrs['refresh'])
+        data = super().validate(attrs)
+        user = User.objects.filter(pk=refresh.payload.get(jwt_settings.USER_ID_CLAIM)).first()
+        if user is not None:
+            data['access'] = str(add_principal_claims(refresh.access_token, user))
+        return data
+
+
+class ClienteImportSerializer(serializers.Serializer):
+    """Uma linha da importação em lote: dados do User, do Perfil e do Cliente."""
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(max_length=254)
+    password = serializers.CharField(required=False, trim_whitespace=False)
+    password_hash = serializers.CharField(required=False, max_length=128)
+    first_name = serializers.CharField(max_length=150, required=False)
+    last_name = serializers.CharField(max_length=150, required=False)
+    nome = serializers.CharField(max_length=100, required=False)
+    telefone = serializers.CharField(max_length=15, required=False)
+    data_nascimento = serializers.DateField(required=False)
+    altura = serializers.FloatField(required=False)
+    peso = serializers.FloatField(required=False)
+    tipo_plano = serializers.IntegerField(required=False)
+    data_inicio_plano = serializers.DateField(required=False)
+    data_fim_plano = serializers.DateField(required=False)
+    renovacao_automatica = serializers.BooleanField(required=False)
+
+    def validate_password_hash(self, value):
+        # Senhas já em hash (migração de outro sistema) dispensam o custo do hasher
+        try:
+            identify_hasher(value)
+        except ValueError:
+            raise serializers.ValidationError('Formato de hash de senha não reconhecido.')
+        return value
+
+    def validate_tipo_plano(self, value):
+        if get_plan_rules(value) is None:
+            raise serializers.ValidationError('Plano não encontrado.')
+        return value
+
+    def validate(self, attrs):
+        if 'password' in attrs and 'password_hash' in attrs:
+            raise serializers.ValidationError('Informe apenas um entre password e password_hash.')
+        if 'password' in attrs:
+            user = User(username=attrs['username'], email=attrs['email'],
+                        first_name=attrs.get('first_name', ''), last_name=attrs.get('last_name', ''))
+            try:
+                validate_password(attrs['password'], user)
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError({'password': list(exc.messages)})
+        return attrs
+
+
+class UnsupportedValuesField(Exception):
+    """O serializer tem um campo que não pode ser lido de `.values()`; a listagem usa o caminho normal."""
+
+
+class ValuesListSerializer:
+    """
+    Representação somente leitura de um ModelSerializer a partir de linhas de
+    `.values()`, sem instanciar modelos nem percorrer `get_attribute` campo a
+    campo. A saída é a mesma de `serializer_class(objetos, many=True).data`.
+
+    O plano (colunas, conversores e relações) é montado uma vez a partir dos
+    campos do serializer: campos diretos e relações ForeignKey/OneToOne
+    (`source='cliente.nome'`, PrimaryKeyRelatedField, serializers aninhados) e
+    `get_<campo>_display`. Qualquer outro campo (SerializerMethodField,
+    many=True, propriedades) gera UnsupportedValuesField.
+    """
+    # Campos cujo to_representation devolve o próprio valor lido do banco
+    passthrough = [
+        (serializers.CharField, (models.CharField, models.TextField)),
+        (serializers.IntegerField, (models.IntegerField, models.AutoField)),
+        (serializers.BooleanField, (models.BooleanField,)),
+    ]
+    supported = (
+        serializers.CharField, serializers.IntegerField, serializers.FloatField, serializers.DecimalField,
+        serializers.BooleanField, serializers.DateTimeField, serializers.DateField, serializers.TimeField,
+        serializers.DurationField, serializers.ChoiceField, serializers.UUIDField, serializers.JSONField,
+        serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField,
+    )
+    # Marca de campo omitido quando uma relação intermediária é nula (SkipField no DRF)
+    SKIP = object()
+
+    def __init__(self, serializer):
+        self.columns = []
+        self.fields = self.compile(serializer, serializer.Meta.model, '')
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def resolve(self, model, source_attrs, prefix):
+        """(coluna, campo do modelo, colunas das relações intermediárias) de um `source`."""
+        guards = []
+        path = prefix
+        for attr in source_attrs[:-1]:
+            field = model._meta.get_field(attr)
+            if not (field.many_to_one or field.one_to_one) or not field.concrete:
+                raise UnsupportedValuesField(attr)
+            path = f'{path}{attr}'
+            guards.append(self.add_column(path))
+            path += '__'
+            model = field.related_model
+        attr = source_attrs[-1]
+        display = re.fullmatch(r'get_(\w+)_display', attr)
+        if display:
+            field = model._meta.get_field(display.group(1))
+            if not field.choices:
+                raise UnsupportedValuesField(attr)
+            return self.add_column(path + field.name), field, guards, dict(make_hashable(field.flatchoices))
+        field = model._meta.get_field(attr)
+        if not field.concrete or field.many_to_many:
+            raise UnsupportedValuesField(attr)
+        return self.add_column(path + field.name), field, guards, None
+
+    def get_missing(self, field):
+        # Mesma ordem de Field.get_attribute quando a relação intermediária é nula
+        if field.default is not empty:
+            if callable(field.default):
+                raise UnsupportedValuesField(field.field_name)
+            return field.default
+        if field.allow_null:
+            return None
+        if not field.required:
+            return self.SKIP
+        raise UnsupportedValuesField(field.field_name)
+
+    def get_converter(self, field, model_field):
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            return field.pk_field.to_representation if field.pk_field is not None else None
+        if isinstance(field, serializers.ReadOnlyField):
+            return None
+        for field_class, model_classes in self.passthrough:
+            if type(field) is field_class and isinstance(model_field, model_classes):
+                return None
+        return field.to_representation
+
+    def compile(self, serializer, model, prefix):
+        fields = []
+        for field in serializer._readable_fields:
+            if field.source == '*':
+                raise UnsupportedValuesField(field.field_name)
+            if isinstance(field, serializers.BaseSerializer):
+                if isinstance(field, serializers.ListSerializer) or not hasattr(field, 'Meta'):
+                    raise UnsupportedValuesField(field.field_name)
+                column, model_field, guards, _ = self.resolve(model, field.source_attrs, prefix)
+                if not model_field.is_relation:
+                    raise UnsupportedValuesField(field.field_name)
+                nested = self.compile(field, model_field.related_model, column + '__')
+                missing = self.get_missing(field) if guards else None
+                fields.append((field.field_name, column, None, None, tuple(guards), missing, nested))
+                continue
+            if not isinstance(field, self.supported):
+                raise UnsupportedValuesField(field.field_name)
+            column, model_field, guards, choices = self.resolve(model, field.source_attrs, prefix)
+            if model_field.is_relation and not isinstance(field, serializers.PrimaryKeyRelatedField):
+                raise UnsupportedValuesField(field.field_name)
+            missing = self.get_missing(field) if guards else None
+            fields.append((field.field_name, column, self.get_converter(field, model_field), choices,
+                           tuple(guards), missing, None))
+        return fields
+
+    def values(self, queryset, *extra_columns):
+        columns = self.columns + [column for column in extra_columns if column not in self.columns]
+        return queryset.prefetch_related(None).values(*columns)
+
+    def represent(self, row, fields):
+        ret = {}
+        for name, column, convert, choices, guards, missing, nested in fields:
+            if guards and any(row[guard] is None for guard in guards):
+                if missing is not self.SKIP:
+                    ret[name] = missing
+                continue
+            value = row[column]
+            if choices is not None:
+                value = force_str(choices.get(make_hashable(value), value), strings_only=True)
+            if value is None:
+                ret[name] = None
+            elif nested is not None:
+                ret[name] = self.represent(row, nested)
+            else:
+                ret[name] = value if convert is None else convert(value)
+        return ret
+
+    def bind(self, fields):
+        # DateTimeField resolve o fuso (settings + fuso ativo) a cada valor; aqui, uma vez por listagem
+        bound = []
+        for name, column, convert, choices, guards, missing, nested in fields:
+            field = getattr(convert, '__self__', None)
+            if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+                field = copy.copy(field)
+                field.timezone = field.default_timezone()
+                convert = field.to_representation
+            if nested is not None:
+                nested = self.bind(nested)
+            bound.append((name, column, convert, choices, guards, missing, nested))
+        return bound
+
+    def to_representation(self, rows):
+        return medir_serializacao(self.represent_rows, rows)
+
+    def represent_rows(self, rows):
+        fields = self.bind(self.fields)
+        return [self.represent(row, fields) for row in rows]
@@ -2,19 +2,43 @@ from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser as DRFIsAdminUser
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from django.contrib.auth.models import User
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from core.models import (Treino, Dieta, TipoPlano, Cliente, HistoricoTreino, 
                        HistoricoDieta, Exercicio, Refeicao, TrocaExercicio, TrocaRefeicao, Perfil)
 from .serializers import (TreinoSerializer, DietaSerializer, TipoPlanoSerializer,
                         ClienteSerializer, HistoricoTreinoSerializer, HistoricoDietaSerializer,
                         ExercicioSerializer, RefeicaoSerializer, TrocaExercicioSerializer,
-                        TrocaRefeicaoSerializer, UserSerializer, PerfilSerializer)
+                        TrocaRefeicaoSerializer, UserSerializer, PerfilSerializer,
+                        ClienteDashboardSerializer)
 from .permissions import (IsAdminUser, IsNutricionistaUser, IsPersonalUser, 
                         IsClienteUser, IsOwnerOrStaff, ReadOnly)
+from .mixins import (BulkUpsertMixin, CachedResponseMixin, ConditionalRequestMixin, FieldSelectionMixin, QueryPlan,
+                     QueryPlanMixin, StreamingExportMixin, ValuesListMixin)
+from .pagination import SelectablePagination
+from .authentication import get_principal, get_request_user, revoke_token_user
+from core.trocas import EXERCICIO, REFEICAO, TrocaNegada, limite_trocas, registrar_troca
+from core.totais import ajustar_totais, contribuicao
+from core.importacao import FORMATOS as FORMATOS_IMPORTACAO, importar_clientes
+from core.metricas import CONTENT_TYPE as METRICAS_CONTENT_TYPE, exportar as exportar_metricas
+import os
+import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
+from rest_framework.exceptions import ValidationError
 
-class SoftDeleteModelViewSet(viewsets.ModelViewSet):
+class SoftDeleteModelViewSet(ConditionalRequestMixin, FieldSelectionMixin, QueryPlanMixin, ValuesListMixin,
+                             viewsets.ModelViewSet):
     @swagger_auto_schema(tags=['Default'])
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -22,9 +46,18 @@ class SoftDeleteModelViewSet(viewsets.ModelViewSet):
         instance.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class TreinoViewSet(SoftDeleteModelViewSet):
-    queryset = Treino.objects.filter(deleted_at__isnull=True)
+class TreinoViewSet(CachedResponseMixin, SoftDeleteModelViewSet):
+    queryset = Treino.objects.all()
     serializer_class = TreinoSerializer
+    cache_dependencies = [Treino, Cliente]
+    conditional_related_fields = ['cliente__updated_at']
+    query_plans = {
+        'default': QueryPlan(select_related=['cliente']),
+        'list': QueryPlan(
+            select_related=['cliente'],
+            only=['id', 'nome', 'descricao', 'duracao', 'cliente', 'cliente__nome', 'created_at', 'updated_at'],
+        ),
+    }
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -38,14 +71,13 @@ class TreinoViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                return Treino.objects.filter(deleted_at__isnull=True, cliente__perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'personal']:
-                return Treino.objects.filter(deleted_at__isnull=True)
-        if user.is_superuser:
-            return Treino.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            return self.apply_query_plan(Treino.objects.filter(cliente_id=principal.cliente_id))
+        elif principal.has_role('admin', 'personal'):
+            return self.apply_query_plan(Treino.objects.all())
+        if principal.is_superuser:
+            return self.apply_query_plan(Treino.objects.all())
         return Treino.objects.none()
     
     @swagger_auto_schema(tags=['Treinos'])
@@ -58,17 +90,15 @@ class TreinoViewSet(SoftDeleteModelViewSet):
     
     @swagger_auto_schema(tags=['Treinos'])
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        
-        # Se a criação do treino foi bem-sucedida, criar um registro no histórico
-        if response.status_code == 201:
-            treino_id = response.data.get('id')
-            cliente_id = response.data.get('cliente')
+        return super().create(request, *args, **kwargs)
+    
+    def perform_create(self, serializer):
+        # Treino, exercícios e histórico na mesma transação, reaproveitando as instâncias já validadas
+        with transaction.atomic():
+            treino = serializer.save()
+            cliente = treino.cliente
             
-            if treino_id and cliente_id:
-                treino = Treino.objects.get(id=treino_id)
-                cliente = Cliente.objects.get(id=cliente_id)
-                
+            if cliente is not None:
                 # Criar registro no histórico
                 HistoricoTreino.objects.create(
                     cliente=cliente,
@@ -76,11 +106,11 @@ class TreinoViewSet(SoftDeleteModelViewSet):
                     data_inicio=timezone.now().date()
                 )
                 
-                # Atualizar a data do último treino do cliente
+                # Atualizar a data do último treino e renovar o saldo de trocas do período
                 cliente.data_ultimo_treino = timezone.now().date()
-                cliente.save(update_fields=['data_ultimo_treino'])
-        
-        return response
+                cliente.trocas_exercicios_restantes = limite_trocas(cliente, EXERCICIO)
+                cliente.treino_atualizacao_pendente = False
+                cliente.save(update_fields=['data_ultimo_treino', 'trocas_exercicios_restantes', 'treino_atualizacao_pendente', 'updated_at'])
     
     @swagger_auto_schema(tags=['Treinos'])
     def update(self, request, *args, **kwargs):
@@ -95,9 +125,19 @@ class TreinoViewSet(SoftDeleteModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class DietaViewSet(SoftDeleteModelViewSet):
-    queryset = Dieta.objects.filter(deleted_at__isnull=True)
+class DietaViewSet(CachedResponseMixin, SoftDeleteModelViewSet):
+    queryset = Dieta.objects.all()
     serializer_class = DietaSerializer
+    cache_dependencies = [Dieta, Cliente]
+    conditional_related_fields = ['cliente__updated_at']
+    query_plans = {
+        'default': QueryPlan(select_related=['cliente']),
+        'list': QueryPlan(
+            select_related=['cliente'],
+            only=['id', 'nome', 'descricao', 'calorias', 'total_calorias', 'quantidade_refeicoes', 'cliente',
+                  'cliente__nome', 'created_at', 'updated_at'],
+        ),
+    }
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -111,14 +151,13 @@ class DietaViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                return Dieta.objects.filter(deleted_at__isnull=True, cliente__perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'nutricionista']:
-                return Dieta.objects.filter(deleted_at__isnull=True)
-        if user.is_superuser:
-            return Dieta.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            return self.apply_query_plan(Dieta.objects.filter(cliente_id=principal.cliente_id))
+        elif principal.has_role('admin', 'nutricionista'):
+            return self.apply_query_plan(Dieta.objects.all())
+        if principal.is_superuser:
+            return self.apply_query_plan(Dieta.objects.all())
         return Dieta.objects.none()
     
     @swagger_auto_schema(tags=['Dietas'])
@@ -131,27 +170,24 @@ class DietaViewSet(SoftDeleteModelViewSet):
     
     @swagger_auto_schema(tags=['Dietas'])
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        
-        if response.status_code == 201:
-            dieta_id = response.data.get('id')
-            cliente_id = response.data.get('cliente')
+        return super().create(request, *args, **kwargs)
+    
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            dieta = serializer.save()
+            cliente = dieta.cliente
             
-            if dieta_id and cliente_id:
-                dieta = Dieta.objects.get(id=dieta_id)
-                cliente = Cliente.objects.get(id=cliente_id)
-                
+            if cliente is not None:
                 HistoricoDieta.objects.create(
                     cliente=cliente,
                     dieta=dieta,
                     data_inicio=timezone.now().date()
                 )
                 
-                
                 cliente.data_ultima_dieta = timezone.now().date()
-                cliente.save(update_fields=['data_ultima_dieta'])
-        
-        return response
+                cliente.trocas_refeicoes_restantes = limite_trocas(cliente, REFEICAO)
+                cliente.dieta_atualizacao_pendente = False
+                cliente.save(update_fields=['data_ultima_dieta', 'trocas_refeicoes_restantes', 'dieta_atualizacao_pendente', 'updated_at'])
     
     @swagger_auto_schema(tags=['Dietas'])
     def update(self, request, *args, **kwargs):
@@ -166,9 +202,11 @@ class DietaViewSet(SoftDeleteModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class TipoPlanoViewSet(SoftDeleteModelViewSet):
-    queryset = TipoPlano.objects.filter(deleted_at__isnull=True)
+class TipoPlanoViewSet(CachedResponseMixin, SoftDeleteModelViewSet):
+    queryset = TipoPlano.objects.all()
     serializer_class = TipoPlanoSerializer
+    cache_dependencies = [TipoPlano]
+    cache_per_scope = False
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -203,27 +241,32 @@ class TipoPlanoViewSet(SoftDeleteModelViewSet):
 
 
 class ClienteViewSet(SoftDeleteModelViewSet):
-    queryset = Cliente.objects.filter(deleted_at__isnull=True)
+    queryset = Cliente.objects.all()
     serializer_class = ClienteSerializer
+    conditional_related_fields = ['tipo_plano__updated_at', 'perfil__updated_at']
+    query_plans = {
+        'default': QueryPlan(select_related=['tipo_plano', 'perfil__usuario']),
+        'dashboard': QueryPlan(select_related=['tipo_plano']),
+    }
+    max_dias_expirando = 365
     
     def get_permissions(self):
-        if self.action in ['list']:
+        if self.action in ['list', 'expirando']:
             permission_classes = [IsAuthenticated, (IsAdminUser | IsNutricionistaUser | IsPersonalUser)]
-        elif self.action in ['retrieve', 'update', 'partial_update']:
+        elif self.action in ['retrieve', 'update', 'partial_update', 'dashboard']:
             permission_classes = [IsAuthenticated, IsOwnerOrStaff]
-        elif self.action in ['create', 'destroy']:
+        elif self.action in ['create', 'destroy', 'importar']:
             permission_classes = [IsAuthenticated, IsAdminUser]
         else:
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                return Cliente.objects.filter(deleted_at__isnull=True, perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'nutricionista', 'personal']:
-                return Cliente.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            return self.apply_query_plan(Cliente.objects.filter(id=principal.cliente_id))
+        elif principal.has_role('admin', 'nutricionista', 'personal'):
+            return self.apply_query_plan(Cliente.objects.all())
         return Cliente.objects.none()
     
     @swagger_auto_schema(tags=['Clientes'])
@@ -249,14 +292,83 @@ class ClienteViewSet(SoftDeleteModelViewSet):
     @swagger_auto_schema(tags=['Clientes'])
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=True, methods=['get'])
+    @swagger_auto_schema(tags=['Clientes'], responses={200: ClienteDashboardSerializer})
+    def dashboard(self, request, pk=None):
+        # Tela inicial do app: cliente, treino e dieta atuais em um número fixo de queries
+        cliente = self.get_object()
+        cliente.treino_atual = (Treino.objects.filter(cliente=cliente)
+                                .order_by('-created_at', '-id')
+                                .prefetch_related(Prefetch('exercicios', queryset=Exercicio.objects.order_by('id')))
+                                .first())
+        cliente.dieta_atual = (Dieta.objects.filter(cliente=cliente)
+                               .order_by('-created_at', '-id')
+                               .prefetch_related(Prefetch('refeicoes', queryset=Refeicao.objects.order_by('id')))
+                               .first())
+        data = ClienteDashboardSerializer(cliente, context=self.get_serializer_context()).data
+        
+        etag = quote_etag(hashlib.md5(json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()).hexdigest())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        return Response(data, headers={'ETag': etag})
+
+    @action(detail=False, methods=['get'])
+    @swagger_auto_schema(tags=['Clientes'], responses={200: ClienteSerializer(many=True)}, manual_parameters=[
+        openapi.Parameter('dias', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Janela, em dias, a partir de hoje (padrão 7)'),
+    ])
+    def expirando(self, request):
+        # Planos ativos que vencem nos próximos `dias` dias, pelo índice em data_fim_plano
+        try:
+            dias = int(request.query_params.get('dias', 7))
+        except ValueError:
+            raise ValidationError({'dias': 'Deve ser um número inteiro.'})
+        if not 0 <= dias <= self.max_dias_expirando:
+            raise ValidationError({'dias': f'Deve estar entre 0 e {self.max_dias_expirando}.'})
+        hoje = timezone.now().date()
+        queryset = self.get_queryset().filter(
+            status_plano=Cliente.PLANO_ATIVO,
+            data_fim_plano__range=(hoje, hoje + timedelta(days=dias)),
+        ).order_by('data_fim_plano', 'id')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
 
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    @swagger_auto_schema(tags=['Clientes'], manual_parameters=[
+        openapi.Parameter('arquivo', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True,
+                          description='CSV ou NDJSON com username, email e os dados do cliente'),
+        openapi.Parameter('formato', openapi.IN_FORM, type=openapi.TYPE_STRING, enum=[*FORMATOS_IMPORTACAO],
+                          description='Padrão: pela extensão do arquivo'),
+        openapi.Parameter('dry_run', openapi.IN_FORM, type=openapi.TYPE_BOOLEAN, description='Apenas valida'),
+    ])
+    def importar(self, request):
+        # Cria usuário, perfil e cliente de cada linha em lote; linhas inválidas voltam em `erros`
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            raise ValidationError({'arquivo': 'Envie o arquivo no campo "arquivo".'})
+        formato = request.data.get('formato') or os.path.splitext(arquivo.name)[1].lstrip('.').lower()
+        if formato not in FORMATOS_IMPORTACAO:
+            raise ValidationError({'formato': f'Use um de: {", ".join(FORMATOS_IMPORTACAO)}.'})
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        # Sem pool de processos dentro do worker web: arquivos grandes vão pelo comando importar_clientes
+        resultado = importar_clientes(arquivo, formato, dry_run=dry_run, processos=1)
+        criado = resultado['importados'] and not dry_run
+        return Response(resultado, status=status.HTTP_201_CREATED if criado else status.HTTP_200_OK)
 
-class HistoricoTreinoViewSet(SoftDeleteModelViewSet):
-    queryset = HistoricoTreino.objects.filter(deleted_at__isnull=True)
+
+class HistoricoTreinoViewSet(StreamingExportMixin, SoftDeleteModelViewSet):
+    queryset = HistoricoTreino.objects.all()
     serializer_class = HistoricoTreinoSerializer
+    pagination_class = SelectablePagination
+    export_fields = ['id', 'cliente', 'cliente__nome', 'treino', 'treino__nome', 'data_inicio', 'data_fim',
+                     'observacoes', 'created_at', 'updated_at']
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'export']:
             permission_classes = [IsAuthenticated, IsOwnerOrStaff]
         elif self.action in ['create', 'update', 'partial_update']:
             permission_classes = [IsAuthenticated, (IsAdminUser | IsPersonalUser)]
@@ -267,12 +379,11 @@ class HistoricoTreinoViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                return HistoricoTreino.objects.filter(deleted_at__isnull=True, cliente__perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'personal']:
-                return HistoricoTreino.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            return self.apply_query_plan(HistoricoTreino.objects.filter(cliente_id=principal.cliente_id))
+        elif principal.has_role('admin', 'personal'):
+            return self.apply_query_plan(HistoricoTreino.objects.all())
         return HistoricoTreino.objects.none()
     
     @swagger_auto_schema(tags=['Histórico'])
@@ -298,14 +409,25 @@ class HistoricoTreinoViewSet(SoftDeleteModelViewSet):
     @swagger_auto_schema(tags=['Histórico'])
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['get'])
+    @swagger_auto_schema(tags=['Histórico'], manual_parameters=[
+        openapi.Parameter('formato', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['ndjson', 'csv'],
+                          description='Formato do arquivo (padrão ndjson)'),
+    ])
+    def export(self, request):
+        return self.stream_export(request)
 
 
-class HistoricoDietaViewSet(SoftDeleteModelViewSet):
-    queryset = HistoricoDieta.objects.filter(deleted_at__isnull=True)
+class HistoricoDietaViewSet(StreamingExportMixin, SoftDeleteModelViewSet):
+    queryset = HistoricoDieta.objects.all()
     serializer_class = HistoricoDietaSerializer
+    pagination_class = SelectablePagination
+    export_fields = ['id', 'cliente', 'cliente__nome', 'dieta', 'dieta__nome', 'data_inicio', 'data_fim',
+                     'observacoes', 'created_at', 'updated_at']
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'export']:
             permission_classes = [IsAuthenticated, IsOwnerOrStaff]
         elif self.action in ['create', 'update', 'partial_update']:
             permission_classes = [IsAuthenticated, (IsAdminUser | IsNutricionistaUser)]
@@ -316,12 +438,11 @@ class HistoricoDietaViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                return HistoricoDieta.objects.filter(deleted_at__isnull=True, cliente__perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'nutricionista']:
-                return HistoricoDieta.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            return self.apply_query_plan(HistoricoDieta.objects.filter(cliente_id=principal.cliente_id))
+        elif principal.has_role('admin', 'nutricionista'):
+            return self.apply_query_plan(HistoricoDieta.objects.all())
         return HistoricoDieta.objects.none()
     
     @swagger_auto_schema(tags=['Histórico'])
@@ -347,16 +468,25 @@ class HistoricoDietaViewSet(SoftDeleteModelViewSet):
     @swagger_auto_schema(tags=['Histórico'])
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['get'])
+    @swagger_auto_schema(tags=['Histórico'], manual_parameters=[
+        openapi.Parameter('formato', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['ndjson', 'csv'],
+                          description='Formato do arquivo (padrão ndjson)'),
+    ])
+    def export(self, request):
+        return self.stream_export(request)
 
 
-class ExercicioViewSet(SoftDeleteModelViewSet):
-    queryset = Exercicio.objects.filter(deleted_at__isnull=True)
+class ExercicioViewSet(BulkUpsertMixin, SoftDeleteModelViewSet):
+    queryset = Exercicio.objects.all()
     serializer_class = ExercicioSerializer
+    bulk_update_fields = ['nome', 'descricao', 'treino']
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             permission_classes = [IsAuthenticated]
-        elif self.action in ['create', 'update', 'partial_update']:
+        elif self.action in ['create', 'update', 'partial_update', 'bulk']:
             permission_classes = [IsAuthenticated, (IsAdminUser | IsPersonalUser)]
         elif self.action == 'destroy':
             permission_classes = [IsAuthenticated, IsAdminUser]
@@ -365,16 +495,15 @@ class ExercicioViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                # Cliente vê apenas exercícios de seus treinos
-                return Exercicio.objects.filter(deleted_at__isnull=True, treino__cliente__perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'personal']:
-                # Admin e personal veem todos os exercícios
-                return Exercicio.objects.filter(deleted_at__isnull=True)
-        if user.is_superuser:
-            return Exercicio.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            # Cliente vê apenas exercícios de seus treinos
+            return self.apply_query_plan(Exercicio.objects.filter(treino__cliente_id=principal.cliente_id))
+        elif principal.has_role('admin', 'personal'):
+            # Admin e personal veem todos os exercícios
+            return self.apply_query_plan(Exercicio.objects.all())
+        if principal.is_superuser:
+            return self.apply_query_plan(Exercicio.objects.all())
         return Exercicio.objects.none()
     
     @swagger_auto_schema(tags=['Treinos'])
@@ -400,16 +529,26 @@ class ExercicioViewSet(SoftDeleteModelViewSet):
     @swagger_auto_schema(tags=['Treinos'])
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['post'])
+    @swagger_auto_schema(tags=['Treinos'], request_body=ExercicioSerializer(many=True), responses={201: ExercicioSerializer(many=True)})
+    def bulk(self, request):
+        return self.bulk_upsert(request)
 
 
-class RefeicaoViewSet(SoftDeleteModelViewSet):
-    queryset = Refeicao.objects.filter(deleted_at__isnull=True)
+class RefeicaoViewSet(BulkUpsertMixin, SoftDeleteModelViewSet):
+    queryset = Refeicao.objects.all()
     serializer_class = RefeicaoSerializer
+    bulk_update_fields = ['nome', 'descricao', 'calorias', 'dieta']
+
+    def bulk_upsert_saved(self, created, updated, originals):
+        ajustar_totais(anteriores=[contribuicao(refeicao) for refeicao in originals],
+                       atuais=[contribuicao(refeicao) for refeicao in [*created, *updated]])
     
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             permission_classes = [IsAuthenticated]
-        elif self.action in ['create', 'update', 'partial_update']:
+        elif self.action in ['create', 'update', 'partial_update', 'bulk']:
             permission_classes = [IsAuthenticated, (IsAdminUser | IsNutricionistaUser)]
         elif self.action == 'destroy':
             permission_classes = [IsAuthenticated, IsAdminUser]
@@ -418,16 +557,15 @@ class RefeicaoViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                # Cliente vê apenas refeições de suas dietas
-                return Refeicao.objects.filter(deleted_at__isnull=True, dieta__cliente__perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'nutricionista']:
-                # Admin e nutricionista veem todas as refeições
-                return Refeicao.objects.filter(deleted_at__isnull=True)
-        if user.is_superuser:
-            return Refeicao.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            # Cliente vê apenas refeições de suas dietas
+            return self.apply_query_plan(Refeicao.objects.filter(dieta__cliente_id=principal.cliente_id))
+        elif principal.has_role('admin', 'nutricionista'):
+            # Admin e nutricionista veem todas as refeições
+            return self.apply_query_plan(Refeicao.objects.all())
+        if principal.is_superuser:
+            return self.apply_query_plan(Refeicao.objects.all())
         return Refeicao.objects.none()
     
     @swagger_auto_schema(tags=['Dietas'])
@@ -453,14 +591,22 @@ class RefeicaoViewSet(SoftDeleteModelViewSet):
     @swagger_auto_schema(tags=['Dietas'])
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['post'])
+    @swagger_auto_schema(tags=['Dietas'], request_body=RefeicaoSerializer(many=True), responses={201: RefeicaoSerializer(many=True)})
+    def bulk(self, request):
+        return self.bulk_upsert(request)
 
 
-class TrocaExercicioViewSet(SoftDeleteModelViewSet):
-    queryset = TrocaExercicio.objects.filter(deleted_at__isnull=True)
+class TrocaExercicioViewSet(StreamingExportMixin, SoftDeleteModelViewSet):
+    queryset = TrocaExercicio.objects.all()
     serializer_class = TrocaExercicioSerializer
+    pagination_class = SelectablePagination
+    export_fields = ['id', 'cliente', 'cliente__nome', 'exercicio_antigo', 'exercicio_antigo__nome', 'exercicio_novo',
+                     'exercicio_novo__nome', 'data_troca', 'motivo', 'created_at', 'updated_at']
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'export']:
             permission_classes = [IsAuthenticated, IsOwnerOrStaff]
         elif self.action in ['create']:
             permission_classes = [IsAuthenticated, IsClienteUser]
@@ -471,12 +617,11 @@ class TrocaExercicioViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                return TrocaExercicio.objects.filter(deleted_at__isnull=True, cliente__perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'personal']:
-                return TrocaExercicio.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            return self.apply_query_plan(TrocaExercicio.objects.filter(cliente_id=principal.cliente_id))
+        elif principal.has_role('admin', 'personal'):
+            return self.apply_query_plan(TrocaExercicio.objects.all())
         return TrocaExercicio.objects.none()
     
     @swagger_auto_schema(tags=['Trocas'])
@@ -491,6 +636,15 @@ class TrocaExercicioViewSet(SoftDeleteModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
     
+    def perform_create(self, serializer):
+        principal = get_principal(self.request)
+        if serializer.validated_data['cliente'].pk != principal.cliente_id:
+            raise ValidationError({'cliente': 'Só é possível solicitar trocas para o próprio cliente.'})
+        try:
+            registrar_troca(serializer, EXERCICIO)
+        except TrocaNegada as exc:
+            raise ValidationError({'non_field_errors': [str(exc)]})
+    
     @swagger_auto_schema(tags=['Trocas'])
     def update(self, request, *args, **kwargs):
         return super().update(request, *args, **kwargs)
@@ -502,14 +656,25 @@ class TrocaExercicioViewSet(SoftDeleteModelViewSet):
     @swagger_auto_schema(tags=['Trocas'])
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['get'])
+    @swagger_auto_schema(tags=['Trocas'], manual_parameters=[
+        openapi.Parameter('formato', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['ndjson', 'csv'],
+                          description='Formato do arquivo (padrão ndjson)'),
+    ])
+    def export(self, request):
+        return self.stream_export(request)
 
 
-class TrocaRefeicaoViewSet(SoftDeleteModelViewSet):
-    queryset = TrocaRefeicao.objects.filter(deleted_at__isnull=True)
+class TrocaRefeicaoViewSet(StreamingExportMixin, SoftDeleteModelViewSet):
+    queryset = TrocaRefeicao.objects.all()
     serializer_class = TrocaRefeicaoSerializer
+    pagination_class = SelectablePagination
+    export_fields = ['id', 'cliente', 'cliente__nome', 'refeicao_antiga', 'refeicao_antiga__nome', 'refeicao_nova',
+                     'refeicao_nova__nome', 'data_troca', 'motivo', 'created_at', 'updated_at']
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'export']:
             permission_classes = [IsAuthenticated, IsOwnerOrStaff]
         elif self.action in ['create']:
             permission_classes = [IsAuthenticated, IsClienteUser]
@@ -520,12 +685,11 @@ class TrocaRefeicaoViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'perfil'):
-            if user.perfil.tipo == 'cliente' and hasattr(user.perfil, 'cliente'):
-                return TrocaRefeicao.objects.filter(deleted_at__isnull=True, cliente__perfil__usuario=user)
-            elif user.perfil.tipo in ['admin', 'nutricionista']:
-                return TrocaRefeicao.objects.filter(deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_cliente:
+            return self.apply_query_plan(TrocaRefeicao.objects.filter(cliente_id=principal.cliente_id))
+        elif principal.has_role('admin', 'nutricionista'):
+            return self.apply_query_plan(TrocaRefeicao.objects.all())
         return TrocaRefeicao.objects.none()
     
     @swagger_auto_schema(tags=['Trocas'])
@@ -540,6 +704,15 @@ class TrocaRefeicaoViewSet(SoftDeleteModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
     
+    def perform_create(self, serializer):
+        principal = get_principal(self.request)
+        if serializer.validated_data['cliente'].pk != principal.cliente_id:
+            raise ValidationError({'cliente': 'Só é possível solicitar trocas para o próprio cliente.'})
+        try:
+            registrar_troca(serializer, REFEICAO)
+        except TrocaNegada as exc:
+            raise ValidationError({'non_field_errors': [str(exc)]})
+    
     @swagger_auto_schema(tags=['Trocas'])
     def update(self, request, *args, **kwargs):
         return super().update(request, *args, **kwargs)
@@ -551,9 +724,17 @@ class TrocaRefeicaoViewSet(SoftDeleteModelViewSet):
     @swagger_auto_schema(tags=['Trocas'])
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['get'])
+    @swagger_auto_schema(tags=['Trocas'], manual_parameters=[
+        openapi.Parameter('formato', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['ndjson', 'csv'],
+                          description='Formato do arquivo (padrão ndjson)'),
+    ])
+    def export(self, request):
+        return self.stream_export(request)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(FieldSelectionMixin, QueryPlanMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = User.objects.filter(is_active=True)
     serializer_class = UserSerializer
     
@@ -569,10 +750,10 @@ class UserViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if user.is_staff or (hasattr(user, 'perfil') and user.perfil.tipo == 'admin'):
-            return User.objects.filter(is_active=True)
-        return User.objects.filter(id=user.id, is_active=True)
+        principal = get_principal(self.request)
+        if principal.is_staff or principal.role == 'admin':
+            return self.apply_query_plan(User.objects.filter(is_active=True))
+        return self.apply_query_plan(User.objects.filter(id=principal.user_id, is_active=True))
     
     @swagger_auto_schema(tags=['Usuários'])
     def list(self, request, *args, **kwargs):
@@ -599,18 +780,22 @@ class UserViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         instance.is_active = False
         instance.save()
+        revoke_token_user(instance.pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
     
     @action(detail=False, methods=['get'])
     @swagger_auto_schema(tags=['Usuários'])
     def me(self, request):
-        serializer = self.get_serializer(request.user)
+        serializer = self.get_serializer(get_request_user(request))
         return Response(serializer.data)
 
 
 class PerfilViewSet(SoftDeleteModelViewSet):
-    queryset = Perfil.objects.filter(deleted_at__isnull=True)
+    queryset = Perfil.objects.all()
     serializer_class = PerfilSerializer
+    query_plans = {
+        'default': QueryPlan(select_related=['usuario']),
+    }
     
     def get_permissions(self):
         if self.action in ['list']:
@@ -624,10 +809,10 @@ class PerfilViewSet(SoftDeleteModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        user = self.request.user
-        if user.is_staff or (hasattr(user, 'perfil') and user.perfil.tipo == 'admin'):
-            return Perfil.objects.filter(deleted_at__isnull=True)
-        return Perfil.objects.filter(usuario=user, deleted_at__isnull=True)
+        principal = get_principal(self.request)
+        if principal.is_staff or principal.role == 'admin':
+            return self.apply_query_plan(Perfil.objects.all())
+        return self.apply_query_plan(Perfil.objects.filter(usuario_id=principal.user_id))
     
     @swagger_auto_schema(tags=['Usuários'])
     def list(self, request, *args, **kwargs):
@@ -652,3 +837,112 @@ class PerfilViewSet(SoftDeleteModelViewSet):
     @swagger_auto_schema(tags=['Usuários'])
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    Sincronização incremental dos dados do cliente autenticado.
+
+    Devolve, agrupados por tipo, os registros alterados depois de `since`
+    (registros removidos logicamente vêm em `deleted`) e um novo `watermark`
+    para a próxima chamada. Enquanto `has_more` for verdadeiro, o cliente deve
+    repetir a chamada com o watermark recebido.
+    """
+    permission_classes = [IsAuthenticated, IsClienteUser]
+    default_limit = 500
+    max_limit = 2000
+
+    # (chave, modelo, serializer, lookup do cliente, select_related)
+    sync_types = [
+        ('treinos', Treino, TreinoSerializer, 'cliente_id', ['cliente']),
+        ('exercicios', Exercicio, ExercicioSerializer, 'treino__cliente_id', []),
+        ('dietas', Dieta, DietaSerializer, 'cliente_id', ['cliente']),
+        ('refeicoes', Refeicao, RefeicaoSerializer, 'dieta__cliente_id', []),
+        ('trocas_exercicios', TrocaExercicio, TrocaExercicioSerializer, 'cliente_id', []),
+        ('trocas_refeicoes', TrocaRefeicao, TrocaRefeicaoSerializer, 'cliente_id', []),
+    ]
+
+    def get_since(self, request):
+        since = request.query_params.get('since')
+        if not since:
+            return None
+        value = parse_datetime(since)
+        if value is None:
+            raise ValidationError({'since': 'Data/hora inválida; use o formato ISO 8601.'})
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Deve ser um número inteiro.'})
+        return max(1, min(limit, self.max_limit))
+
+    def get_changes_queryset(self, model, lookup, select_related, cliente_id, since):
+        queryset = model.all_objects.filter(**{lookup: cliente_id}).select_related(*select_related)
+        if since is None:
+            # Primeira sincronização: não há o que remover no dispositivo
+            return queryset.filter(deleted_at__isnull=True)
+        return queryset.filter(updated_at__gt=since)
+
+    @swagger_auto_schema(tags=['Sincronização'])
+    def list(self, request):
+        principal = get_principal(request)
+        if not principal.is_cliente:
+            return Response({'detail': 'Usuário sem cliente associado.'}, status=status.HTTP_403_FORBIDDEN)
+        since = self.get_since(request)
+        limit = self.get_limit(request)
+
+        # Cada tipo contribui com no máximo `limit` linhas; a página é o menor prefixo comum por updated_at
+        rows = []
+        has_more = False
+        for key, model, serializer_class, lookup, select_related in self.sync_types:
+            queryset = self.get_changes_queryset(model, lookup, select_related, principal.cliente_id, since)
+            fetched = list(queryset.order_by('updated_at', 'id')[:limit])
+            has_more = has_more or len(fetched) == limit
+            rows.extend((obj.updated_at, key, obj) for obj in fetched)
+        rows.sort(key=lambda row: row[0])
+
+        if len(rows) > limit:
+            has_more = True
+            rows = rows[:limit]
+        watermark = rows[-1][0] if rows else since
+        if has_more and rows:
+            # Empates no limite da página entram todos, para que `updated_at > watermark` não perca linhas
+            included = {(key, obj.pk) for _, key, obj in rows}
+            for key, model, serializer_class, lookup, select_related in self.sync_types:
+                queryset = self.get_changes_queryset(model, lookup, select_related, principal.cliente_id, since)
+                for obj in queryset.filter(updated_at=watermark):
+                    if (key, obj.pk) not in included:
+                        rows.append((obj.updated_at, key, obj))
+
+        changes = {}
+        for key, model, serializer_class, lookup, select_related in self.sync_types:
+            objects = [obj for _, row_key, obj in rows if row_key == key]
+            changes[key] = {
+                'updated': serializer_class([obj for obj in objects if obj.deleted_at is None], many=True, context={'request': request}).data,
+                'deleted': [obj.pk for obj in objects if obj.deleted_at is not None],
+            }
+
+        return Response({
+            'since': since,
+            'watermark': watermark,
+            'has_more': has_more,
+            'changes': changes,
+        })
+
+
+class MetricasViewSet(viewsets.ViewSet):
+    """
+    Métricas de perfil das requisições amostradas (core.metricas) por endpoint,
+    no formato texto do Prometheus. Os valores são do processo que atende a
+    requisição.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    @swagger_auto_schema(tags=['Métricas'], responses={200: 'Métricas no formato texto do Prometheus'})
+    def list(self, request):
+        return HttpResponse(exportar_metricas(), content_type=METRICAS_CONTENT_TYPE)
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from django.db.models.signals import post_save
+        from core import metricas, totais
+        from core.cache import connect_signals
+        from core.models import BaseModel, tocar_perfil_do_usuario
+        connect_signals([model for model in self.get_models() if issubclass(model, BaseModel)])
+        post_save.connect(tocar_perfil_do_usuario, sender=User, dispatch_uid='fittrack-usuario-perfil')
+        totais.connect_signals()
+        metricas.connect_signals()
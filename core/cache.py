@@ -0,0 +1,150 @@
+"""
+Versionamento de chaves de cache por modelo (e por cliente) com invalidação por signals.
+
+Cada modelo tem um número de versão global e, quando possui `cliente`, um por
+cliente mais uma versão "todos os clientes" (para atualizações em massa). As
+chaves de resposta incluem as versões das suas dependências, então invalidar é
+apenas incrementar a versão: as entradas antigas deixam de ser lidas e expiram
+pelo TTL. O incremento acontece no commit da transação que fez a escrita.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db.transaction import on_commit
+from django.db.models.signals import post_delete, post_init, post_save
+
+VERSION_PREFIX = 'fittrack:v'
+ALL_CLIENTES = '*'
+RESPONSE_PREFIX = 'fittrack:resp'
+# cliente_id com que a instância foi carregada (ou salva pela última vez)
+LOADED_CLIENTE = '_cache_cliente_id'
+
+# Métricas do processo atual: {'hit': n, 'miss': n, 'invalidation': n}
+stats = {'hit': 0, 'miss': 0, 'invalidation': 0}
+
+_immediate = ContextVar('fittrack_cache_immediate', default=False)
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+def is_cliente_scoped(model):
+    return model._meta.model_name == 'cliente' or any(
+        field.attname == 'cliente_id' for field in model._meta.concrete_fields
+    )
+
+
+def _version_key(label, cliente_id=None):
+    if cliente_id is None:
+        return f'{VERSION_PREFIX}:{label}'
+    return f'{VERSION_PREFIX}:{label}:{cliente_id}'
+
+
+def _version_keys(models, cliente_id=None):
+    keys = []
+    for model in models:
+        label = model_label(model)
+        if cliente_id is not None and is_cliente_scoped(model):
+            keys += [_version_key(label, ALL_CLIENTES), _version_key(label, cliente_id)]
+        else:
+            keys.append(_version_key(label))
+    return keys
+
+
+def get_versions(models, cliente_id=None):
+    """Versões atuais das dependências, lidas em uma única ida ao cache."""
+    keys = _version_keys(models, cliente_id)
+    found = cache.get_many(keys)
+    return [found.get(key, 0) for key in keys]
+
+
+async def aget_versions(models, cliente_id=None):
+    keys = _version_keys(models, cliente_id)
+    found = await cache.aget_many(keys)
+    return [found.get(key, 0) for key in keys]
+
+
+def bump_version(label, cliente_id=None):
+    key = _version_key(label, cliente_id)
+    # add() garante que a chave existe antes do incr atômico. O valor inicial
+    # baseado no relógio evita repetir versões antigas depois de um flush do cache.
+    cache.add(key, int(time.time() * 1000), timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), timeout=None)
+    stats['invalidation'] += 1
+
+
+def _bump_versions(label, cliente_ids, all_clientes):
+    bump_version(label)
+    if all_clientes:
+        bump_version(label, ALL_CLIENTES)
+    for cliente_id in cliente_ids:
+        bump_version(label, cliente_id)
+
+
+def invalidate_model(model, cliente_ids=(), all_clientes=False):
+    """
+    Incrementa as versões do modelo quando a transação atual for confirmada
+    (imediatamente fora de uma transação). Antes do commit, um leitor
+    concorrente ainda vê as linhas antigas e as gravaria no cache já com a
+    versão nova. all_clientes invalida as entradas de todos os clientes com um
+    único incremento.
+    """
+    # Os ids são lidos agora, ainda dentro da transação (podem vir de um queryset)
+    cliente_ids = {cliente_id for cliente_id in cliente_ids if cliente_id is not None}
+    label = model_label(model)
+    if _immediate.get():
+        _bump_versions(label, cliente_ids, all_clientes)
+    else:
+        on_commit(lambda: _bump_versions(label, cliente_ids, all_clientes))
+
+
+@contextmanager
+def immediate_invalidation():
+    """
+    Invalida sem esperar o commit, para transações que nunca são confirmadas
+    (benchmark desfeito ao final, TestCase).
+    """
+    token = _immediate.set(True)
+    try:
+        yield
+    finally:
+        _immediate.reset(token)
+
+
+def invalidate_instance(instance):
+    model = type(instance)
+    if model._meta.model_name == 'cliente':
+        cliente_ids = [instance.pk]
+    else:
+        # Um registro movido para outro cliente sai também das respostas do cliente anterior
+        cliente_ids = [getattr(instance, 'cliente_id', None), instance.__dict__.get(LOADED_CLIENTE)]
+    invalidate_model(model, cliente_ids)
+
+
+def record(hit):
+    stats['hit' if hit else 'miss'] += 1
+
+
+def _on_init(sender, instance, **kwargs):
+    # Só lê o __dict__: cliente_id adiado (.only()) não dispara consulta
+    instance.__dict__[LOADED_CLIENTE] = instance.__dict__.get('cliente_id')
+
+
+def _on_change(sender, instance, **kwargs):
+    invalidate_instance(instance)
+    _on_init(sender, instance)
+
+
+def connect_signals(models):
+    # Remoções lógicas passam por save() e também disparam post_save
+    for model in models:
+        if model._meta.model_name != 'cliente' and is_cliente_scoped(model):
+            post_init.connect(_on_init, sender=model, dispatch_uid=f'fittrack-cache-init-{model_label(model)}')
+        post_save.connect(_on_change, sender=model, dispatch_uid=f'fittrack-cache-save-{model_label(model)}')
+        post_delete.connect(_on_change, sender=model, dispatch_uid=f'fittrack-cache-delete-{model_label(model)}')
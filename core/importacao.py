@@ -0,0 +1,222 @@
+"""
+Importação em lote de clientes (User + Perfil + Cliente) a partir de CSV ou NDJSON.
+
+As linhas são lidas em streaming e processadas em lotes: cada linha é validada
+individualmente, duplicidades são verificadas com uma consulta por lote e os
+três modelos são gravados com bulk_create na mesma transação, ligando as FKs
+pelos objetos já criados. Linhas inválidas não interrompem a importação; são
+devolvidas com o número da linha e os erros.
+
+Senhas em texto são o gargalo (PBKDF2 leva centenas de ms por senha), por isso
+o hash é calculado em um pool de processos. Linhas com `password_hash` usam o
+hash informado e linhas sem senha recebem uma senha inutilizável (o acesso é
+definido depois pelo fluxo de redefinição de senha).
+"""
+import codecs
+import csv
+import io
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+from core.api.v1.serializers import ClienteImportSerializer
+from core.cache import invalidate_model
+from core.models import Cliente, Perfil
+
+FORMATOS = ('csv', 'ndjson')
+LOTE = 1000
+# Abaixo disso o custo de enviar as senhas ao pool supera o ganho
+MIN_SENHAS_POOL = 4
+ERRO_CODIFICACAO = 'O arquivo não está em UTF-8; as linhas seguintes não foram lidas.'
+
+
+def ler_linhas(arquivo, formato):
+    """
+    Gera (número da linha, dados, erro) a partir de um arquivo binário ou de
+    texto. Em CSV, colunas vazias são tratadas como ausentes. Um trecho que
+    não é UTF-8 ou um CSV malformado vira o erro da linha e encerra a leitura.
+    """
+    linhas = arquivo if isinstance(arquivo, io.TextIOBase) else codecs.iterdecode(arquivo, 'utf-8-sig')
+    if formato == 'csv':
+        leitor = csv.DictReader(linhas)
+        try:
+            for dados in leitor:
+                if None in dados:
+                    yield leitor.line_num, None, {'non_field_errors': ['Mais colunas que o cabeçalho.']}
+                    continue
+                yield leitor.line_num, {campo: valor for campo, valor in dados.items() if valor not in ('', None)}, None
+        except UnicodeDecodeError:
+            yield leitor.line_num + 1, None, {'non_field_errors': [ERRO_CODIFICACAO]}
+        except csv.Error as exc:
+            yield leitor.line_num + 1, None, {'non_field_errors': [f'CSV inválido: {exc}.']}
+        return
+    numero = 0
+    linhas = iter(linhas)
+    while True:
+        numero += 1
+        try:
+            linha = next(linhas)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            yield numero, None, {'non_field_errors': [ERRO_CODIFICACAO]}
+            return
+        if not linha.strip():
+            continue
+        try:
+            dados = json.loads(linha)
+        except ValueError:
+            yield numero, None, {'non_field_errors': ['JSON inválido.']}
+            continue
+        if not isinstance(dados, dict):
+            yield numero, None, {'non_field_errors': ['Esperado um objeto.']}
+            continue
+        yield numero, dados, None
+
+
+def _iniciar_processo():
+    # Necessário quando o pool usa `spawn`; com `fork` o Django já está configurado
+    django.setup()
+
+
+class ImportadorClientes:
+    """Mantém o estado da importação (duplicidades já vistas, pool e resultado) entre os lotes."""
+
+    def __init__(self, lote=LOTE, processos=None, dry_run=False, progresso=None):
+        self.lote = lote
+        self.processos = processos
+        self.dry_run = dry_run
+        self.progresso = progresso
+        self.usernames = set()
+        self.emails = set()
+        self.pool = None
+        # Uma única instância: os campos do serializer são copiados uma vez, não a cada linha
+        self.serializer = ClienteImportSerializer()
+        self.resultado = {'linhas': 0, 'importados': 0, 'erros': []}
+
+    def hash_senhas(self, senhas):
+        if len(senhas) < MIN_SENHAS_POOL or self.processos == 1:
+            return [make_password(senha) for senha in senhas]
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.processos, initializer=_iniciar_processo)
+        return list(self.pool.map(make_password, senhas, chunksize=max(1, len(senhas) // 32)))
+
+    def erro(self, numero, erros):
+        self.resultado['erros'].append({'linha': numero, 'erros': erros})
+
+    def validar(self, lote):
+        validos = []
+        for numero, dados, erro in lote:
+            if erro is not None:
+                self.erro(numero, erro)
+                continue
+            try:
+                dados = self.serializer.run_validation(dados)
+            except ValidationError as exc:
+                self.erro(numero, exc.detail)
+                continue
+            if dados['username'] in self.usernames:
+                self.erro(numero, {'username': ['Repetido no arquivo.']})
+            elif dados['email'] in self.emails:
+                self.erro(numero, {'email': ['Repetido no arquivo.']})
+            else:
+                self.usernames.add(dados['username'])
+                self.emails.add(dados['email'])
+                validos.append((numero, dados))
+
+        # Uma consulta por tabela para o lote inteiro
+        usernames = set(User.objects.filter(
+            username__in=[dados['username'] for _, dados in validos]).values_list('username', flat=True))
+        emails = set(Cliente.all_objects.filter(
+            email__in=[dados['email'] for _, dados in validos]).values_list('email', flat=True))
+        novos = []
+        for numero, dados in validos:
+            if dados['username'] in usernames:
+                self.erro(numero, {'username': ['Já existe um usuário com este username.']})
+            elif dados['email'] in emails:
+                self.erro(numero, {'email': ['Já existe um cliente com este email.']})
+            else:
+                novos.append((numero, dados))
+        return novos
+
+    def gravar(self, novos):
+        if self.dry_run:
+            return len(novos)
+        senhas = [dados['password'] for _, dados in novos if 'password' in dados]
+        hashes = iter(self.hash_senhas(senhas))
+        usuarios, perfis, clientes = [], [], []
+        for _, dados in novos:
+            usuario = User(username=dados['username'], email=dados['email'],
+                           first_name=dados.get('first_name', ''), last_name=dados.get('last_name', ''))
+            if 'password' in dados:
+                usuario.password = next(hashes)
+            elif 'password_hash' in dados:
+                usuario.password = dados['password_hash']
+            else:
+                usuario.set_unusable_password()
+            perfil = Perfil(usuario=usuario, tipo=Perfil.CLIENTE,
+                            telefone=dados.get('telefone'), data_nascimento=dados.get('data_nascimento'))
+            nome = dados.get('nome') or f"{dados.get('first_name', '')} {dados.get('last_name', '')}".strip()
+            cliente = Cliente(
+                nome=nome or dados['username'], email=dados['email'], perfil=perfil,
+                telefone=dados.get('telefone'), data_nascimento=dados.get('data_nascimento'),
+                altura=dados.get('altura'), peso=dados.get('peso'), tipo_plano_id=dados.get('tipo_plano'),
+                data_inicio_plano=dados.get('data_inicio_plano'), data_fim_plano=dados.get('data_fim_plano'),
+                renovacao_automatica=dados.get('renovacao_automatica', False),
+            )
+            usuarios.append(usuario)
+            perfis.append(perfil)
+            clientes.append(cliente)
+
+        try:
+            with transaction.atomic():
+                # Cada bulk_create preenche os ids usados nas FKs do seguinte
+                User.objects.bulk_create(usuarios)
+                Perfil.objects.bulk_create(perfis)
+                Cliente.objects.bulk_create(clientes)
+        except IntegrityError:
+            # Conflito com uma gravação concorrente: o lote inteiro é desfeito
+            for numero, _ in novos:
+                self.erro(numero, {'non_field_errors': ['Conflito ao gravar o lote; importe a linha novamente.']})
+            return 0
+        return len(clientes)
+
+    def importar(self, linhas):
+        inicio = time.perf_counter()
+        lote = []
+        try:
+            for linha in linhas:
+                lote.append(linha)
+                if len(lote) == self.lote:
+                    self.processar_lote(lote)
+                    lote = []
+            if lote:
+                self.processar_lote(lote)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+        if self.resultado['importados'] and not self.dry_run:
+            # bulk_create não dispara signals
+            invalidate_model(Perfil)
+            invalidate_model(Cliente)
+        self.resultado['erros'].sort(key=lambda erro: erro['linha'])
+        self.resultado['tempo'] = time.perf_counter() - inicio
+        return self.resultado
+
+    def processar_lote(self, lote):
+        inicio = time.perf_counter()
+        self.resultado['linhas'] += len(lote)
+        self.resultado['importados'] += self.gravar(self.validar(lote))
+        if self.progresso is not None:
+            self.progresso(self.resultado['linhas'], self.resultado['importados'], time.perf_counter() - inicio)
+
+
+def importar_clientes(arquivo, formato, **opcoes):
+    """Importa o arquivo e devolve {'linhas', 'importados', 'erros', 'tempo'}."""
+    return ImportadorClientes(**opcoes).importar(ler_linhas(arquivo, formato))
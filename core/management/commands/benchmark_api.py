@@ -0,0 +1,268 @@
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+from collections import Counter
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import metricas
+from core.cache import immediate_invalidation
+from core.api.v1.authentication import add_principal_claims
+from core.api.v1.routers import router
+from core.massa import gerar_massa
+from core.models import Perfil
+
+PREFIXO = 'benchmark-api'
+PAPEIS = [Perfil.ADMIN, Perfil.NUTRICIONISTA, Perfil.PERSONAL, Perfil.CLIENTE]
+
+# Roteiros de escrita (--escrita): (prefixo, action) -> corpo da requisição, a partir dos alvos e do número
+# da requisição. Rotas de escrita sem roteiro (update completo, destroy, importar) não são medidas.
+ESCRITAS = {
+    ('treinos', 'create'): lambda alvos, n: {'nome': f'Treino {n}', 'descricao': 'Benchmark', 'duracao': 60,
+                                             'cliente': alvos['Cliente']},
+    ('dietas', 'create'): lambda alvos, n: {'nome': f'Dieta {n}', 'descricao': 'Benchmark', 'calorias': 2200,
+                                            'cliente': alvos['Cliente']},
+    ('tipos-plano', 'create'): lambda alvos, n: {'nome': f'Plano {n}', 'descricao': 'Benchmark', 'preco': '79.90',
+                                                 'duracao_dias': 30},
+    ('clientes', 'create'): lambda alvos, n: {'nome': f'Cliente {n}', 'email': f'cliente{n}@{PREFIXO}.test'},
+    ('historico-treinos', 'create'): lambda alvos, n: {'cliente': alvos['Cliente'], 'treino': alvos['Treino'],
+                                                       'data_inicio': '2025-01-01'},
+    ('historico-dietas', 'create'): lambda alvos, n: {'cliente': alvos['Cliente'], 'dieta': alvos['Dieta'],
+                                                      'data_inicio': '2025-01-01'},
+    ('exercicios', 'create'): lambda alvos, n: {'nome': f'Exercício {n}', 'descricao': '3x12',
+                                                'treino': alvos['Treino']},
+    ('exercicios', 'bulk'): lambda alvos, n: [{'nome': f'Exercício {n}-{i}', 'descricao': '3x12',
+                                               'treino': alvos['Treino']} for i in range(10)],
+    ('refeicoes', 'create'): lambda alvos, n: {'nome': f'Refeição {n}', 'descricao': 'Benchmark', 'calorias': 300,
+                                               'dieta': alvos['Dieta']},
+    ('refeicoes', 'bulk'): lambda alvos, n: [{'nome': f'Refeição {n}-{i}', 'descricao': 'Benchmark',
+                                              'calorias': 300, 'dieta': alvos['Dieta']} for i in range(10)],
+    ('trocas-exercicios', 'create'): lambda alvos, n: {'cliente': alvos['Cliente'], 'motivo': 'Benchmark',
+                                                       'exercicio_antigo': alvos['Exercicio'],
+                                                       'exercicio_novo': alvos['Exercicio']},
+    ('trocas-refeicoes', 'create'): lambda alvos, n: {'cliente': alvos['Cliente'], 'motivo': 'Benchmark',
+                                                      'refeicao_antiga': alvos['Refeicao'],
+                                                      'refeicao_nova': alvos['Refeicao']},
+    ('usuarios', 'create'): lambda alvos, n: {'username': f'{PREFIXO}-novo-{n}', 'email': f'novo{n}@{PREFIXO}.test'},
+    ('treinos', 'partial_update'): lambda alvos, n: {'duracao': 45 + n % 30},
+    ('dietas', 'partial_update'): lambda alvos, n: {'calorias': 2000 + n % 500},
+    ('tipos-plano', 'partial_update'): lambda alvos, n: {'descricao': f'Revisão {n}'},
+    ('clientes', 'partial_update'): lambda alvos, n: {'peso': 70 + n % 20},
+    ('historico-treinos', 'partial_update'): lambda alvos, n: {'observacoes': f'Revisão {n}'},
+    ('historico-dietas', 'partial_update'): lambda alvos, n: {'observacoes': f'Revisão {n}'},
+    ('exercicios', 'partial_update'): lambda alvos, n: {'descricao': f'{3 + n % 3}x12'},
+    ('refeicoes', 'partial_update'): lambda alvos, n: {'calorias': 300 + n % 200},
+    ('trocas-exercicios', 'partial_update'): lambda alvos, n: {'motivo': f'Revisão {n}'},
+    ('trocas-refeicoes', 'partial_update'): lambda alvos, n: {'motivo': f'Revisão {n}'},
+    ('usuarios', 'partial_update'): lambda alvos, n: {'first_name': f'Nome {n}'},
+    ('perfis', 'partial_update'): lambda alvos, n: {'telefone': f'(11) 9{n % 10 ** 8:08d}'},
+}
+METODOS_ESCRITA = {'post', 'patch'}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Mede latência (p50/p95), vazão e consultas de todas as rotas do router para cada papel '
+            '(admin, nutricionista, personal, cliente) sobre uma massa de dados determinística gerada dentro '
+            'de uma transação desfeita ao final (o banco não é alterado). O resultado é salvo em JSON para '
+            'comparação entre commits (--comparar).')
+
+    def add_arguments(self, parser):
+        prefixos = [prefix for prefix, _, _ in router.registry]
+        parser.add_argument('--clientes', type=int, default=10_000,
+                            help='Clientes gerados; com treinos, dietas, históricos e trocas, ~40 linhas por cliente')
+        parser.add_argument('--semente', type=int, default=0, help='Semente do gerador de dados')
+        parser.add_argument('--requisicoes', type=int, default=20, help='Requisições medidas por cenário')
+        parser.add_argument('--aquecimento', type=int, default=2, help='Requisições descartadas por cenário')
+        parser.add_argument('--rotas', nargs='+', choices=prefixos, default=prefixos)
+        parser.add_argument('--papeis', nargs='+', choices=PAPEIS, default=PAPEIS)
+        parser.add_argument('--escrita', action='store_true',
+                            help='Inclui os roteiros de criação e alteração parcial (desfeitos com a transação)')
+        parser.add_argument('--sem-cache', action='store_true',
+                            help='Varia a query string para que o cache de respostas nunca seja usado')
+        parser.add_argument('--saida', help='Arquivo JSON do relatório (padrão: benchmark-api-<commit>.json)')
+        parser.add_argument('--comparar', help='Relatório JSON anterior para comparar com esta execução')
+
+    def handle(self, *args, **options):
+        base = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as arquivo:
+                    base = json.load(arquivo)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Não foi possível ler {options["comparar"]}: {exc}')
+
+        commit = self.get_commit()
+        # Respostas 403/404 são esperadas em parte dos cenários; o log de cada uma só atrapalharia a leitura
+        logger = logging.getLogger('django.request')
+        nivel = logger.level
+        logger.setLevel(logging.ERROR)
+        try:
+            # A amostragem do ProfilingMiddleware substituiria a medição feita aqui
+            # A transação nunca é confirmada: as escritas invalidam o cache sem esperar o commit
+            with transaction.atomic(), override_settings(FITTRACK_PROFILING_SAMPLE_RATE=0), immediate_invalidation():
+                massa = gerar_massa(options['clientes'], options['semente'], PREFIXO, self.stdout.write)
+                resultados = self.medir(massa, options)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            logger.setLevel(nivel)
+
+        relatorio = {
+            'commit': commit,
+            'data': timezone.now().isoformat(),
+            'banco': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'parametros': {chave: options[chave] for chave in ('clientes', 'semente', 'requisicoes', 'aquecimento',
+                                                                 'escrita', 'sem_cache')},
+            'massa': massa.contagem,
+            'cenarios': resultados,
+        }
+        saida = options['saida'] or f'benchmark-api-{commit or "sem-commit"}.json'
+        with open(saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Relatório salvo em {saida}'))
+        if base is not None:
+            self.comparar(base, relatorio)
+
+    def get_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def get_host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        return hosts[0] if hosts else 'localhost'
+
+    def cenarios(self, massa, options):
+        """(prefixo, action, método, url, corpo) de cada rota, na ordem do router."""
+        alvos = {model.__name__: pk for model, pk in massa.alvos.items()}
+        cenarios = []
+        for prefix, viewset, basename in router.registry:
+            if prefix not in options['rotas']:
+                continue
+            model = getattr(getattr(viewset, 'queryset', None), 'model', None)
+            for route in router.get_routes(viewset):
+                kwargs = {}
+                if route.detail:
+                    if model is None:
+                        continue
+                    lookup = getattr(viewset, 'lookup_url_kwarg', None) or getattr(viewset, 'lookup_field', 'pk')
+                    kwargs[lookup] = massa.alvos[model]
+                url = reverse(route.name.format(basename=basename), kwargs=kwargs)
+                for metodo, action in router.get_method_map(viewset, route.mapping).items():
+                    if metodo == 'get':
+                        cenarios.append((prefix, action, metodo, url, None))
+                    elif metodo in METODOS_ESCRITA and options['escrita'] and (prefix, action) in ESCRITAS:
+                        roteiro = ESCRITAS[prefix, action]
+                        cenarios.append((prefix, action, metodo, url, lambda n, roteiro=roteiro: roteiro(alvos, n)))
+        return cenarios
+
+    def requisitar(self, client, metodo, url, corpo, numero, sem_cache):
+        if corpo is not None:
+            argumentos = (url, json.dumps(corpo(numero)), 'application/json')
+        else:
+            argumentos = (url, {'_': numero} if sem_cache else None)
+        with metricas.perfilar() as amostra:
+            inicio = time.perf_counter()
+            response = getattr(client, metodo)(*argumentos)
+            if response.streaming:
+                # Exportações: as consultas acontecem enquanto o corpo é enviado
+                for _ in response.streaming_content:
+                    pass
+            latencia = time.perf_counter() - inicio
+        return response.status_code, latencia, amostra
+
+    def medir(self, massa, options):
+        host = self.get_host()
+        clients = {}
+        for papel in options['papeis']:
+            usuario = massa.usuarios[papel]
+            token = add_principal_claims(RefreshToken.for_user(usuario), usuario).access_token
+            clients[papel] = Client(HTTP_HOST=host, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        self.stdout.write(f"{'rota':<40}{'papel':<15}{'status':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+                          f"{'consultas':>10}")
+        resultados = []
+        numero = 0
+        for prefix, action, metodo, url, corpo in self.cenarios(massa, options):
+            for papel, client in clients.items():
+                for _ in range(options['aquecimento']):
+                    numero += 1
+                    self.requisitar(client, metodo, url, corpo, numero, options['sem_cache'])
+                latencias, consultas, banco, status = [], [], [], Counter()
+                inicio = time.perf_counter()
+                for _ in range(options['requisicoes']):
+                    numero += 1
+                    codigo, latencia, amostra = self.requisitar(client, metodo, url, corpo, numero,
+                                                                options['sem_cache'])
+                    status[codigo] += 1
+                    latencias.append(latencia)
+                    consultas.append(amostra.consultas)
+                    banco.append(amostra.tempo_banco)
+                total = time.perf_counter() - inicio
+                p95 = statistics.quantiles(latencias, n=20)[-1] if len(latencias) > 1 else latencias[0]
+                resultado = {
+                    'rota': prefix, 'action': action, 'metodo': metodo.upper(), 'url': url, 'papel': papel,
+                    'status': {str(codigo): quantidade for codigo, quantidade in sorted(status.items())},
+                    'requisicoes': len(latencias),
+                    'req_s': round(len(latencias) / total, 1),
+                    'p50_ms': round(statistics.median(latencias) * 1000, 2),
+                    'p95_ms': round(p95 * 1000, 2),
+                    'consultas': round(statistics.mean(consultas), 1),
+                    'consultas_max': max(consultas),
+                    'banco_ms': round(statistics.mean(banco) * 1000, 2),
+                }
+                resultados.append(resultado)
+                self.stdout.write(
+                    f"{f'{metodo.upper()} {prefix}.{action}':<40}{papel:<15}{status.most_common(1)[0][0]:>8}"
+                    f"{resultado['req_s']:>8.0f}{resultado['p50_ms']:>9.1f}{resultado['p95_ms']:>9.1f}"
+                    f"{resultado['consultas']:>10.1f}"
+                )
+        return resultados
+
+    def comparar(self, base, relatorio):
+        def chave(cenario):
+            return cenario['metodo'], cenario['rota'], cenario['action'], cenario['papel']
+
+        anteriores = {chave(cenario): cenario for cenario in base['cenarios']}
+        self.stdout.write(f"\nComparação com {base.get('commit') or 'relatório anterior'} "
+                          f"({base['parametros']['clientes']} clientes, semente {base['parametros']['semente']})")
+        diferentes = [chave for chave, valor in relatorio['parametros'].items()
+                      if base['parametros'].get(chave) != valor]
+        if diferentes or base.get('banco') != relatorio['banco']:
+            self.stdout.write(self.style.WARNING(
+                f"Execuções não comparáveis diretamente: diferem em {', '.join(diferentes) or 'banco'}"))
+        self.stdout.write(f"{'rota':<40}{'papel':<15}{'p50 ms':>18}{'p95 ms':>18}{'consultas':>14}")
+        for cenario in relatorio['cenarios']:
+            anterior = anteriores.get(chave(cenario))
+            if anterior is None:
+                continue
+            linha = (f"{cenario['metodo'] + ' ' + cenario['rota'] + '.' + cenario['action']:<40}{cenario['papel']:<15}"
+                     f"{self.delta(anterior['p50_ms'], cenario['p50_ms']):>18}"
+                     f"{self.delta(anterior['p95_ms'], cenario['p95_ms']):>18}"
+                     f"{anterior['consultas']:>6.1f} -> {cenario['consultas']:<4.1f}")
+            if cenario['consultas'] > anterior['consultas']:
+                linha = self.style.WARNING(linha)
+            self.stdout.write(linha)
+
+    def delta(self, antes, depois):
+        variacao = f'{(depois - antes) / antes * 100:+.0f}%' if antes else ''
+        return f'{depois:.1f} ({variacao})' if variacao else f'{depois:.1f}'
@@ -0,0 +1,138 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.api.v1.authentication import add_principal_claims
+from core.api.v1.routers import async_routes
+from core.models import Cliente, Dieta, Exercicio, Perfil, Refeicao, Treino
+
+PREFIXO = 'benchmark-asgi'
+MODOS = {'sync': '/api/v1/', 'async': '/api/v1/async/'}
+
+
+class Command(BaseCommand):
+    help = ('Compara, sob carga concorrente, as rotas síncronas (/api/v1/) e as assíncronas (/api/v1/async/) '
+            'chamando a aplicação ASGI no próprio processo. A massa de dados é removida ao final.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=200, help='Clientes gerados (com treino e dieta)')
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições por rota, modo e concorrência')
+        parser.add_argument('--concorrencia', type=int, nargs='+', default=[1, 10, 50],
+                            help='Conexões simultâneas')
+        parser.add_argument('--rotas', nargs='+', choices=[prefix for prefix, _ in async_routes],
+                            default=[prefix for prefix, _ in async_routes])
+        parser.add_argument('--sem-cache', action='store_true',
+                            help='Varia a query string para que o cache de respostas nunca seja usado')
+
+    def handle(self, *args, **options):
+        if settings.DATABASES['default']['NAME'] == ':memory:':
+            raise CommandError('Requer um banco compartilhado entre conexões (não funciona com SQLite em memória).')
+        try:
+            token, ids = self.gerar_massa(options['clientes'])
+            cenarios = []
+            for prefix in options['rotas']:
+                cenarios += [(f'{prefix}/', [f'{prefix}/']),
+                             (f'{prefix}/<id>/', [f'{prefix}/{pk}/' for pk in ids[prefix]])]
+            # Um event loop próprio, como um servidor ASGI: visões síncronas rodam em uma thread por requisição
+            asyncio.run(self.medir(cenarios, token, options))
+        finally:
+            User.objects.filter(username__startswith=PREFIXO).delete()
+            Cliente.all_objects.filter(email__endswith=f'@{PREFIXO}.test').delete()
+
+    def gerar_massa(self, quantidade):
+        inicio = time.perf_counter()
+        usuario = User.objects.create(username=f'{PREFIXO}-admin')
+        Perfil.objects.create(usuario=usuario, tipo=Perfil.ADMIN)
+        clientes = Cliente.objects.bulk_create([
+            Cliente(nome=f'Cliente {i}', email=f'cliente{i}@{PREFIXO}.test') for i in range(quantidade)
+        ])
+        treinos = Treino.objects.bulk_create([
+            Treino(nome=f'Treino {c.pk}', descricao='', duracao=60, cliente=c) for c in clientes
+        ])
+        dietas = Dieta.objects.bulk_create([
+            Dieta(nome=f'Dieta {c.pk}', descricao='', calorias=2000, cliente=c) for c in clientes
+        ])
+        exercicios = Exercicio.objects.bulk_create([
+            Exercicio(nome=f'Exercício {i}', descricao='', treino=t) for t in treinos for i in range(5)
+        ])
+        refeicoes = Refeicao.objects.bulk_create([
+            Refeicao(nome=f'Refeição {i}', descricao='', calorias=400, dieta=d) for d in dietas for i in range(5)
+        ])
+        self.stdout.write(f'Massa: {quantidade} clientes gerados em {time.perf_counter() - inicio:.2f}s')
+        ids = {
+            'treinos': [obj.pk for obj in treinos],
+            'dietas': [obj.pk for obj in dietas],
+            'exercicios': [obj.pk for obj in exercicios],
+            'refeicoes': [obj.pk for obj in refeicoes],
+            'clientes': [obj.pk for obj in clientes],
+        }
+        return str(add_principal_claims(RefreshToken.for_user(usuario), usuario).access_token), ids
+
+    def get_host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        return hosts[0] if hosts else 'localhost'
+
+    async def requisitar(self, app, path, query, headers):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': headers, 'client': ('127.0.0.1', 0), 'server': (self.get_host(), 80),
+        }
+        corpo_enviado = False
+        resposta = {}
+
+        async def receive():
+            nonlocal corpo_enviado
+            if not corpo_enviado:
+                corpo_enviado = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # O cliente nunca desconecta; o handler cancela esta espera ao terminar
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                resposta['status'] = message['status']
+
+        inicio = time.perf_counter()
+        await app(scope, receive, send)
+        return resposta.get('status'), time.perf_counter() - inicio
+
+    async def cenario(self, app, paths, headers, total, concorrencia, sem_cache):
+        numeros = iter(range(total))
+        latencias = []
+        erros = 0
+
+        async def conexao():
+            nonlocal erros
+            for numero in numeros:
+                query = f'_={numero}' if sem_cache else ''
+                status, latencia = await self.requisitar(app, paths[numero % len(paths)], query, headers)
+                latencias.append(latencia)
+                erros += status != 200
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(conexao() for _ in range(concorrencia)))
+        return latencias, erros, time.perf_counter() - inicio
+
+    async def medir(self, cenarios, token, options):
+        app = ASGIHandler()
+        headers = [(b'host', self.get_host().encode()), (b'authorization', f'Bearer {token}'.encode())]
+        self.stdout.write(f"{'rota':<24}{'modo':<7}{'conc':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'erros':>7}")
+        for rota, paths in cenarios:
+            for concorrencia in options['concorrencia']:
+                for modo, base in MODOS.items():
+                    latencias, erros, total = await self.cenario(
+                        app, [base + path for path in paths], headers,
+                        options['requisicoes'], concorrencia, options['sem_cache'],
+                    )
+                    p95 = statistics.quantiles(latencias, n=20)[-1] if len(latencias) > 1 else latencias[0]
+                    self.stdout.write(
+                        f'{rota:<24}{modo:<7}{concorrencia:>5}{len(latencias) / total:>9.0f}'
+                        f'{statistics.median(latencias) * 1000:>9.1f}{p95 * 1000:>9.1f}{erros:>7}'
+                    )
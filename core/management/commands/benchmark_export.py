@@ -0,0 +1,87 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.api.v1.viewsets import HistoricoTreinoViewSet
+from core.models import Cliente, HistoricoTreino, Perfil, Treino
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Mede a exportação em streaming de /historico-treinos/export/ sobre uma massa de dados '
+            'gerada dentro de uma transação desfeita ao final (o banco não é alterado)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=1_000_000, help='Registros de histórico gerados')
+        parser.add_argument('--formato', nargs='+', default=['ndjson', 'csv'], choices=['ndjson', 'csv'])
+        parser.add_argument('--memoria', action='store_true',
+                            help='Mede o pico de memória com tracemalloc (deixa a exportação mais lenta)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                usuario = self.gerar_massa(options['linhas'])
+                for formato in options['formato']:
+                    self.medir(usuario, formato, options['linhas'], options['memoria'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def gerar_massa(self, linhas):
+        inicio = time.perf_counter()
+        usuario = User.objects.create(username='benchmark-export-admin', is_superuser=True)
+        Perfil.objects.create(usuario=usuario, tipo=Perfil.ADMIN)
+        cliente = Cliente.objects.create(nome='Benchmark', email='benchmark-export@fittrack.test')
+        treino = Treino.objects.create(nome='Treino', descricao='', duracao=60, cliente=cliente)
+        base = min(linhas, 10_000)
+        HistoricoTreino.objects.bulk_create([
+            HistoricoTreino(cliente=cliente, treino=treino, data_inicio='2025-01-01', observacoes=f'linha {i}')
+            for i in range(base)
+        ])
+        # O restante é gerado duplicando no próprio banco as linhas já inseridas (INSERT ... SELECT)
+        q = connection.ops.quote_name
+        tabela = q(HistoricoTreino._meta.db_table)
+        colunas = ', '.join(q(field.column) for field in HistoricoTreino._meta.concrete_fields if not field.primary_key)
+        total = base
+        with connection.cursor() as cursor:
+            while total < linhas:
+                quantidade = min(total, linhas - total)
+                cursor.execute(f'INSERT INTO {tabela} ({colunas}) SELECT {colunas} FROM {tabela} '
+                               f'WHERE {q("cliente_id")} = %s LIMIT %s', [cliente.pk, quantidade])
+                total += quantidade
+        self.stdout.write(f'Massa: {linhas} linhas geradas em {time.perf_counter() - inicio:.2f}s')
+        return usuario
+
+    def medir(self, usuario, formato, linhas, memoria):
+        request = APIRequestFactory().get('/api/v1/historico-treinos/export/', {'formato': formato})
+        force_authenticate(request, user=usuario)
+        view = HistoricoTreinoViewSet.as_view({'get': 'export'})
+
+        if memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        response = view(request)
+        primeiro_bloco = None
+        tamanho = 0
+        for bloco in response.streaming_content:
+            if primeiro_bloco is None:
+                primeiro_bloco = time.perf_counter() - inicio
+            tamanho += len(bloco)
+        total = time.perf_counter() - inicio
+        pico = None
+        if memoria:
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        resumo = (f'{formato}: {linhas} linhas, {tamanho / 1_048_576:.1f} MiB em {total:.2f}s '
+                  f'({linhas / total:,.0f} linhas/s, primeiro bloco em {(primeiro_bloco or 0) * 1000:.0f}ms)')
+        if pico is not None:
+            resumo += f', pico de memória {pico / 1_048_576:.1f} MiB'
+        self.stdout.write(self.style.SUCCESS(resumo))
@@ -0,0 +1,69 @@
+import io
+import timeit
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.api.v1 import renderers
+from core.api.v1.parsers import FastJSONParser
+from core.api.v1.renderers import FastJSONRenderer
+from core.api.v1.serializers import ClienteSerializer
+from core.models import Cliente, Perfil, TipoPlano
+
+
+class Command(BaseCommand):
+    help = ('Compara JSONRenderer/JSONParser do DRF com FastJSONRenderer/FastJSONParser sobre uma '
+            'listagem de ClienteSerializer montada em memória (não acessa o banco)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=1000, help='Clientes na listagem')
+        parser.add_argument('--repeticoes', type=int, default=50)
+
+    def gerar_dados(self, linhas):
+        plano = TipoPlano(id=1, nome='Plano Pro', preco='99.90', duracao_dias=30)
+        agora = timezone.now()
+        clientes = []
+        for i in range(1, linhas + 1):
+            usuario = User(id=i, username=f'cliente{i}', email=f'cliente{i}@fittrack.test',
+                           first_name='João', last_name=f'Silva {i}')
+            perfil = Perfil(id=i, usuario=usuario, tipo=Perfil.CLIENTE, telefone='(11) 99999-0000',
+                            data_nascimento=date(1990, 1, 1) + timedelta(days=i))
+            clientes.append(Cliente(
+                id=i, nome=f'João da Silva {i}', email=usuario.email, telefone=perfil.telefone,
+                data_nascimento=perfil.data_nascimento, altura=175.5, peso=80.25 + i % 10,
+                tipo_plano=plano, data_inicio_plano=agora.date(), data_fim_plano=agora.date() + timedelta(days=30),
+                data_ultimo_treino=agora.date(), trocas_exercicios_restantes=3, perfil=perfil,
+                created_at=agora, updated_at=agora,
+            ))
+        return ClienteSerializer(clientes, many=True).data
+
+    def medir(self, nome, funcao, repeticoes, referencia=None):
+        tempo = min(timeit.repeat(funcao, number=1, repeat=repeticoes))
+        resumo = f'{nome:<34}{tempo * 1000:>9.2f} ms'
+        if referencia is not None:
+            resumo += f'  ({referencia / tempo:.1f}x)'
+        self.stdout.write(resumo)
+        return tempo
+
+    def handle(self, *args, **options):
+        data = self.gerar_dados(options['linhas'])
+        repeticoes = options['repeticoes']
+        conteudo = JSONRenderer().render(data)
+        if FastJSONRenderer().render(data) != conteudo:
+            self.stderr.write(self.style.ERROR('Saídas diferentes!'))
+            return
+        self.stdout.write(f"{options['linhas']} clientes, {len(conteudo) / 1024:.0f} KiB, "
+                          f"orjson {'disponível' if renderers.orjson is not None else 'indisponível'}")
+
+        base = self.medir('render JSONRenderer', lambda: JSONRenderer().render(data), repeticoes)
+        self.medir('render FastJSONRenderer', lambda: FastJSONRenderer().render(data), repeticoes, base)
+        base = self.medir('parse JSONParser', lambda: JSONParser().parse(io.BytesIO(conteudo)), repeticoes)
+        self.medir('parse FastJSONParser', lambda: FastJSONParser().parse(io.BytesIO(conteudo)), repeticoes, base)
+        base = self.medir('serializer + JSONRenderer',
+                          lambda: JSONRenderer().render(self.gerar_dados(options['linhas'])), max(repeticoes // 10, 3))
+        self.medir('serializer + FastJSONRenderer',
+                   lambda: FastJSONRenderer().render(self.gerar_dados(options['linhas'])), max(repeticoes // 10, 3), base)
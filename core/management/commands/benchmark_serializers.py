@@ -0,0 +1,103 @@
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.api.v1.mixins import ValuesListMixin
+from core.api.v1.routers import router
+from core.api.v1.serializers import ValuesListSerializer
+from core.models import (Cliente, Dieta, Exercicio, HistoricoDieta, HistoricoTreino, Perfil, Refeicao, TipoPlano,
+                         Treino, TrocaExercicio, TrocaRefeicao)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compara, por linha, o serializer de cada listagem (modelos + ModelSerializer) com o '
+            'ValuesListSerializer (linhas de .values()) sobre uma massa de dados gerada dentro de uma '
+            'transação desfeita ao final (o banco não é alterado)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=1000, help='Clientes gerados (com treino, dieta etc.)')
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--rotas', nargs='+', help='Prefixos das rotas (padrão: todas as listagens)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.gerar_massa(options['linhas'])
+                self.medir(options['rotas'], options['repeticoes'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def gerar_massa(self, quantidade):
+        plano = TipoPlano.objects.create(nome='Plano Pro', descricao='', preco='99.90', duracao_dias=30)
+        usuarios = User.objects.bulk_create([
+            User(username=f'benchmark-serializers-{i}', first_name='João', last_name=f'Silva {i}')
+            for i in range(quantidade)
+        ])
+        perfis = Perfil.objects.bulk_create([
+            Perfil(usuario=usuario, tipo=Perfil.CLIENTE, telefone='(11) 99999-0000') for usuario in usuarios
+        ])
+        clientes = Cliente.objects.bulk_create([
+            Cliente(nome=f'João da Silva {i}', email=f'benchmark-serializers-{i}@fittrack.test', perfil=perfil,
+                    tipo_plano=plano, altura=175.5, peso=80.25 + i % 10)
+            for i, perfil in enumerate(perfis)
+        ])
+        treinos = Treino.objects.bulk_create([
+            Treino(nome='Treino A', descricao='Peito e tríceps', duracao=60, cliente=c) for c in clientes
+        ])
+        dietas = Dieta.objects.bulk_create([
+            Dieta(nome='Dieta', descricao='Hipertrofia', calorias=2500, cliente=c) for c in clientes
+        ])
+        exercicios = Exercicio.objects.bulk_create([
+            Exercicio(nome=nome, descricao='', treino=t) for t in treinos for nome in ('Supino', 'Flexão')
+        ])
+        refeicoes = Refeicao.objects.bulk_create([
+            Refeicao(nome=nome, descricao='', calorias=600, dieta=d) for d in dietas for nome in ('Almoço', 'Jantar')
+        ])
+        HistoricoTreino.objects.bulk_create([
+            HistoricoTreino(cliente=t.cliente, treino=t, data_inicio='2025-01-01') for t in treinos
+        ])
+        HistoricoDieta.objects.bulk_create([
+            HistoricoDieta(cliente=d.cliente, dieta=d, data_inicio='2025-01-01') for d in dietas
+        ])
+        TrocaExercicio.objects.bulk_create([
+            TrocaExercicio(cliente=c, exercicio_antigo=exercicios[2 * i], exercicio_novo=exercicios[2 * i + 1],
+                           motivo='Dor no ombro') for i, c in enumerate(clientes)
+        ])
+        TrocaRefeicao.objects.bulk_create([
+            TrocaRefeicao(cliente=c, refeicao_antiga=refeicoes[2 * i], refeicao_nova=refeicoes[2 * i + 1],
+                          motivo='Alergia') for i, c in enumerate(clientes)
+        ])
+
+    def medir(self, rotas, repeticoes):
+        self.stdout.write(f"{'rota':<20}{'linhas':>7}{'serializer µs':>15}{'values µs':>11}{'ganho':>8}")
+        for prefix, viewset, _ in router.registry:
+            if not issubclass(viewset, ValuesListMixin) or (rotas and prefix not in rotas):
+                continue
+            serializer_class = viewset.serializer_class
+            queryset = viewset.queryset.model._default_manager.order_by('pk')
+            plan = viewset(action='list').get_query_plan()
+            objetos = plan.apply(queryset) if plan is not None else queryset
+            values_serializer = ValuesListSerializer(serializer_class())
+            linhas = values_serializer.values(queryset)
+
+            def serializer():
+                return serializer_class(list(objetos.all()), many=True).data
+
+            def values():
+                return values_serializer.to_representation(linhas.all())
+
+            if JSONRenderer().render(serializer()) != JSONRenderer().render(values()):
+                self.stderr.write(self.style.ERROR(f'{prefix}: saídas diferentes!'))
+                continue
+            total = queryset.count()
+            base = min(timeit.repeat(serializer, number=1, repeat=repeticoes)) / total
+            rapido = min(timeit.repeat(values, number=1, repeat=repeticoes)) / total
+            self.stdout.write(f'{prefix:<20}{total:>7}{base * 1e6:>15.1f}{rapido * 1e6:>11.1f}{base / rapido:>7.1f}x')
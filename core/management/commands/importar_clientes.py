@@ -0,0 +1,48 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import FORMATOS, LOTE, importar_clientes
+
+
+class Command(BaseCommand):
+    help = 'Importa clientes (usuário, perfil e cliente) em lote a partir de um arquivo CSV ou NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo')
+        parser.add_argument('--formato', choices=FORMATOS, help='Padrão: pela extensão do arquivo')
+        parser.add_argument('--lote', type=int, default=LOTE, help='Linhas por lote')
+        parser.add_argument('--processos', type=int, help='Processos para o hash das senhas; padrão: CPUs disponíveis')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas valida, sem gravar')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or os.path.splitext(options['arquivo'])[1].lstrip('.').lower()
+        if formato not in FORMATOS:
+            raise CommandError('Não foi possível identificar o formato; use --formato csv|ndjson.')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser positivo.')
+
+        def progresso(linhas, importados, tempo):
+            self.stdout.write(f'{linhas} linhas lidas, {importados} importadas (lote em {tempo:.2f}s)')
+
+        try:
+            arquivo = open(options['arquivo'], 'rb')
+        except OSError as exc:
+            raise CommandError(f'Não foi possível abrir o arquivo: {exc}')
+        with arquivo:
+            resultado = importar_clientes(
+                arquivo, formato,
+                lote=options['lote'],
+                processos=options['processos'],
+                dry_run=options['dry_run'],
+                progresso=progresso if options['verbosity'] > 0 else None,
+            )
+
+        for erro in resultado['erros']:
+            self.stderr.write(f"Linha {erro['linha']}: {erro['erros']}")
+        por_minuto = resultado['linhas'] / resultado['tempo'] * 60 if resultado['tempo'] else 0
+        verbo = 'validadas' if options['dry_run'] else 'importadas'
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['importados']} de {resultado['linhas']} linhas {verbo} em {resultado['tempo']:.2f}s "
+            f"({por_minuto:,.0f} linhas/min), {len(resultado['erros'])} com erro"
+        ))
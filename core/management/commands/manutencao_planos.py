@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.rotinas import CHUNK_SIZE, executar_manutencao_planos
+
+
+class Command(BaseCommand):
+    help = 'Zera trocas com período encerrado e marca clientes com treino/dieta desatualizados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='Data de referência (AAAA-MM-DD); padrão: hoje')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Clientes por faixa de id')
+        parser.add_argument('--forcar', action='store_true', help='Executa novamente mesmo se já concluída na data')
+
+    def handle(self, *args, **options):
+        hoje = None
+        if options['data']:
+            try:
+                hoje = date.fromisoformat(options['data'])
+            except ValueError:
+                raise CommandError('Data inválida, use o formato AAAA-MM-DD.')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size deve ser positivo.')
+
+        def progresso(faixa, total, ultimo_id, tempo):
+            self.stdout.write(f'Faixa {faixa}/{total} (até id {ultimo_id}) em {tempo:.3f}s')
+
+        resultado = executar_manutencao_planos(
+            hoje=hoje,
+            chunk_size=options['chunk_size'],
+            forcar=options['forcar'],
+            progresso=progresso if options['verbosity'] > 0 else None,
+        )
+        if resultado['ja_concluida']:
+            self.stdout.write('Rotina já concluída nesta data; use --forcar para executar novamente.')
+            return
+        for nome, linhas in sorted(resultado['atualizados'].items()):
+            self.stdout.write(f'{nome}: {linhas}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído: {resultado['faixas']} faixas em {resultado['tempo']:.3f}s"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.totais import recalcular_totais
+
+
+class Command(BaseCommand):
+    help = ('Recalcula total_calorias e quantidade_refeicoes das dietas a partir das refeições não removidas '
+            '(uma única UPDATE, apenas nas dietas divergentes)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dietas', type=int, nargs='+', help='Ids das dietas (padrão: todas)')
+
+    def handle(self, *args, **options):
+        corrigidas = recalcular_totais(options['dietas'])
+        self.stdout.write(self.style.SUCCESS(f'{corrigidas} dieta(s) corrigida(s)'))
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.rotinas import DIAS_AVISO, VENCIMENTOS_CHUNK_SIZE, processar_vencimentos
+
+
+class Command(BaseCommand):
+    help = 'Avisa planos a vencer e renova ou suspende os planos vencidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', help='Data de referência (AAAA-MM-DD); padrão: hoje')
+        parser.add_argument('--dias', type=int, default=DIAS_AVISO, help='Janela de aviso, em dias, para planos a vencer')
+        parser.add_argument('--chunk-size', type=int, default=VENCIMENTOS_CHUNK_SIZE, help='Clientes por lote')
+
+    def handle(self, *args, **options):
+        hoje = None
+        if options['data']:
+            try:
+                hoje = date.fromisoformat(options['data'])
+            except ValueError:
+                raise CommandError('Data inválida, use o formato AAAA-MM-DD.')
+        if options['chunk_size'] < 1 or options['dias'] < 0:
+            raise CommandError('--chunk-size deve ser positivo e --dias não pode ser negativo.')
+
+        def progresso(etapa, processados, tempo):
+            self.stdout.write(f'{etapa}: {processados} processados (lote em {tempo:.3f}s)')
+
+        resultado = processar_vencimentos(
+            hoje=hoje,
+            dias_aviso=options['dias'],
+            chunk_size=options['chunk_size'],
+            progresso=progresso if options['verbosity'] > 0 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Concluído em {resultado['tempo']:.3f}s: {resultado['expirando']} a vencer, "
+            f"{resultado['renovados']} renovados, {resultado['suspensos']} suspensos"
+        ))
@@ -0,0 +1,184 @@
+"""
+Massa de dados sintética e determinística para benchmarks.
+
+`gerar_massa` cria, com bulk_create, clientes com usuário e perfil e, para cada
+um, treinos com exercícios, dietas com refeições, históricos e trocas, com
+quantidades sorteadas a partir de `semente` (a mesma semente gera os mesmos
+dados). Também cria um usuário de cada papel (admin, nutricionista, personal e
+cliente); o usuário cliente é dono do primeiro cliente gerado, que recebe a
+quantidade máxima de treinos, dietas e trocas.
+"""
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+
+from core.cache import invalidate_model
+from core.models import (Cliente, Dieta, Exercicio, HistoricoDieta, HistoricoTreino, Perfil, Refeicao,
+                         TipoPlano, Treino, TrocaExercicio, TrocaRefeicao)
+from core.totais import recalcular_totais
+
+DATA_BASE = date(2025, 1, 1)
+LOTE = 2000
+NOMES = ('Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Fábio', 'Gabriela', 'Heitor', 'Isabela', 'João', 'Larissa',
+         'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Tiago', 'Vitória', 'Wagner')
+SOBRENOMES = ('Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Almeida', 'Ferreira', 'Rocha')
+TREINOS = ('Treino A - Peito e tríceps', 'Treino B - Costas e bíceps', 'Treino C - Pernas', 'Funcional',
+           'Cardio intervalado', 'Mobilidade')
+EXERCICIOS = ('Supino reto', 'Supino inclinado', 'Crucifixo', 'Tríceps corda', 'Puxada frontal', 'Remada curvada',
+              'Rosca direta', 'Agachamento livre', 'Leg press', 'Cadeira extensora', 'Stiff', 'Panturrilha',
+              'Prancha', 'Burpee', 'Corrida na esteira', 'Bicicleta')
+DIETAS = ('Hipertrofia', 'Emagrecimento', 'Manutenção', 'Low carb', 'Vegetariana')
+REFEICOES = (('Café da manhã', 450), ('Lanche da manhã', 200), ('Almoço', 750), ('Lanche da tarde', 250),
+             ('Jantar', 600), ('Ceia', 150))
+MOTIVOS = ('Dor no ombro', 'Equipamento indisponível', 'Alergia', 'Preferência alimentar', 'Falta de tempo')
+
+
+@dataclass
+class Massa:
+    usuarios: dict = field(default_factory=dict)  # papel -> User
+    alvos: dict = field(default_factory=dict)  # modelo -> pk de um registro do usuário cliente
+    contagem: dict = field(default_factory=dict)  # nome do modelo -> linhas geradas
+
+
+def _papeis(prefixo):
+    usuarios = {}
+    for papel in (Perfil.ADMIN, Perfil.NUTRICIONISTA, Perfil.PERSONAL):
+        usuario = User.objects.create(username=f'{prefixo}-{papel}', email=f'{papel}@{prefixo}.test')
+        Perfil.objects.create(usuario=usuario, tipo=papel)
+        usuarios[papel] = usuario
+    return usuarios
+
+
+def gerar_massa(clientes=10_000, semente=0, prefixo='massa', saida=None):
+    """
+    Gera a massa e devolve uma `Massa`. `saida` (ex.: self.stdout.write)
+    recebe o andamento. Os nomes de usuário e e-mails usam `prefixo`.
+    """
+    rng = random.Random(semente)
+    inicio = time.perf_counter()
+    massa = Massa(usuarios=_papeis(prefixo))
+
+    planos = TipoPlano.objects.bulk_create([
+        TipoPlano(nome='Plano Básico', descricao='Acesso a treinos e dietas', preco='59.90', duracao_dias=30),
+        TipoPlano(nome='Plano Pro', descricao='Trocas e acompanhamento', preco='99.90', duracao_dias=90,
+                  intervalo_atualizacao_treino_dieta=30, limite_trocas_exercicios=3, limite_trocas_refeicoes=3),
+        TipoPlano(nome='Plano Anual', descricao='Trocas ilimitadas', preco='899.90', duracao_dias=365,
+                  trocas_ilimitadas=True),
+    ])
+
+    nomes = [f'{rng.choice(NOMES)} {rng.choice(SOBRENOMES)}' for _ in range(clientes)]
+    usuarios = User.objects.bulk_create([
+        User(username=f'{prefixo}-cliente-{i}', email=f'cliente{i}@{prefixo}.test',
+             first_name=nome.split()[0], last_name=nome.split()[1])
+        for i, nome in enumerate(nomes)
+    ], batch_size=LOTE)
+    perfis = Perfil.objects.bulk_create([
+        Perfil(usuario=usuario, tipo=Perfil.CLIENTE, telefone=f'(11) 9{rng.randrange(10 ** 7, 10 ** 8)}',
+               data_nascimento=DATA_BASE - timedelta(days=rng.randrange(18 * 365, 70 * 365)))
+        for usuario in usuarios
+    ], batch_size=LOTE)
+    objetos = []
+    for i, (nome, perfil) in enumerate(zip(nomes, perfis)):
+        plano = rng.choice(planos)
+        inicio_plano = DATA_BASE - timedelta(days=rng.randrange(plano.duracao_dias))
+        objetos.append(Cliente(
+            nome=nome, email=f'cliente{i}@{prefixo}.test', telefone=perfil.telefone,
+            data_nascimento=perfil.data_nascimento, altura=round(rng.uniform(150, 200), 1),
+            peso=round(rng.uniform(50, 120), 2), tipo_plano=plano, data_inicio_plano=inicio_plano,
+            data_fim_plano=inicio_plano + timedelta(days=plano.duracao_dias), perfil=perfil,
+            data_ultimo_treino=inicio_plano, data_ultima_dieta=inicio_plano,
+            trocas_exercicios_restantes=plano.limite_trocas_exercicios,
+            trocas_refeicoes_restantes=plano.limite_trocas_refeicoes,
+            renovacao_automatica=rng.random() < 0.3,
+        ))
+    clientes_criados = Cliente.objects.bulk_create(objetos, batch_size=LOTE)
+    massa.usuarios[Perfil.CLIENTE] = usuarios[0]
+
+    # O cliente do usuário cliente recebe o máximo de cada tipo, para que as listagens dele tenham várias linhas
+    primeiro = clientes_criados[0]
+    treinos = Treino.objects.bulk_create([
+        Treino(nome=rng.choice(TREINOS), descricao='Séries e repetições conforme a planilha',
+               duracao=rng.choice((30, 45, 60, 75, 90)), cliente=cliente)
+        for cliente in clientes_criados for _ in range(4 if cliente is primeiro else rng.randint(1, 4))
+    ], batch_size=LOTE)
+    exercicios = Exercicio.objects.bulk_create([
+        Exercicio(nome=nome, descricao=f'{rng.randint(3, 5)}x{rng.choice((8, 10, 12, 15))}', treino=treino)
+        for treino in treinos for nome in rng.sample(EXERCICIOS, rng.randint(4, 8))
+    ], batch_size=LOTE)
+    dietas = Dieta.objects.bulk_create([
+        Dieta(nome=rng.choice(DIETAS), descricao='Ajustada ao objetivo do plano',
+              calorias=rng.randrange(1500, 3500, 50), cliente=cliente)
+        for cliente in clientes_criados for _ in range(3 if cliente is primeiro else rng.randint(1, 3))
+    ], batch_size=LOTE)
+    refeicoes = Refeicao.objects.bulk_create([
+        Refeicao(nome=nome, descricao='Conforme o cardápio', calorias=calorias + rng.randrange(-50, 51, 10),
+                 dieta=dieta)
+        for dieta in dietas for nome, calorias in REFEICOES[:rng.randint(3, len(REFEICOES))]
+    ], batch_size=LOTE)
+    recalcular_totais()
+
+    historicos_treino = HistoricoTreino.objects.bulk_create([
+        HistoricoTreino(cliente_id=treino.cliente_id, treino=treino,
+                        data_inicio=DATA_BASE - timedelta(days=30 * (semana + 1)),
+                        data_fim=DATA_BASE - timedelta(days=30 * semana), observacoes='Concluído')
+        for treino in treinos for semana in range(rng.randint(1, 3))
+    ], batch_size=LOTE)
+    historicos_dieta = HistoricoDieta.objects.bulk_create([
+        HistoricoDieta(cliente_id=dieta.cliente_id, dieta=dieta,
+                       data_inicio=DATA_BASE - timedelta(days=30 * (mes + 1)),
+                       data_fim=DATA_BASE - timedelta(days=30 * mes), observacoes='Seguida')
+        for dieta in dietas for mes in range(rng.randint(1, 3))
+    ], batch_size=LOTE)
+
+    exercicios_por_cliente = {}
+    for exercicio in exercicios:
+        exercicios_por_cliente.setdefault(exercicio.treino.cliente_id, []).append(exercicio)
+    refeicoes_por_cliente = {}
+    for refeicao in refeicoes:
+        refeicoes_por_cliente.setdefault(refeicao.dieta.cliente_id, []).append(refeicao)
+    trocas_exercicios, trocas_refeicoes = [], []
+    for cliente in clientes_criados:
+        for _ in range(2 if cliente is primeiro else rng.randint(0, 2)):
+            antigo, novo = rng.sample(exercicios_por_cliente[cliente.pk], 2)
+            trocas_exercicios.append(TrocaExercicio(cliente=cliente, exercicio_antigo=antigo, exercicio_novo=novo,
+                                                    motivo=rng.choice(MOTIVOS)))
+        for _ in range(2 if cliente is primeiro else rng.randint(0, 2)):
+            antiga, nova = rng.sample(refeicoes_por_cliente[cliente.pk], 2)
+            trocas_refeicoes.append(TrocaRefeicao(cliente=cliente, refeicao_antiga=antiga, refeicao_nova=nova,
+                                                  motivo=rng.choice(MOTIVOS)))
+    trocas_exercicios = TrocaExercicio.objects.bulk_create(trocas_exercicios, batch_size=LOTE)
+    trocas_refeicoes = TrocaRefeicao.objects.bulk_create(trocas_refeicoes, batch_size=LOTE)
+
+    # bulk_create não dispara signals: as respostas em cache deixam de valer
+    for model in (Perfil, TipoPlano, Cliente, Treino, Exercicio, Dieta, Refeicao, HistoricoTreino, HistoricoDieta,
+                  TrocaExercicio, TrocaRefeicao):
+        invalidate_model(model, all_clientes=True)
+    invalidate_model(User)
+
+    massa.alvos = {
+        User: usuarios[0].pk,
+        Perfil: perfis[0].pk,
+        TipoPlano: primeiro.tipo_plano_id,
+        Cliente: primeiro.pk,
+        Treino: treinos[0].pk,
+        Exercicio: exercicios[0].pk,
+        Dieta: dietas[0].pk,
+        Refeicao: refeicoes[0].pk,
+        HistoricoTreino: historicos_treino[0].pk,
+        HistoricoDieta: historicos_dieta[0].pk,
+        TrocaExercicio: trocas_exercicios[0].pk,
+        TrocaRefeicao: trocas_refeicoes[0].pk,
+    }
+    massa.contagem = {
+        'Cliente': len(clientes_criados), 'Treino': len(treinos), 'Exercicio': len(exercicios),
+        'Dieta': len(dietas), 'Refeicao': len(refeicoes), 'HistoricoTreino': len(historicos_treino),
+        'HistoricoDieta': len(historicos_dieta), 'TrocaExercicio': len(trocas_exercicios),
+        'TrocaRefeicao': len(trocas_refeicoes),
+    }
+    if saida is not None:
+        saida(f'Massa: {sum(massa.contagem.values())} linhas (semente {semente}) '
+              f'geradas em {time.perf_counter() - inicio:.1f}s')
+    return massa
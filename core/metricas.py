@@ -0,0 +1,289 @@
+"""
+Perfil das requisições por endpoint (viewset e action, ex.: TreinoViewSet.list).
+
+Com FITTRACK_PROFILING_SAMPLE_RATE > 0, o ProfilingMiddleware mede essa fração
+das requisições: quantidade e tempo das consultas SQL, tempo de serialização
+(serializers da API e renderer JSON, descontado o tempo de banco) e tempo
+total. Um mesmo SQL (com as listas de parâmetros normalizadas) executado
+FITTRACK_PROFILING_DUPLICATE_THRESHOLD vezes ou mais na mesma requisição é
+contado como suspeita de N+1. Os agregados ficam na memória do processo e são
+expostos no formato texto do Prometheus em /api/v1/metricas/ (administradores).
+
+Com a amostragem desligada (padrão), o custo é uma comparação por requisição e
+a leitura de uma ContextVar por consulta e por objeto serializado.
+"""
+import random
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from core.cache import stats as cache_stats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Limites (segundos) do histograma de tempo total
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SQL_MAX = 300
+
+_LISTA_PARAMETROS = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+_COLUNAS = re.compile(r'^SELECT (DISTINCT )?.+? FROM ', re.DOTALL)
+_ESPACOS = re.compile(r'\s+')
+
+_amostra = ContextVar('fittrack_amostra', default=None)
+_lock = threading.Lock()
+_endpoints = {}
+_duplicadas = Counter()
+
+
+class Amostra:
+    """Medições da requisição amostrada em andamento."""
+    __slots__ = ('consultas', 'tempo_banco', 'tempo_serializacao', 'sqls', 'serializando')
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempo_serializacao = 0.0
+        self.sqls = Counter()
+        self.serializando = False
+
+
+class MetricasEndpoint:
+    """Agregados das requisições amostradas de um endpoint."""
+
+    def __init__(self):
+        self.requisicoes = 0
+        self.status = Counter()
+        self.buckets = [0] * len(BUCKETS)
+        self.tempo_total = 0.0
+        self.consultas = 0
+        self.consultas_max = 0
+        self.tempo_banco = 0.0
+        self.tempo_serializacao = 0.0
+
+    def adicionar(self, status_code, amostra, tempo_total):
+        self.requisicoes += 1
+        self.status[status_code] += 1
+        for indice, limite in enumerate(BUCKETS):
+            if tempo_total <= limite:
+                self.buckets[indice] += 1
+                break
+        self.tempo_total += tempo_total
+        self.consultas += amostra.consultas
+        self.consultas_max = max(self.consultas_max, amostra.consultas)
+        self.tempo_banco += amostra.tempo_banco
+        self.tempo_serializacao += amostra.tempo_serializacao
+
+
+def normalizar_sql(sql):
+    """
+    SQL sem a lista de colunas do SELECT e sem variação no tamanho das listas
+    de parâmetros (IN, VALUES) e nos espaços.
+    """
+    sql = _COLUNAS.sub(r'SELECT \1... FROM ', _LISTA_PARAMETROS.sub('(...)', sql.strip()))
+    return _ESPACOS.sub(' ', sql)
+
+
+def amostrar():
+    taxa = settings.FITTRACK_PROFILING_SAMPLE_RATE
+    return taxa > 0 and (taxa >= 1 or random.random() < taxa)
+
+
+@contextmanager
+def perfilar():
+    """Mede o bloco como uma requisição amostrada; devolve a Amostra."""
+    amostra = Amostra()
+    token = _amostra.set(amostra)
+    try:
+        yield amostra
+    finally:
+        _amostra.reset(token)
+
+
+def medir_serializacao(funcao, *args):
+    """
+    Chama `funcao(*args)` somando o tempo à serialização da requisição
+    amostrada; chamadas aninhadas (serializers dentro de serializers) contam
+    uma vez só.
+    """
+    amostra = _amostra.get()
+    if amostra is None or amostra.serializando:
+        return funcao(*args)
+    amostra.serializando = True
+    tempo_banco = amostra.tempo_banco
+    inicio = perf_counter()
+    try:
+        return funcao(*args)
+    finally:
+        # Consultas disparadas pelo serializer (N+1) contam como banco
+        amostra.tempo_serializacao += perf_counter() - inicio - (amostra.tempo_banco - tempo_banco)
+        amostra.serializando = False
+
+
+def _executar(execute, sql, params, many, context):
+    amostra = _amostra.get()
+    if amostra is None:
+        return execute(sql, params, many, context)
+    inicio = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        amostra.tempo_banco += perf_counter() - inicio
+        amostra.consultas += 1
+        amostra.sqls[sql] += 1
+
+
+def _instalar(sender, connection, **kwargs):
+    # Cada conexão (uma por thread) recebe o wrapper ao conectar; na frente, para
+    # não ser removido pelo pop() de execute_wrapper() abertos antes da conexão
+    if _executar not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _executar)
+
+
+def connect_signals():
+    from django.db.backends.signals import connection_created
+    connection_created.connect(_instalar, dispatch_uid='fittrack-metricas-conexao')
+
+
+def endpoint_da_requisicao(request):
+    """Viewset e action (TreinoViewSet.list) ou nome da rota que atendeu a requisição."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'desconhecido'
+    view = match.func
+    initkwargs = getattr(view, 'view_initkwargs', None) or {}
+    viewset = initkwargs.get('viewset_class')
+    if viewset is not None:
+        # AsyncReadView (/api/v1/async/)
+        return f"{viewset.__name__}.{'retrieve' if initkwargs.get('detail') else 'list'}[async]"
+    cls = getattr(view, 'cls', None)
+    if cls is None:
+        return match.view_name or match._func_path
+    action = (getattr(view, 'actions', None) or {}).get(request.method.lower(), request.method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+def registrar(request, response, amostra, tempo_total):
+    endpoint = endpoint_da_requisicao(request)
+    repeticoes = Counter()
+    for sql, vezes in amostra.sqls.items():
+        repeticoes[normalizar_sql(sql)] += vezes
+    limiar = settings.FITTRACK_PROFILING_DUPLICATE_THRESHOLD
+    with _lock:
+        metricas = _endpoints.get(endpoint)
+        if metricas is None:
+            metricas = _endpoints[endpoint] = MetricasEndpoint()
+        metricas.adicionar(response.status_code, amostra, tempo_total)
+        for sql, vezes in repeticoes.items():
+            if vezes >= limiar:
+                _duplicadas[endpoint, sql[:SQL_MAX]] += 1
+
+
+def limpar():
+    with _lock:
+        _endpoints.clear()
+        _duplicadas.clear()
+
+
+class ProfilingMiddleware:
+    """Mede as requisições sorteadas pela amostragem; as demais passam direto."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not amostrar():
+            return self.get_response(request)
+        inicio = perf_counter()
+        with perfilar() as amostra:
+            response = self.get_response(request)
+        registrar(request, response, amostra, perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        if not amostrar():
+            return await self.get_response(request)
+        inicio = perf_counter()
+        # A ContextVar acompanha a requisição nas threads de sync_to_async
+        with perfilar() as amostra:
+            response = await self.get_response(request)
+        registrar(request, response, amostra, perf_counter() - inicio)
+        return response
+
+
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + '}'
+
+
+def exportar():
+    """Agregados do processo no formato texto do Prometheus."""
+    with _lock:
+        endpoints = sorted(_endpoints.items())
+        duplicadas = sorted(_duplicadas.items())
+        linhas = []
+
+        def metrica(nome, tipo, ajuda, amostras):
+            linhas.extend([f'# HELP {nome} {ajuda}', f'# TYPE {nome} {tipo}'])
+            linhas.extend(f'{nome_amostra}{rotulos} {valor}' for nome_amostra, rotulos, valor in amostras)
+
+        metrica('fittrack_profiling_sample_rate', 'gauge', 'Fração das requisições amostradas.',
+                [('fittrack_profiling_sample_rate', '', float(settings.FITTRACK_PROFILING_SAMPLE_RATE))])
+        metrica('fittrack_requests_total', 'counter', 'Requisições amostradas por endpoint e status.', [
+            ('fittrack_requests_total', _rotulos(endpoint=endpoint, status=status), quantidade)
+            for endpoint, metricas in endpoints for status, quantidade in sorted(metricas.status.items())
+        ])
+
+        duracao = []
+        for endpoint, metricas in endpoints:
+            acumulado = 0
+            for limite, quantidade in zip(BUCKETS, metricas.buckets):
+                acumulado += quantidade
+                duracao.append(('fittrack_request_duration_seconds_bucket',
+                                _rotulos(endpoint=endpoint, le=limite), acumulado))
+            duracao += [
+                ('fittrack_request_duration_seconds_bucket', _rotulos(endpoint=endpoint, le='+Inf'),
+                 metricas.requisicoes),
+                ('fittrack_request_duration_seconds_sum', _rotulos(endpoint=endpoint), metricas.tempo_total),
+                ('fittrack_request_duration_seconds_count', _rotulos(endpoint=endpoint), metricas.requisicoes),
+            ]
+        metrica('fittrack_request_duration_seconds', 'histogram', 'Tempo total da requisição.', duracao)
+
+        for nome, atributo, ajuda in (
+            ('fittrack_db_queries', 'consultas', 'Consultas SQL por requisição.'),
+            ('fittrack_db_duration_seconds', 'tempo_banco', 'Tempo em consultas SQL por requisição.'),
+            ('fittrack_serialization_duration_seconds', 'tempo_serializacao',
+             'Tempo em serializers e renderer por requisição, sem o tempo de banco.'),
+        ):
+            amostras = []
+            for endpoint, metricas in endpoints:
+                amostras += [(f'{nome}_sum', _rotulos(endpoint=endpoint), getattr(metricas, atributo)),
+                             (f'{nome}_count', _rotulos(endpoint=endpoint), metricas.requisicoes)]
+            metrica(nome, 'summary', ajuda, amostras)
+
+        metrica('fittrack_db_queries_max', 'gauge', 'Maior número de consultas em uma requisição.', [
+            ('fittrack_db_queries_max', _rotulos(endpoint=endpoint), metricas.consultas_max)
+            for endpoint, metricas in endpoints
+        ])
+        metrica('fittrack_duplicate_sql_total', 'counter',
+                'Requisições em que o mesmo SQL se repetiu acima do limiar (suspeita de N+1).', [
+                    ('fittrack_duplicate_sql_total', _rotulos(endpoint=endpoint, sql=sql), quantidade)
+                    for (endpoint, sql), quantidade in duplicadas
+                ])
+        metrica('fittrack_cache_events_total', 'counter', 'Eventos do cache de respostas (core.cache).', [
+            ('fittrack_cache_events_total', _rotulos(event=evento), quantidade)
+            for evento, quantidade in cache_stats.items()
+        ])
+    return '\n'.join(linhas) + '\n'
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_remove_cliente_dieta_atual_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicodieta',
+            index=models.Index(fields=['cliente', 'created_at', 'id'], name='core_histdieta_cli_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicotreino',
+            index=models.Index(fields=['cliente', 'created_at', 'id'], name='core_histtreino_cli_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trocaexercicio',
+            index=models.Index(fields=['cliente', 'created_at', 'id'], name='core_trocaexerc_cli_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trocarefeicao',
+            index=models.Index(fields=['cliente', 'created_at', 'id'], name='core_trocaref_cli_crt_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_historico_troca_cliente_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='historicodieta',
+            name='core_histdieta_cli_crt_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='historicotreino',
+            name='core_histtreino_cli_crt_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='trocaexercicio',
+            name='core_trocaexerc_cli_crt_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='trocarefeicao',
+            name='core_trocaref_cli_crt_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dieta',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente'], name='core_dieta_cli_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exercicio',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['treino'], name='core_exerc_treino_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicodieta',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente', 'data_inicio'], name='core_histdieta_cli_ini_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicodieta',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente', 'created_at', 'id'], name='core_histdieta_cli_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicotreino',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente', 'data_inicio'], name='core_histtreino_cli_ini_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicotreino',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente', 'created_at', 'id'], name='core_histtreino_cli_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='refeicao',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['dieta'], name='core_refeicao_dieta_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treino',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente'], name='core_treino_cli_alive_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trocaexercicio',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente', 'data_troca'], name='core_trocaexerc_cli_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trocaexercicio',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente', 'created_at', 'id'], name='core_trocaexerc_cli_crt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trocarefeicao',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente', 'data_troca'], name='core_trocaref_cli_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trocarefeicao',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['cliente', 'created_at', 'id'], name='core_trocaref_cli_crt_idx'),
+        ),
+    ]
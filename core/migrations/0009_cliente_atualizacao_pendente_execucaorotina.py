@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_soft_delete_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='dieta_atualizacao_pendente',
+            field=models.BooleanField(default=False, help_text='Dieta atual ultrapassou o intervalo de atualização do plano'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='treino_atualizacao_pendente',
+            field=models.BooleanField(default=False, help_text='Treino atual ultrapassou o intervalo de atualização do plano'),
+        ),
+        migrations.CreateModel(
+            name='ExecucaoRotina',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=50)),
+                ('data_referencia', models.DateField()),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('resultado', models.JSONField(blank=True, default=dict)),
+                ('iniciada_em', models.DateTimeField(auto_now_add=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('nome', 'data_referencia'), name='core_execucaorotina_unica')],
+            },
+        ),
+    ]
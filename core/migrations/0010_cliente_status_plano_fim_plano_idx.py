@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_cliente_atualizacao_pendente_execucaorotina'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='renovacao_automatica',
+            field=models.BooleanField(default=False, help_text='Renova o plano por mais `duracao_dias` ao vencer, em vez de suspender'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='status_plano',
+            field=models.CharField(choices=[('ativo', 'Ativo'), ('suspenso', 'Suspenso')], default='ativo', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['data_fim_plano'], name='core_cliente_fim_plano_idx'),
+        ),
+    ]
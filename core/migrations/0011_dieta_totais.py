@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais(apps, schema_editor):
+    # Mesmo cálculo de core.totais.recalcular_totais, com os modelos históricos
+    Dieta = apps.get_model('core', 'Dieta')
+    Refeicao = apps.get_model('core', 'Refeicao')
+    refeicoes = Refeicao.objects.filter(dieta=OuterRef('pk'), deleted_at__isnull=True).order_by().values('dieta')
+    Dieta.objects.update(
+        total_calorias=Coalesce(Subquery(refeicoes.annotate(valor=Sum('calorias')).values('valor')), Value(0)),
+        quantidade_refeicoes=Coalesce(Subquery(refeicoes.annotate(valor=Count('pk')).values('valor')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_cliente_status_plano_fim_plano_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dieta',
+            name='quantidade_refeicoes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dieta',
+            name='total_calorias',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(preencher_totais, migrations.RunPython.noop),
+    ]
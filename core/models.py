@@ -1,11 +1,48 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import User
+from django.utils import timezone
+from core.cache import invalidate_model, is_cliente_scoped
+from core.signals import removidos_logicamente
+
+# Predicado dos índices parciais: coincide com o filtro aplicado por SoftDeleteManager
+NOT_DELETED = Q(deleted_at__isnull=True)
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self):
+        # updated_at também muda para que a remoção apareça na sincronização incremental
+        now = timezone.now()
+        cliente_ids = []
+        if is_cliente_scoped(self.model):
+            field = 'pk' if self.model._meta.model_name == 'cliente' else 'cliente_id'
+            cliente_ids = list(self.values_list(field, flat=True).distinct())
+        with transaction.atomic():
+            ids = []
+            if removidos_logicamente.has_listeners(self.model):
+                ids = list(self.filter(deleted_at__isnull=True).values_list('pk', flat=True))
+            count = self.update(deleted_at=now, updated_at=now)
+            if ids:
+                removidos_logicamente.send(sender=self.model, ids=ids)
+        # update() não dispara signals; invalida o cache explicitamente
+        invalidate_model(self.model, cliente_ids)
+        return count
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    # Exclui registros removidos logicamente; use `all_objects` para incluí-los
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    objects = SoftDeleteManager()
+    all_objects = models.Manager.from_queryset(SoftDeleteQuerySet)()
+
     class Meta:
         abstract = True
 
@@ -30,6 +67,19 @@ class Perfil(BaseModel):
     def __str__(self):
         return f"{self.usuario.username} - {self.get_tipo_display()}"
 
+
+def tocar_perfil_do_usuario(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """
+    post_save de User: o usuário aparece nas respostas de perfil e cliente, mas
+    não tem updated_at; o do perfil muda para que ETag, cache e sincronização
+    vejam a alteração.
+    """
+    if created or raw or (update_fields is not None and set(update_fields) <= {'last_login', 'password'}):
+        return
+    Perfil.all_objects.filter(usuario_id=instance.pk).update(updated_at=timezone.now())
+    # update() não dispara signals
+    invalidate_model(Perfil)
+
 class TipoPlano(BaseModel):
     nome = models.CharField(max_length=100)  # ex: Mensal, Trimestral, Anual
     descricao = models.TextField()
@@ -52,6 +102,11 @@ class Treino(BaseModel):
     duracao = models.IntegerField()
     cliente = models.ForeignKey('Cliente', on_delete=models.CASCADE, related_name='treinos', null=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente'], condition=NOT_DELETED, name='core_treino_cli_alive_idx'),
+        ]
+
     def __str__(self):
         return self.nome
 
@@ -60,12 +115,28 @@ class Dieta(BaseModel):
     descricao = models.TextField()
     calorias = models.IntegerField()
     cliente = models.ForeignKey('Cliente', on_delete=models.CASCADE, related_name='dietas', null=True)
+    # Mantidos a partir das refeições não removidas (ver core/totais.py)
+    total_calorias = models.IntegerField(default=0)
+    quantidade_refeicoes = models.IntegerField(default=0)
     
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente'], condition=NOT_DELETED, name='core_dieta_cli_alive_idx'),
+        ]
+
     def __str__(self):
         return self.nome
     
 class Cliente(BaseModel):
+    PLANO_ATIVO = 'ativo'
+    PLANO_SUSPENSO = 'suspenso'
+
+    STATUS_PLANO_CHOICES = [
+        (PLANO_ATIVO, 'Ativo'),
+        (PLANO_SUSPENSO, 'Suspenso'),
+    ]
+
     nome = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     telefone = models.CharField(max_length=15, blank=True, null=True)
@@ -82,6 +153,15 @@ class Cliente(BaseModel):
     data_ultima_dieta = models.DateField(null=True, blank=True, help_text="Data em que a última dieta foi atribuída")
     trocas_exercicios_restantes = models.IntegerField(default=0, help_text="Número de trocas de exercícios restantes no período atual")
     trocas_refeicoes_restantes = models.IntegerField(default=0, help_text="Número de trocas de refeições restantes no período atual")
+    treino_atualizacao_pendente = models.BooleanField(default=False, help_text="Treino atual ultrapassou o intervalo de atualização do plano")
+    dieta_atualizacao_pendente = models.BooleanField(default=False, help_text="Dieta atual ultrapassou o intervalo de atualização do plano")
+    status_plano = models.CharField(max_length=20, choices=STATUS_PLANO_CHOICES, default=PLANO_ATIVO)
+    renovacao_automatica = models.BooleanField(default=False, help_text="Renova o plano por mais `duracao_dias` ao vencer, em vez de suspender")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['data_fim_plano'], condition=NOT_DELETED, name='core_cliente_fim_plano_idx'),
+        ]
     
     def __str__(self):
         return self.nome
@@ -94,6 +174,13 @@ class HistoricoTreino(BaseModel):
     data_fim = models.DateField(null=True, blank=True)
     observacoes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente', 'data_inicio'], condition=NOT_DELETED, name='core_histtreino_cli_ini_idx'),
+            # Paginação por cursor do histórico de um cliente
+            models.Index(fields=['cliente', 'created_at', 'id'], condition=NOT_DELETED, name='core_histtreino_cli_crt_idx'),
+        ]
+
     def __str__(self):
         return f"{self.cliente.nome} - {self.treino.nome}"
 
@@ -104,6 +191,13 @@ class HistoricoDieta(BaseModel):
     data_fim = models.DateField(null=True, blank=True)
     observacoes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente', 'data_inicio'], condition=NOT_DELETED, name='core_histdieta_cli_ini_idx'),
+            # Paginação por cursor do histórico de um cliente
+            models.Index(fields=['cliente', 'created_at', 'id'], condition=NOT_DELETED, name='core_histdieta_cli_crt_idx'),
+        ]
+
     def __str__(self):
         return f"{self.cliente.nome} - {self.dieta.nome} ({self.data_inicio})"
 
@@ -114,6 +208,11 @@ class Exercicio(BaseModel):
     descricao = models.TextField()
     treino = models.ForeignKey(Treino, on_delete=models.CASCADE, related_name='exercicios')
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['treino'], condition=NOT_DELETED, name='core_exerc_treino_alive_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nome} ({self.treino.nome})"
 
@@ -124,6 +223,16 @@ class Refeicao(BaseModel):
     calorias = models.IntegerField()
     dieta = models.ForeignKey(Dieta, on_delete=models.CASCADE, related_name='refeicoes')
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['dieta'], condition=NOT_DELETED, name='core_refeicao_dieta_alive_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Os totais da dieta são ajustados pelos signals de core/totais.py na mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.nome} ({self.dieta.nome})"
 
@@ -135,6 +244,13 @@ class TrocaExercicio(BaseModel):
     data_troca = models.DateField(auto_now_add=True)
     motivo = models.TextField()
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente', 'data_troca'], condition=NOT_DELETED, name='core_trocaexerc_cli_data_idx'),
+            # Paginação por cursor do histórico de um cliente
+            models.Index(fields=['cliente', 'created_at', 'id'], condition=NOT_DELETED, name='core_trocaexerc_cli_crt_idx'),
+        ]
+
     def __str__(self):
         return f"{self.cliente.nome} - {self.exercicio_antigo.nome} -> {self.exercicio_novo.nome}"
 
@@ -146,5 +262,33 @@ class TrocaRefeicao(BaseModel):
     data_troca = models.DateField(auto_now_add=True)
     motivo = models.TextField()
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente', 'data_troca'], condition=NOT_DELETED, name='core_trocaref_cli_data_idx'),
+            # Paginação por cursor do histórico de um cliente
+            models.Index(fields=['cliente', 'created_at', 'id'], condition=NOT_DELETED, name='core_trocaref_cli_crt_idx'),
+        ]
+
     def __str__(self):
         return f"{self.cliente.nome} - {self.refeicao_antiga.nome} -> {self.refeicao_nova.nome}"
+
+
+class ExecucaoRotina(models.Model):
+    """
+    Marcador de idempotência das rotinas periódicas: uma linha por rotina e data
+    de referência, com o último id processado para retomar a execução.
+    """
+    nome = models.CharField(max_length=50)
+    data_referencia = models.DateField()
+    ultimo_id = models.BigIntegerField(default=0)
+    resultado = models.JSONField(default=dict, blank=True)
+    iniciada_em = models.DateTimeField(auto_now_add=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['nome', 'data_referencia'], name='core_execucaorotina_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.nome} ({self.data_referencia})'
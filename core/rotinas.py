@@ -0,0 +1,234 @@
+"""
+Rotinas periódicas sobre os planos dos clientes.
+
+`executar_manutencao_planos` zera o saldo de trocas cujo período já terminou e
+marca (ou desmarca) os clientes cujo treino/dieta ultrapassou o
+`intervalo_atualizacao_treino_dieta` do plano. Tudo é feito com UPDATEs em lote
+juntando Cliente a TipoPlano, por faixas de id, sem carregar clientes em
+memória. Cada faixa é confirmada junto com o marcador em ExecucaoRotina: uma
+execução interrompida continua de onde parou e repetir a rotina na mesma data
+não altera nada.
+
+`processar_vencimentos` percorre os planos vencidos e a vencer com um cursor
+no servidor (`iterator(chunk_size)`), renova ou suspende em lote e emite os
+eventos de `core.signals`.
+
+Ambas podem ser agendadas via cron (`python manage.py manutencao_planos` e
+`python manage.py vencimentos_planos`) ou chamadas de qualquer agendador.
+"""
+import time
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Max, Min, Q
+from django.utils import timezone
+
+from core.cache import invalidate_model
+from core.models import Cliente, ExecucaoRotina, TipoPlano
+from core.rules import get_plan_rules
+from core.signals import plano_expirando, plano_renovado, plano_suspenso
+
+NOME = 'manutencao_planos'
+CHUNK_SIZE = 50000
+VENCIMENTOS_CHUNK_SIZE = 2000
+DIAS_AVISO = 7
+
+
+def _dias_antes(coluna):
+    """SQL de `data de referência - coluna` (dias), como data."""
+    if connection.vendor == 'sqlite':
+        return f"date(%s, '-' || {coluna} || ' days')"
+    return f'CAST(%s AS date) - {coluna}'
+
+
+def _sql_atualizacao():
+    """
+    Um único UPDATE por faixa, juntando Cliente às regras do plano: cada linha é
+    reescrita no máximo uma vez e só quando algum valor realmente muda.
+    """
+    q = connection.ops.quote_name
+    cliente, plano = q(Cliente._meta.db_table), q(TipoPlano._meta.db_table)
+    campos = []
+    condicoes = []
+    for contador, campo_data, pendente in (
+        ('trocas_exercicios_restantes', 'data_ultimo_treino', 'treino_atualizacao_pendente'),
+        ('trocas_refeicoes_restantes', 'data_ultima_dieta', 'dieta_atualizacao_pendente'),
+    ):
+        contador, data, pendente = q(contador), f'{cliente}.{q(campo_data)}', q(pendente)
+        encerrado = f'({data} IS NULL OR {data} < regras.fim_trocas)'
+        atrasado = f'(CASE WHEN {data} < regras.limite_atualizacao THEN TRUE ELSE FALSE END)'
+        campos += [
+            f'{contador} = CASE WHEN {encerrado} THEN 0 ELSE {cliente}.{contador} END',
+            f'{pendente} = {atrasado}',
+        ]
+        condicoes += [
+            f'({cliente}.{contador} > 0 AND {encerrado})',
+            f'{cliente}.{pendente} <> {atrasado}',
+        ]
+    return (
+        f'UPDATE {cliente} SET {", ".join(campos)}, {q("updated_at")} = %s '
+        f'FROM (SELECT {q("id")}, '
+        f'{_dias_antes(q("periodo_trocas_dias"))} AS fim_trocas, '
+        f'{_dias_antes(q("intervalo_atualizacao_treino_dieta"))} AS limite_atualizacao '
+        f'FROM {plano} WHERE {q("deleted_at")} IS NULL) regras '
+        f'WHERE {cliente}.{q("tipo_plano_id")} = regras.{q("id")} '
+        f'AND {cliente}.{q("deleted_at")} IS NULL '
+        f'AND {cliente}.{q("id")} BETWEEN %s AND %s '
+        f'AND ({" OR ".join(condicoes)})'
+    )
+
+
+def _atualizar_sem_plano(faixa, agora):
+    # Sem plano ativo não há período de trocas nem intervalo de atualização
+    sem_plano = Q(tipo_plano__isnull=True) | Q(tipo_plano__deleted_at__isnull=False)
+    alterado = (Q(trocas_exercicios_restantes__gt=0) | Q(trocas_refeicoes_restantes__gt=0)
+                | Q(treino_atualizacao_pendente=True) | Q(dieta_atualizacao_pendente=True))
+    return faixa.filter(sem_plano).filter(alterado).update(
+        trocas_exercicios_restantes=0, trocas_refeicoes_restantes=0,
+        treino_atualizacao_pendente=False, dieta_atualizacao_pendente=False,
+        updated_at=agora,
+    )
+
+
+def executar_manutencao_planos(hoje=None, chunk_size=CHUNK_SIZE, forcar=False, progresso=None):
+    """
+    Executa a rotina para a data `hoje` (padrão: data atual) e retorna um
+    dicionário com as linhas atualizadas por operação, as faixas processadas e
+    o tempo total. `progresso(faixa, total_faixas, ultimo_id, tempo)` é chamado
+    após cada faixa confirmada.
+    """
+    inicio_execucao = time.perf_counter()
+    hoje = hoje or timezone.now().date()
+    execucao, _ = ExecucaoRotina.objects.get_or_create(nome=NOME, data_referencia=hoje)
+    if execucao.concluida_em is not None and not forcar:
+        return {'ja_concluida': True, 'faixas': 0, 'atualizados': execucao.resultado, 'tempo': 0.0}
+    if forcar:
+        execucao.ultimo_id = 0
+        execucao.resultado = {}
+        execucao.concluida_em = None
+        execucao.save(update_fields=['ultimo_id', 'resultado', 'concluida_em'])
+
+    sql = _sql_atualizacao()
+    limites = Cliente.objects.aggregate(menor=Min('pk'), maior=Max('pk'))
+    faixas = []
+    if limites['menor'] is not None:
+        primeiro = max(limites['menor'], execucao.ultimo_id + 1)
+        faixas = list(range(primeiro, limites['maior'] + 1, chunk_size))
+
+    for numero, inicio in enumerate(faixas, start=1):
+        inicio_faixa = time.perf_counter()
+        fim = inicio + chunk_size - 1
+        with transaction.atomic():
+            # O lock no marcador impede que duas execuções simultâneas processem a mesma faixa
+            execucao = ExecucaoRotina.objects.select_for_update().get(pk=execucao.pk)
+            if execucao.ultimo_id >= fim:
+                continue
+            # updated_at também muda para que a alteração apareça na sincronização incremental
+            agora = timezone.now()
+            with connection.cursor() as cursor:
+                data = connection.ops.adapt_datefield_value(hoje)
+                cursor.execute(sql, [connection.ops.adapt_datetimefield_value(agora), data, data, inicio, fim])
+                com_plano = cursor.rowcount
+            sem_plano = _atualizar_sem_plano(Cliente.objects.filter(pk__range=(inicio, fim)), agora)
+            resultado = dict(execucao.resultado)
+            resultado['clientes_atualizados'] = resultado.get('clientes_atualizados', 0) + com_plano
+            resultado['clientes_sem_plano'] = resultado.get('clientes_sem_plano', 0) + sem_plano
+            execucao.ultimo_id = fim
+            execucao.resultado = resultado
+            execucao.save(update_fields=['ultimo_id', 'resultado'])
+        alterados = com_plano + sem_plano
+        if alterados:
+            # update() não dispara signals
+            invalidate_model(Cliente, all_clientes=True)
+        if progresso is not None:
+            progresso(numero, len(faixas), fim, time.perf_counter() - inicio_faixa)
+
+    execucao.concluida_em = timezone.now()
+    execucao.save(update_fields=['concluida_em'])
+    return {
+        'ja_concluida': False,
+        'faixas': len(faixas),
+        'atualizados': execucao.resultado,
+        'tempo': time.perf_counter() - inicio_execucao,
+    }
+
+
+def _lotes(queryset, chunk_size):
+    """Agrupa as linhas de um cursor no servidor em listas de até `chunk_size`."""
+    lote = []
+    for linha in queryset.iterator(chunk_size=chunk_size):
+        lote.append(linha)
+        if len(lote) == chunk_size:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _renovar_ou_suspender(lote, hoje, agora):
+    """Renova (agrupando por duração do plano) ou suspende os clientes vencidos do lote."""
+    por_duracao = defaultdict(list)
+    suspender = []
+    for cliente_id, tipo_plano_id, renovacao_automatica in lote:
+        rules = get_plan_rules(tipo_plano_id)
+        if renovacao_automatica and rules is not None and rules.duracao_dias > 0:
+            por_duracao[rules.duracao_dias].append(cliente_id)
+        else:
+            suspender.append(cliente_id)
+
+    # Relê com lock apenas os que continuam vencidos, ignorando clientes alterados desde a leitura
+    vencidos = Cliente.objects.filter(status_plano=Cliente.PLANO_ATIVO, data_fim_plano__lt=hoje)
+    renovados = []
+    with transaction.atomic():
+        for duracao, ids in por_duracao.items():
+            ids = list(vencidos.select_for_update().filter(pk__in=ids).values_list('id', flat=True))
+            Cliente.objects.filter(pk__in=ids).update(
+                data_inicio_plano=F('data_fim_plano') + timedelta(days=1),
+                data_fim_plano=F('data_fim_plano') + timedelta(days=duracao),
+                updated_at=agora,
+            )
+            renovados += ids
+        suspensos = list(vencidos.select_for_update().filter(pk__in=suspender).values_list('id', flat=True))
+        Cliente.objects.filter(pk__in=suspensos).update(status_plano=Cliente.PLANO_SUSPENSO, updated_at=agora)
+    return renovados, suspensos
+
+
+def processar_vencimentos(hoje=None, dias_aviso=DIAS_AVISO, chunk_size=VENCIMENTOS_CHUNK_SIZE, progresso=None):
+    """
+    Emite `plano_expirando` para planos ativos que vencem em até `dias_aviso`
+    dias e renova ou suspende os já vencidos. Retorna as contagens e o tempo
+    total; `progresso(etapa, processados, tempo)` é chamado após cada lote.
+    """
+    inicio_execucao = time.perf_counter()
+    hoje = hoje or timezone.now().date()
+    ativos = Cliente.objects.filter(status_plano=Cliente.PLANO_ATIVO).order_by('data_fim_plano', 'id')
+    resultado = {'expirando': 0, 'renovados': 0, 'suspensos': 0}
+
+    expirando = ativos.filter(data_fim_plano__range=(hoje, hoje + timedelta(days=dias_aviso)))
+    for lote in _lotes(expirando.values_list('id', flat=True), chunk_size):
+        inicio_lote = time.perf_counter()
+        plano_expirando.send(sender=Cliente, cliente_ids=lote, data_referencia=hoje)
+        resultado['expirando'] += len(lote)
+        if progresso is not None:
+            progresso('expirando', resultado['expirando'], time.perf_counter() - inicio_lote)
+
+    vencidos = ativos.filter(data_fim_plano__lt=hoje).values_list('id', 'tipo_plano_id', 'renovacao_automatica')
+    for lote in _lotes(vencidos, chunk_size):
+        inicio_lote = time.perf_counter()
+        renovados, suspensos = _renovar_ou_suspender(lote, hoje, timezone.now())
+        if renovados or suspensos:
+            # update() não dispara signals
+            invalidate_model(Cliente, all_clientes=True)
+        if renovados:
+            plano_renovado.send(sender=Cliente, cliente_ids=renovados, data_referencia=hoje)
+        if suspensos:
+            plano_suspenso.send(sender=Cliente, cliente_ids=suspensos, data_referencia=hoje)
+        resultado['renovados'] += len(renovados)
+        resultado['suspensos'] += len(suspensos)
+        if progresso is not None:
+            progresso('vencidos', resultado['renovados'] + resultado['suspensos'], time.perf_counter() - inicio_lote)
+
+    resultado['tempo'] = time.perf_counter() - inicio_execucao
+    return resultado
@@ -0,0 +1,86 @@
+"""
+Snapshot em memória das regras de negócio de todos os planos ativos.
+
+Carregado uma vez por processo e recarregado apenas quando a versão de
+TipoPlano no cache muda (qualquer escrita em TipoPlano incrementa essa versão
+via signals, no commit da transação), de modo que consultar as regras não
+acessa o banco. Como o
+cache local (locmem) não é compartilhado entre processos, o snapshot também é
+recarregado após MAX_AGE segundos.
+"""
+import threading
+import time
+from types import MappingProxyType
+
+from core.cache import get_versions
+from core.models import TipoPlano
+
+
+class PlanoRules:
+    __slots__ = ('id', 'nome', 'duracao_dias', 'intervalo_atualizacao_treino_dieta',
+                 'limite_trocas_exercicios', 'limite_trocas_refeicoes',
+                 'periodo_trocas_dias', 'trocas_ilimitadas')
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PlanoRules é imutável')
+
+    def __delattr__(self, name):
+        raise AttributeError('PlanoRules é imutável')
+
+    def __repr__(self):
+        return f'<PlanoRules {self.id} {self.nome}>'
+
+
+class PlanoRulesSnapshot:
+    __slots__ = ('version', 'plans', 'loaded_at')
+
+    def __init__(self, version, plans):
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'plans', MappingProxyType(plans))
+        object.__setattr__(self, 'loaded_at', time.monotonic())
+
+    def is_current(self, version):
+        return self.version == version and time.monotonic() - self.loaded_at < MAX_AGE
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PlanoRulesSnapshot é imutável')
+
+    def get(self, tipo_plano_id):
+        return self.plans.get(tipo_plano_id)
+
+
+MAX_AGE = 60
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def load_snapshot(version):
+    plans = {
+        values['id']: PlanoRules(**values)
+        for values in TipoPlano.objects.values(*PlanoRules.__slots__)
+    }
+    return PlanoRulesSnapshot(version, plans)
+
+
+def get_snapshot():
+    global _snapshot
+    version = get_versions([TipoPlano])[0]
+    snapshot = _snapshot
+    if snapshot is None or not snapshot.is_current(version):
+        with _lock:
+            if _snapshot is None or not _snapshot.is_current(version):
+                _snapshot = load_snapshot(version)
+            snapshot = _snapshot
+    return snapshot
+
+
+def get_plan_rules(tipo_plano_id):
+    """Regras do plano ativo `tipo_plano_id`, ou None se não existir ou estiver removido."""
+    if tipo_plano_id is None:
+        return None
+    return get_snapshot().get(tipo_plano_id)
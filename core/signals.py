@@ -0,0 +1,20 @@
+"""
+Eventos de negócio emitidos em lote pela rotina de vencimentos de planos.
+
+Todos são enviados com `sender=Cliente`, `cliente_ids` (lista de ids do lote)
+e `data_referencia`, depois que o lote foi confirmado no banco.
+
+`removidos_logicamente` é enviado por SoftDeleteQuerySet.soft_delete (que usa
+update() e não dispara post_save) com `sender=<modelo>` e `ids` dos registros
+removidos, dentro da mesma transação.
+"""
+from django.dispatch import Signal
+
+# Plano vence dentro da janela de aviso (reenviado a cada execução até vencer)
+plano_expirando = Signal()
+# Plano vencido renovado por mais `duracao_dias` do TipoPlano
+plano_renovado = Signal()
+# Plano vencido sem renovação automática (ou sem plano ativo) foi suspenso
+plano_suspenso = Signal()
+# Registros removidos logicamente em lote
+removidos_logicamente = Signal()
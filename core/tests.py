@@ -1,3 +1,1706 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.contrib.auth.hashers import make_password
+import collections
+import csv
+import io
+import json
+import os
+import tempfile
+import random
+import uuid
+import zoneinfo
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.db import connection, transaction
+import threading
+from unittest import skipUnless
 
-# Create your tests here.
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import cache as fittrack_cache, metricas, rules
+from core.importacao import importar_clientes
+from core.management.commands.benchmark_api import ESCRITAS
+from core.massa import gerar_massa
+from core.rotinas import executar_manutencao_planos, processar_vencimentos
+from core.signals import plano_expirando, plano_renovado, plano_suspenso
+from core.rules import get_plan_rules
+from core.trocas import EXERCICIO, TrocaNegada, consumir_troca
+from core.api.v1 import authentication, mixins
+from core.api.v1.authentication import add_principal_claims
+from core.api.v1.mixins import ValuesListMixin
+from core.api.v1.routers import router
+from core.api.v1.serializers import (ClienteDashboardSerializer, ExercicioSerializer, UnsupportedValuesField,
+                                      ValuesListSerializer)
+from core.api.v1.parsers import FastJSONParser
+from core.api.v1.renderers import FastJSONRenderer
+
+from core.models import (Treino, Dieta, TipoPlano, Cliente, HistoricoTreino,
+                        HistoricoDieta, Exercicio, Refeicao, TrocaExercicio, TrocaRefeicao, Perfil,
+                        ExecucaoRotina)
+
+
+class QueryCountTestMixin:
+    """Utilitários para verificar que o número de queries não cresce com o número de linhas."""
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400, response.content)
+        return len(ctx.captured_queries), ctx.captured_queries
+
+    def assertQueryCountStable(self, url, populate, method='get'):
+        populate(1)
+        baseline, _ = self.count_queries(method, url)
+        populate(9)
+        total, queries = self.count_queries(method, url)
+        sql = '\n'.join(q['sql'] for q in queries)
+        self.assertEqual(baseline, total, f'{url}: {baseline} -> {total} queries\n{sql}')
+
+
+class FitTrackDataMixin:
+
+    @classmethod
+    def setUpClass(cls):
+        # TestCase nunca confirma a transação do teste; as invalidações de cache esperariam um commit que não vem
+        cls.enterClassContext(fittrack_cache.immediate_invalidation())
+        super().setUpClass()
+
+    def create_user(self, username, tipo, is_superuser=False):
+        user = User.objects.create(username=username, is_superuser=is_superuser)
+        Perfil.objects.create(usuario=user, tipo=tipo)
+        return user
+
+    def create_cliente(self, nome, tipo_plano=None, usuario=None):
+        perfil = usuario.perfil if usuario else None
+        if perfil is None:
+            perfil = Perfil.objects.create(
+                usuario=User.objects.create(username=f'{nome}-user'),
+                tipo=Perfil.CLIENTE,
+            )
+        return Cliente.objects.create(
+            nome=nome, email=f'{nome}@fittrack.test', tipo_plano=tipo_plano, perfil=perfil,
+        )
+
+    def create_tipo_plano(self, nome='Básico', **kwargs):
+        return TipoPlano.objects.create(nome=nome, descricao='', preco='59.90', duracao_dias=30, **kwargs)
+
+
+class ListQueryCountTests(QueryCountTestMixin, FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.admin = self.create_user('admin', Perfil.ADMIN)
+        self.client.force_authenticate(self.admin)
+        self.plano = self.create_tipo_plano()
+        self.seq = 0
+
+    def next_cliente(self):
+        self.seq += 1
+        return self.create_cliente(f'cliente{self.seq}', self.plano)
+
+    def populate_treinos(self, n):
+        for _ in range(n):
+            treino = Treino.objects.create(nome='Treino', descricao='', duracao=60, cliente=self.next_cliente())
+            Exercicio.objects.create(nome='Supino', descricao='', treino=treino)
+
+    def populate_dietas(self, n):
+        for _ in range(n):
+            dieta = Dieta.objects.create(nome='Dieta', descricao='', calorias=2000, cliente=self.next_cliente())
+            Refeicao.objects.create(nome='Almoço', descricao='', calorias=700, dieta=dieta)
+
+    def populate_historicos(self, n):
+        for _ in range(n):
+            cliente = self.next_cliente()
+            treino = Treino.objects.create(nome='Treino', descricao='', duracao=60, cliente=cliente)
+            dieta = Dieta.objects.create(nome='Dieta', descricao='', calorias=2000, cliente=cliente)
+            HistoricoTreino.objects.create(cliente=cliente, treino=treino, data_inicio='2025-01-01')
+            HistoricoDieta.objects.create(cliente=cliente, dieta=dieta, data_inicio='2025-01-01')
+
+    def populate_trocas(self, n):
+        for _ in range(n):
+            cliente = self.next_cliente()
+            treino = Treino.objects.create(nome='Treino', descricao='', duracao=60, cliente=cliente)
+            dieta = Dieta.objects.create(nome='Dieta', descricao='', calorias=2000, cliente=cliente)
+            antigo = Exercicio.objects.create(nome='Supino', descricao='', treino=treino)
+            novo = Exercicio.objects.create(nome='Flexão', descricao='', treino=treino)
+            antiga = Refeicao.objects.create(nome='Almoço', descricao='', calorias=700, dieta=dieta)
+            nova = Refeicao.objects.create(nome='Jantar', descricao='', calorias=600, dieta=dieta)
+            TrocaExercicio.objects.create(cliente=cliente, exercicio_antigo=antigo, exercicio_novo=novo, motivo='')
+            TrocaRefeicao.objects.create(cliente=cliente, refeicao_antiga=antiga, refeicao_nova=nova, motivo='')
+
+    def populate_clientes(self, n):
+        for _ in range(n):
+            self.next_cliente()
+
+    def populate_planos(self, n):
+        for i in range(n):
+            self.create_tipo_plano(nome=f'Plano {i}')
+
+    def test_treinos_list(self):
+        self.assertQueryCountStable('/api/v1/treinos/', self.populate_treinos)
+
+    def test_dietas_list(self):
+        self.assertQueryCountStable('/api/v1/dietas/', self.populate_dietas)
+
+    def test_exercicios_list(self):
+        self.assertQueryCountStable('/api/v1/exercicios/', self.populate_treinos)
+
+    def test_refeicoes_list(self):
+        self.assertQueryCountStable('/api/v1/refeicoes/', self.populate_dietas)
+
+    def test_clientes_list(self):
+        self.assertQueryCountStable('/api/v1/clientes/', self.populate_clientes)
+
+    def test_tipos_plano_list(self):
+        self.assertQueryCountStable('/api/v1/tipos-plano/', self.populate_planos)
+
+    def test_historico_treinos_list(self):
+        self.assertQueryCountStable('/api/v1/historico-treinos/', self.populate_historicos)
+
+    def test_historico_dietas_list(self):
+        self.assertQueryCountStable('/api/v1/historico-dietas/', self.populate_historicos)
+
+    def test_trocas_exercicios_list(self):
+        self.assertQueryCountStable('/api/v1/trocas-exercicios/', self.populate_trocas)
+
+    def test_trocas_refeicoes_list(self):
+        self.assertQueryCountStable('/api/v1/trocas-refeicoes/', self.populate_trocas)
+
+    def test_perfis_list(self):
+        self.assertQueryCountStable('/api/v1/perfis/', self.populate_clientes)
+
+    def test_usuarios_list(self):
+        self.assertQueryCountStable('/api/v1/usuarios/', self.populate_clientes)
+
+
+class PrincipalTests(QueryCountTestMixin, FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        self.cliente = self.create_cliente('joao', usuario=self.user)
+        self.outro = self.create_cliente('maria')
+        self.treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=self.cliente)
+        self.treino_outro = Treino.objects.create(nome='B', descricao='', duracao=60, cliente=self.outro)
+
+    def authenticate(self, with_claims=True):
+        token = RefreshToken.for_user(self.user)
+        if with_claims:
+            add_principal_claims(token, self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+
+    def test_cliente_sees_only_own_rows(self):
+        self.authenticate()
+        response = self.client.get('/api/v1/treinos/')
+        self.assertEqual([t['id'] for t in response.data['results']], [self.treino.id])
+        self.assertEqual(self.client.get(f'/api/v1/treinos/{self.treino_outro.id}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/clientes/{self.cliente.id}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/v1/clientes/{self.outro.id}/').status_code, 404)
+
+    def test_token_resolves_perfil_once(self):
+        for with_claims in (True, False):
+            with self.subTest(with_claims=with_claims):
+                self.authenticate(with_claims)
+                _, queries = self.count_queries('get', f'/api/v1/treinos/{self.treino.id}/')
+                self.assertEqual(len([q for q in queries if 'core_perfil' in q['sql']]), 1)
+
+    def test_claims_do_not_outlive_role_change(self):
+        self.authenticate()
+        Perfil.objects.filter(usuario=self.user).update(tipo=Perfil.ADMIN)
+        self.assertEqual(self.client.get('/api/v1/perfis/').status_code, 200)
+
+    def test_cliente_created_after_login(self):
+        user = self.create_user('ana', Perfil.CLIENTE)
+        token = add_principal_claims(RefreshToken.for_user(user), user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+        cliente = self.create_cliente('ana', usuario=user)
+        treino = Treino.objects.create(nome='C', descricao='', duracao=60, cliente=cliente)
+        response = self.client.get('/api/v1/treinos/')
+        self.assertEqual([t['id'] for t in response.data['results']], [treino.id])
+
+
+@override_settings(FITTRACK_STATELESS_JWT=True)
+class StatelessJWTTests(QueryCountTestMixin, FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        authentication._active_users.clear()
+        self.admin = self.create_user('admin', Perfil.ADMIN)
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        self.cliente = self.create_cliente('joao', usuario=self.user)
+        self.treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=self.cliente)
+
+    def authenticate(self, user):
+        token = add_principal_claims(RefreshToken.for_user(user), user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+
+    def test_skips_user_fetch_after_first_request(self):
+        self.authenticate(self.user)
+        self.count_queries('get', f'/api/v1/treinos/{self.treino.id}/')
+        _, queries = self.count_queries('get', f'/api/v1/treinos/{self.treino.id}/')
+        self.assertFalse([q for q in queries if 'auth_user' in q['sql']])
+
+    def test_claims_skip_perfil_lookup(self):
+        self.authenticate(self.user)
+        _, queries = self.count_queries('get', f'/api/v1/treinos/{self.treino.id}/')
+        self.assertFalse([q for q in queries if 'core_perfil' in q['sql']])
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate(self.admin)
+        response = self.client.delete(f'/api/v1/usuarios/{self.user.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.authenticate(self.user)
+        self.assertEqual(self.client.get('/api/v1/treinos/').status_code, 401)
+
+    def test_refresh_issues_current_role_claims(self):
+        refresh = add_principal_claims(RefreshToken.for_user(self.user), self.user)
+        Perfil.objects.filter(usuario=self.user).update(tipo=Perfil.ADMIN)
+        response = self.client.post('/api/token/refresh/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(self.client.get('/api/v1/perfis/').status_code, 200)
+
+    def test_me_returns_full_user(self):
+        self.authenticate(self.user)
+        response = self.client.get('/api/v1/usuarios/me/')
+        self.assertEqual(response.data['username'], 'joao')
+
+
+class CursorPaginationTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.admin = self.create_user('admin', Perfil.ADMIN)
+        self.client.force_authenticate(self.admin)
+        self.cliente = self.create_cliente('joao')
+        treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=self.cliente)
+        for _ in range(5):
+            HistoricoTreino.objects.create(cliente=self.cliente, treino=treino, data_inicio='2025-01-01')
+
+    def test_cursor_mode_pages_without_count(self):
+        response = self.client.get('/api/v1/historico-treinos/', {'pagination': 'cursor', 'page_size': 2})
+        self.assertNotIn('count', response.data)
+        ids = [h['id'] for h in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [h['id'] for h in response.data['results']]
+        expected = list(HistoricoTreino.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get('/api/v1/historico-treinos/')
+        self.assertEqual(response.data['count'], 5)
+
+
+class SoftDeleteManagerTests(FitTrackDataMixin, TestCase):
+
+    def test_default_manager_hides_deleted_rows(self):
+        cliente = self.create_cliente('joao')
+        vivo = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=cliente)
+        removido = Treino.objects.create(nome='B', descricao='', duracao=60, cliente=cliente)
+        Treino.objects.filter(pk=removido.pk).soft_delete()
+        self.assertEqual(list(Treino.objects.values_list('id', flat=True)), [vivo.id])
+        self.assertEqual(Treino.all_objects.count(), 2)
+        self.assertEqual(list(cliente.treinos.values_list('id', flat=True)), [vivo.id])
+
+
+class SoftDeleteUniqueTests(FitTrackDataMixin, APITestCase):
+
+    def test_deleted_cliente_email_is_still_taken(self):
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        cliente = self.create_cliente('joao')
+        self.assertEqual(self.client.delete(f'/api/v1/clientes/{cliente.id}/').status_code, 204)
+        response = self.client.post('/api/v1/clientes/', {'nome': 'João', 'email': cliente.email}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN com índices parciais requer PostgreSQL')
+class PartialIndexTests(FitTrackDataMixin, TestCase):
+    """O planner deve escolher os índices parciais para as consultas filtradas por deleted_at IS NULL."""
+
+    def explain(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_hot_lookups_use_partial_indexes(self):
+        cliente = self.create_cliente('joao')
+        treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=cliente)
+        dieta = Dieta.objects.create(nome='A', descricao='', calorias=2000, cliente=cliente)
+        cases = [
+            (Treino.objects.filter(cliente=cliente), 'core_treino_cli_alive_idx'),
+            (Dieta.objects.filter(cliente=cliente), 'core_dieta_cli_alive_idx'),
+            (Exercicio.objects.filter(treino=treino), 'core_exerc_treino_alive_idx'),
+            (Refeicao.objects.filter(dieta=dieta), 'core_refeicao_dieta_alive_idx'),
+            (HistoricoTreino.objects.filter(cliente=cliente).order_by('data_inicio'), 'core_histtreino_cli_ini_idx'),
+            (HistoricoDieta.objects.filter(cliente=cliente).order_by('data_inicio'), 'core_histdieta_cli_ini_idx'),
+            (TrocaExercicio.objects.filter(cliente=cliente).order_by('data_troca'), 'core_trocaexerc_cli_data_idx'),
+            (TrocaRefeicao.objects.filter(cliente=cliente).order_by('data_troca'), 'core_trocaref_cli_data_idx'),
+            (Cliente.objects.filter(data_fim_plano__lte=timezone.now().date()), 'core_cliente_fim_plano_idx'),
+        ]
+        for queryset, index in cases:
+            with self.subTest(index=index):
+                self.assertIn(index, self.explain(queryset))
+
+
+class BulkUpsertTests(QueryCountTestMixin, FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        self.treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=self.create_cliente('joao'))
+
+    def test_creates_and_updates_in_one_request(self):
+        existente = Exercicio.objects.create(nome='Supino', descricao='', treino=self.treino)
+        payload = [
+            {'id': existente.id, 'nome': 'Supino inclinado'},
+            {'nome': 'Agachamento', 'descricao': '4x10', 'treino': self.treino.id},
+            {'nome': 'Remada', 'descricao': '3x12', 'treino': self.treino.id},
+        ]
+        response = self.client.post('/api/v1/exercicios/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([e['nome'] for e in response.data], ['Supino inclinado', 'Agachamento', 'Remada'])
+        self.assertEqual(self.treino.exercicios.count(), 3)
+        existente.refresh_from_db()
+        self.assertEqual(existente.nome, 'Supino inclinado')
+
+    def test_invalid_item_rolls_back_everything(self):
+        payload = [
+            {'nome': 'Agachamento', 'descricao': '4x10', 'treino': self.treino.id},
+            {'nome': 'Remada', 'descricao': '3x12'},
+        ]
+        response = self.client.post('/api/v1/exercicios/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('treino', response.data[1])
+        self.assertFalse(Exercicio.objects.exists())
+
+    def test_invalid_and_repeated_ids(self):
+        existente = Exercicio.objects.create(nome='Supino', descricao='', treino=self.treino)
+        payload = [
+            {'id': str(existente.id), 'nome': 'Supino inclinado'},
+            {'id': 'abc', 'nome': 'Remada'},
+            {'id': existente.id, 'nome': 'Supino declinado'},
+        ]
+        response = self.client.post('/api/v1/exercicios/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+        self.assertIn('id', response.data[2])
+        response = self.client.post('/api/v1/exercicios/bulk/', payload[:1], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        existente.refresh_from_db()
+        self.assertEqual(existente.nome, 'Supino inclinado')
+
+    def test_query_count_does_not_grow_with_items(self):
+        outro = Treino.objects.create(nome='B', descricao='', duracao=45, cliente=self.treino.cliente)
+        um, _ = self.count_queries('post', '/api/v1/exercicios/bulk/',
+                                   [{'nome': 'Supino', 'descricao': '3x10', 'treino': self.treino.id}])
+        payload = [{'nome': f'Exercício {i}', 'descricao': '3x10', 'treino': (self.treino, outro)[i % 2].id}
+                   for i in range(12)]
+        doze, queries = self.count_queries('post', '/api/v1/exercicios/bulk/', payload)
+        self.assertEqual(doze, um, [q['sql'] for q in queries])
+        self.assertEqual(outro.exercicios.count(), 6)
+
+    def test_unknown_or_invalid_parent_is_an_item_error(self):
+        payload = [
+            {'nome': 'Supino', 'descricao': '3x10', 'treino': self.treino.id},
+            {'nome': 'Remada', 'descricao': '3x10', 'treino': self.treino.id + 100},
+            {'nome': 'Agachamento', 'descricao': '3x10', 'treino': 'abc'},
+        ]
+        response = self.client.post('/api/v1/exercicios/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[1]['treino'][0].code, 'does_not_exist')
+        self.assertEqual(response.data[2]['treino'][0].code, 'incorrect_type')
+
+    def test_cliente_cannot_bulk_create(self):
+        user = self.create_user('maria', Perfil.CLIENTE)
+        self.create_cliente('maria', usuario=user)
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/v1/refeicoes/bulk/', [], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class NestedWriteTests(QueryCountTestMixin, FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.cliente = self.create_cliente('joao')
+
+    def test_treino_with_exercicios(self):
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        payload = {
+            'nome': 'Treino A', 'descricao': 'Peito', 'duracao': 60, 'cliente': self.cliente.id,
+            'exercicios': [{'nome': f'Exercício {i}', 'descricao': '3x10'} for i in range(12)],
+        }
+        count, _ = self.count_queries('post', '/api/v1/treinos/', payload)
+        treino = Treino.objects.get()
+        self.assertEqual(treino.exercicios.count(), 12)
+        self.assertTrue(HistoricoTreino.objects.filter(cliente=self.cliente, treino=treino).exists())
+        self.cliente.refresh_from_db()
+        self.assertIsNotNone(self.cliente.data_ultimo_treino)
+        # perfil, cliente, BEGIN, treino, exercícios, histórico, cliente, COMMIT
+        self.assertLessEqual(count, 8)
+
+    def test_dieta_with_refeicoes(self):
+        self.client.force_authenticate(self.create_user('nutri', Perfil.NUTRICIONISTA))
+        payload = {
+            'nome': 'Dieta A', 'descricao': 'Cutting', 'calorias': 1800, 'cliente': self.cliente.id,
+            'refeicoes': [{'nome': 'Almoço', 'descricao': 'Frango', 'calorias': 600}],
+        }
+        response = self.client.post('/api/v1/dietas/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Refeicao.objects.filter(dieta_id=response.data['id']).count(), 1)
+        self.assertTrue(HistoricoDieta.objects.filter(cliente=self.cliente).exists())
+
+    def test_children_rejected_on_update(self):
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=self.cliente)
+        response = self.client.patch(f'/api/v1/treinos/{treino.id}/', {'exercicios': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ClienteDashboardTests(QueryCountTestMixin, FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        plano = self.create_tipo_plano(periodo_trocas_dias=7)
+        self.cliente = self.create_cliente('joao', plano, usuario=self.user)
+        Cliente.objects.filter(pk=self.cliente.pk).update(data_ultimo_treino='2025-01-01')
+        Treino.objects.create(nome='Antigo', descricao='', duracao=30, cliente=self.cliente)
+        self.treino = Treino.objects.create(nome='Atual', descricao='', duracao=60, cliente=self.cliente)
+        dieta = Dieta.objects.create(nome='Atual', descricao='', calorias=2000, cliente=self.cliente)
+        Refeicao.objects.create(nome='Almoço', descricao='', calorias=700, dieta=dieta)
+        Refeicao.objects.create(nome='Jantar', descricao='', calorias=500, dieta=dieta)
+        self.url = f'/api/v1/clientes/{self.cliente.id}/dashboard/'
+        self.client.force_authenticate(self.user)
+
+    def test_dashboard_content(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['treino_atual']['id'], self.treino.id)
+        self.assertEqual(response.data['dieta_atual']['total_calorias'], 1200)
+        self.assertEqual(str(response.data['prazo_trocas_exercicios']), '2025-01-08')
+
+    def test_dashboard_query_count_is_bounded(self):
+        def populate(n):
+            for i in range(n):
+                Exercicio.objects.create(nome=f'E{i}', descricao='', treino=self.treino)
+        self.assertQueryCountStable(self.url, populate)
+
+    def test_dashboard_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Exercicio.objects.create(nome='Novo', descricao='', treino=self.treino)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ConditionalRequestTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        self.cliente = self.create_cliente('joao')
+        self.treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=self.cliente)
+
+    def test_list_not_modified(self):
+        etag = self.client.get('/api/v1/treinos/')['ETag']
+        self.assertEqual(self.client.get('/api/v1/treinos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Treino.objects.create(nome='B', descricao='', duracao=60, cliente=self.cliente)
+        self.assertEqual(self.client.get('/api/v1/treinos/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_changes_when_row_is_soft_deleted(self):
+        Treino.objects.create(nome='B', descricao='', duracao=60, cliente=self.cliente)
+        response = self.client.get('/api/v1/treinos/')
+        self.assertFalse(response.has_header('Last-Modified'))
+        Treino.objects.filter(pk=self.treino.pk).soft_delete()
+        self.assertEqual(self.client.get('/api/v1/treinos/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        since = 'Thu, 01 Jan 2099 00:00:00 GMT'
+        self.assertEqual(self.client.get('/api/v1/treinos/', HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_detail_not_modified_until_related_change(self):
+        url = f'/api/v1/treinos/{self.treino.id}/'
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.cliente.nome = 'João'
+        self.cliente.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+    def test_cliente_detail_changes_when_treino_or_dieta_is_assigned(self):
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        url = f'/api/v1/clientes/{self.cliente.id}/'
+        for rota in ('treinos', 'dietas'):
+            with self.subTest(rota=rota):
+                etag = self.client.get(url)['ETag']
+                response = self.client.post(f'/api/v1/{rota}/', {
+                    'nome': 'B', 'descricao': 'B', 'duracao': 60, 'calorias': 2000, 'cliente': self.cliente.id,
+                }, format='json')
+                self.assertEqual(response.status_code, 201, response.data)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cliente_and_perfil_change_when_user_is_edited(self):
+        user = self.create_user('ana', Perfil.CLIENTE)
+        cliente = self.create_cliente('ana', usuario=user)
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        urls = [f'/api/v1/clientes/{cliente.id}/', f'/api/v1/perfis/{user.perfil.id}/']
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        response = self.client.patch(f'/api/v1/usuarios/{user.id}/', {'email': 'ana@novo.test'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+class SyncTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        self.cliente = self.create_cliente('joao', usuario=self.user)
+        self.client.force_authenticate(self.user)
+        self.treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=self.cliente)
+        for i in range(3):
+            Exercicio.objects.create(nome=f'E{i}', descricao='', treino=self.treino)
+        Treino.objects.create(nome='Outro', descricao='', duracao=60, cliente=self.create_cliente('maria'))
+
+    def sync(self, since=None, limit=None):
+        params = {key: value for key, value in {'since': since, 'limit': limit}.items() if value is not None}
+        response = self.client.get('/api/v1/sync/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_full_then_incremental_sync(self):
+        data = self.sync()
+        self.assertEqual([t['id'] for t in data['changes']['treinos']['updated']], [self.treino.id])
+        self.assertEqual(len(data['changes']['exercicios']['updated']), 3)
+        self.assertFalse(data['has_more'])
+
+        watermark = data['watermark'].isoformat()
+        self.assertEqual(self.sync(watermark)['changes']['treinos'], {'updated': [], 'deleted': []})
+
+        Exercicio.objects.filter(nome='E0').soft_delete()
+        data = self.sync(watermark)
+        self.assertEqual(len(data['changes']['exercicios']['deleted']), 1)
+        self.assertEqual(data['changes']['exercicios']['updated'], [])
+
+    def test_paging_returns_every_row_once(self):
+        seen, since, has_more = [], None, True
+        while has_more:
+            data = self.sync(since, limit=2)
+            seen += [('treinos', t['id']) for t in data['changes']['treinos']['updated']]
+            seen += [('exercicios', e['id']) for e in data['changes']['exercicios']['updated']]
+            since, has_more = data['watermark'].isoformat(), data['has_more']
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+
+    def test_staff_cannot_sync(self):
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        self.assertEqual(self.client.get('/api/v1/sync/').status_code, 403)
+
+
+class ResponseCacheTests(QueryCountTestMixin, FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.plano = self.create_tipo_plano()
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        self.cliente = self.create_cliente('joao', usuario=self.user)
+        self.treino = Treino.objects.create(nome='A', descricao='', duracao=60, cliente=self.cliente)
+
+    def test_second_read_is_served_from_cache(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/v1/tipos-plano/')['X-Cache'], 'MISS')
+        hits = fittrack_cache.stats['hit']
+        _, queries = self.count_queries('get', '/api/v1/tipos-plano/')
+        self.assertEqual(fittrack_cache.stats['hit'], hits + 1)
+        self.assertFalse([q for q in queries if 'core_tipoplano' in q['sql']])
+
+    def test_save_and_soft_delete_invalidate(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/v1/treinos/{self.treino.id}/'
+        self.client.get(url)
+        self.treino.nome = 'B'
+        self.treino.save()
+        response = self.client.get(url)
+        self.assertEqual((response['X-Cache'], response.data['nome']), ('MISS', 'B'))
+        self.client.get('/api/v1/treinos/')
+        Treino.objects.filter(pk=self.treino.pk).soft_delete()
+        self.assertEqual(self.client.get('/api/v1/treinos/').data['count'], 0)
+
+    def test_moving_row_invalidates_previous_cliente(self):
+        self.client.force_authenticate(self.user)
+        self.client.get('/api/v1/treinos/')
+        treino = Treino.objects.get(pk=self.treino.pk)
+        treino.cliente = self.create_cliente('maria')
+        treino.save()
+        response = self.client.get('/api/v1/treinos/')
+        self.assertEqual((response['X-Cache'], response.data['count']), ('MISS', 0))
+
+    def test_responses_are_scoped_per_cliente(self):
+        self.client.force_authenticate(self.user)
+        self.client.get('/api/v1/treinos/')
+        outro = self.create_user('maria', Perfil.CLIENTE)
+        self.create_cliente('maria', usuario=outro)
+        self.client.force_authenticate(outro)
+        response = self.client.get('/api/v1/treinos/')
+        self.assertEqual((response['X-Cache'], response.data['count']), ('MISS', 0))
+
+
+class CacheInvalidationCommitTests(TransactionTestCase):
+
+    def test_versions_change_only_after_commit(self):
+        cache.clear()
+        cliente = Cliente.objects.create(nome='joao', email='joao@fittrack.test')
+        antes = fittrack_cache.get_versions([Treino], cliente.pk)
+        with transaction.atomic():
+            Treino.objects.create(nome='A', descricao='', duracao=60, cliente=cliente)
+            Treino.objects.filter(cliente=cliente).soft_delete()
+            self.assertEqual(fittrack_cache.get_versions([Treino], cliente.pk), antes)
+        self.assertNotEqual(fittrack_cache.get_versions([Treino], cliente.pk), antes)
+
+    def test_rollback_keeps_versions(self):
+        cache.clear()
+        antes = fittrack_cache.get_versions([TipoPlano])
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            TipoPlano.objects.create(nome='Pro', descricao='', preco='99.90', duracao_dias=30)
+            raise RuntimeError
+        self.assertEqual(fittrack_cache.get_versions([TipoPlano]), antes)
+
+class PlanoRulesTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.plano = self.create_tipo_plano(limite_trocas_exercicios=3)
+
+    def test_rules_are_read_without_queries(self):
+        get_plan_rules(self.plano.id)
+        with self.assertNumQueries(0):
+            rules = get_plan_rules(self.plano.id)
+        self.assertEqual(rules.limite_trocas_exercicios, 3)
+        with self.assertRaises(AttributeError):
+            rules.limite_trocas_exercicios = 10
+
+    def test_snapshot_refreshes_after_viewset_write(self):
+        get_plan_rules(self.plano.id)
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        response = self.client.patch(f'/api/v1/tipos-plano/{self.plano.id}/', {'limite_trocas_exercicios': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_plan_rules(self.plano.id).limite_trocas_exercicios, 5)
+        self.client.delete(f'/api/v1/tipos-plano/{self.plano.id}/')
+        self.assertIsNone(get_plan_rules(self.plano.id))
+
+
+class PlanoRulesCommitTests(TransactionTestCase):
+
+    def test_snapshot_reloads_only_after_commit(self):
+        cache.clear()
+        plano = TipoPlano.objects.create(nome='Pro', descricao='', preco='99.90', duracao_dias=30,
+                                         limite_trocas_exercicios=3)
+        snapshot = rules.get_snapshot()
+        with transaction.atomic():
+            plano.limite_trocas_exercicios = 5
+            plano.save()
+            # Um leitor concorrente recarregaria aqui as linhas ainda não confirmadas sob a versão nova
+            self.assertIs(rules.get_snapshot(), snapshot)
+        self.assertEqual(get_plan_rules(plano.id).limite_trocas_exercicios, 5)
+
+class TrocaQuotaTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.plano = self.create_tipo_plano(limite_trocas_exercicios=2, periodo_trocas_dias=7)
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        self.cliente = self.create_cliente('joao', self.plano, usuario=self.user)
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        response = self.client.post('/api/v1/treinos/', {
+            'nome': 'A', 'descricao': 'A', 'duracao': 60, 'cliente': self.cliente.id,
+            'exercicios': [{'nome': 'Supino', 'descricao': '3x10'}, {'nome': 'Flexão', 'descricao': '3x10'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.antigo, self.novo = Exercicio.objects.order_by('id')
+        self.client.force_authenticate(self.user)
+
+    def trocar(self, cliente=None):
+        return self.client.post('/api/v1/trocas-exercicios/', {
+            'cliente': (cliente or self.cliente).id, 'exercicio_antigo': self.antigo.id,
+            'exercicio_novo': self.novo.id, 'motivo': 'Dor no ombro',
+        }, format='json')
+
+    def test_assignment_grants_plan_quota_and_swaps_consume_it(self):
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.trocas_exercicios_restantes, 2)
+        self.assertEqual(self.trocar().status_code, 201)
+        self.assertEqual(self.trocar().status_code, 201)
+        self.assertEqual(self.trocar().status_code, 400)
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.trocas_exercicios_restantes, 0)
+        self.assertEqual(TrocaExercicio.objects.count(), 2)
+
+    def test_swap_changes_cliente_etag(self):
+        url = f'/api/v1/clientes/{self.cliente.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.trocar().status_code, 201)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['trocas_exercicios_restantes'], 1)
+
+    def test_window_is_enforced(self):
+        Cliente.objects.filter(pk=self.cliente.pk).update(data_ultimo_treino=timezone.now().date() - timedelta(days=8))
+        self.assertEqual(self.trocar().status_code, 400)
+
+    def test_unlimited_plan_does_not_consume(self):
+        TipoPlano.objects.filter(pk=self.plano.pk).update(trocas_ilimitadas=True)
+        cache.clear()
+        for _ in range(3):
+            self.assertEqual(self.trocar().status_code, 201)
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.trocas_exercicios_restantes, 2)
+
+    def test_cannot_swap_for_another_cliente(self):
+        self.assertEqual(self.trocar(self.create_cliente('maria', self.plano)).status_code, 400)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Teste de concorrência requer PostgreSQL')
+class TrocaConcurrencyTests(FitTrackDataMixin, TransactionTestCase):
+
+    def test_parallel_swaps_never_overspend(self):
+        cache.clear()
+        plano = self.create_tipo_plano(limite_trocas_exercicios=5, periodo_trocas_dias=7)
+        cliente = self.create_cliente('joao', plano)
+        Cliente.objects.filter(pk=cliente.pk).update(
+            trocas_exercicios_restantes=5, data_ultimo_treino=timezone.now().date(),
+        )
+        cliente.refresh_from_db()
+        results = []
+        barrier = threading.Barrier(32)
+
+        def worker():
+            try:
+                barrier.wait()
+                consumir_troca(cliente, EXERCICIO)
+                results.append(True)
+            except TrocaNegada:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        cliente.refresh_from_db()
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(cliente.trocas_exercicios_restantes, 0)
+
+
+class ManutencaoPlanosTests(FitTrackDataMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.hoje = timezone.now().date()
+        plano = self.create_tipo_plano(periodo_trocas_dias=7, intervalo_atualizacao_treino_dieta=30)
+        self.clientes = [self.create_cliente(f'cliente{i}', plano) for i in range(5)]
+        recente, antigo = self.hoje - timedelta(days=2), self.hoje - timedelta(days=40)
+        for cliente, data in zip(self.clientes, [recente, antigo, recente, antigo, None]):
+            Cliente.objects.filter(pk=cliente.pk).update(
+                data_ultimo_treino=data, data_ultima_dieta=data,
+                trocas_exercicios_restantes=2, trocas_refeicoes_restantes=1,
+            )
+        Cliente.objects.filter(pk=self.clientes[2].pk).update(treino_atualizacao_pendente=True)
+
+    def test_resets_closed_windows_and_flags_overdue_in_chunks(self):
+        resultado = executar_manutencao_planos(hoje=self.hoje, chunk_size=2)
+        self.assertEqual(resultado['faixas'], 3)
+        estado = {c.pk: c for c in Cliente.objects.all()}
+        recente, antigo, desmarcado, _, sem_treino = (estado[c.pk] for c in self.clientes)
+        self.assertEqual((recente.trocas_exercicios_restantes, recente.trocas_refeicoes_restantes), (2, 1))
+        self.assertEqual((antigo.trocas_exercicios_restantes, antigo.trocas_refeicoes_restantes), (0, 0))
+        self.assertEqual(sem_treino.trocas_exercicios_restantes, 0)
+        self.assertTrue(antigo.treino_atualizacao_pendente and antigo.dieta_atualizacao_pendente)
+        self.assertFalse(recente.treino_atualizacao_pendente or sem_treino.treino_atualizacao_pendente)
+        self.assertFalse(desmarcado.treino_atualizacao_pendente)
+        self.assertEqual(resultado['atualizados'], {'clientes_atualizados': 4, 'clientes_sem_plano': 0})
+
+    def test_clientes_without_active_plan_are_cleared(self):
+        Cliente.objects.filter(pk=self.clientes[0].pk).update(tipo_plano=None, treino_atualizacao_pendente=True)
+        resultado = executar_manutencao_planos(hoje=self.hoje)
+        cliente = Cliente.objects.get(pk=self.clientes[0].pk)
+        self.assertEqual((cliente.trocas_exercicios_restantes, cliente.treino_atualizacao_pendente), (0, False))
+        self.assertEqual(resultado['atualizados']['clientes_sem_plano'], 1)
+
+    def test_completed_run_is_not_repeated(self):
+        executar_manutencao_planos(hoje=self.hoje)
+        Cliente.objects.filter(pk=self.clientes[1].pk).update(trocas_exercicios_restantes=3)
+        self.assertTrue(executar_manutencao_planos(hoje=self.hoje)['ja_concluida'])
+        self.assertEqual(Cliente.objects.get(pk=self.clientes[1].pk).trocas_exercicios_restantes, 3)
+        executar_manutencao_planos(hoje=self.hoje, forcar=True)
+        self.assertEqual(Cliente.objects.get(pk=self.clientes[1].pk).trocas_exercicios_restantes, 0)
+
+    def test_resumes_after_last_processed_id(self):
+        ExecucaoRotina.objects.create(nome='manutencao_planos', data_referencia=self.hoje, ultimo_id=self.clientes[1].pk)
+        executar_manutencao_planos(hoje=self.hoje, chunk_size=1)
+        self.assertEqual(Cliente.objects.get(pk=self.clientes[1].pk).trocas_exercicios_restantes, 2)
+        self.assertEqual(Cliente.objects.get(pk=self.clientes[3].pk).trocas_exercicios_restantes, 0)
+
+    def test_bulk_update_invalidates_per_cliente_cache_versions(self):
+        antes = fittrack_cache.get_versions([Cliente], self.clientes[1].pk)
+        executar_manutencao_planos(hoje=self.hoje)
+        self.assertNotEqual(antes, fittrack_cache.get_versions([Cliente], self.clientes[1].pk))
+
+
+class VencimentosPlanosTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.hoje = timezone.now().date()
+        plano = self.create_tipo_plano()
+        self.expirando = self.create_cliente('expirando', plano)
+        self.renovar = self.create_cliente('renovar', plano)
+        self.suspender = self.create_cliente('suspender', plano)
+        self.futuro = self.create_cliente('futuro', plano)
+        for cliente, dias in [(self.expirando, 3), (self.renovar, -1), (self.suspender, -2), (self.futuro, 60)]:
+            Cliente.objects.filter(pk=cliente.pk).update(data_fim_plano=self.hoje + timedelta(days=dias))
+        Cliente.objects.filter(pk=self.renovar.pk).update(renovacao_automatica=True)
+        self.eventos = {}
+        for signal in (plano_expirando, plano_renovado, plano_suspenso):
+            signal.connect(self.receber, sender=Cliente)
+            self.addCleanup(signal.disconnect, self.receber, sender=Cliente)
+
+    def receber(self, signal, cliente_ids, **kwargs):
+        self.eventos.setdefault(signal, []).extend(cliente_ids)
+
+    def test_renews_or_suspends_expired_plans_and_emits_events(self):
+        resultado = processar_vencimentos(hoje=self.hoje, chunk_size=1)
+        self.assertEqual((resultado['expirando'], resultado['renovados'], resultado['suspensos']), (1, 1, 1))
+        self.assertEqual(self.eventos, {
+            plano_expirando: [self.expirando.pk],
+            plano_renovado: [self.renovar.pk],
+            plano_suspenso: [self.suspender.pk],
+        })
+        renovado = Cliente.objects.get(pk=self.renovar.pk)
+        self.assertEqual(renovado.data_inicio_plano, self.hoje)
+        self.assertEqual(renovado.data_fim_plano, self.hoje + timedelta(days=29))
+        self.assertEqual(renovado.status_plano, Cliente.PLANO_ATIVO)
+        suspenso = Cliente.objects.get(pk=self.suspender.pk)
+        self.assertEqual(suspenso.status_plano, Cliente.PLANO_SUSPENSO)
+        with self.assertRaises(TrocaNegada):
+            consumir_troca(suspenso, EXERCICIO)
+
+        segunda = processar_vencimentos(hoje=self.hoje)
+        self.assertEqual((segunda['renovados'], segunda['suspensos']), (0, 0))
+
+    def test_expiring_list_is_filtered_and_staff_only(self):
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        response = self.client.get('/api/v1/clientes/expirando/', {'dias': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['id'] for c in response.data['results']], [self.expirando.pk])
+        response = self.client.get('/api/v1/clientes/expirando/', {'dias': 90})
+        self.assertEqual([c['id'] for c in response.data['results']], [self.expirando.pk, self.futuro.pk])
+        self.assertEqual(self.client.get('/api/v1/clientes/expirando/', {'dias': 'x'}).status_code, 400)
+
+        self.client.force_authenticate(self.create_user('joao', Perfil.CLIENTE))
+        self.assertEqual(self.client.get('/api/v1/clientes/expirando/').status_code, 403)
+
+
+class StreamingExportTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        self.cliente = self.create_cliente('joao', usuario=self.user)
+        outro = self.create_cliente('maria')
+        for cliente in (self.cliente, outro):
+            treino = Treino.objects.create(nome=f'Treino {cliente.nome}', descricao='', duracao=60, cliente=cliente)
+            for i in range(3):
+                HistoricoTreino.objects.create(cliente=cliente, treino=treino, data_inicio='2025-01-0%d' % (i + 1),
+                                               observacoes='linha, com "aspas"')
+
+    def export(self, url='/api/v1/historico-treinos/export/', **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_respects_role_scoping(self):
+        self.client.force_authenticate(self.user)
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual({row['cliente'] for row in rows}, {self.cliente.pk})
+        self.assertEqual([row['data_inicio'] for row in rows], ['2025-01-01', '2025-01-02', '2025-01-03'])
+        self.assertEqual(rows[0]['treino_nome'], 'Treino joao')
+
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        self.assertEqual(len(self.export().splitlines()), 6)
+        self.client.force_authenticate(self.create_user('nutri', Perfil.NUTRICIONISTA))
+        self.assertEqual(self.export(), '')
+
+    def test_csv_quotes_values_and_matches_api_dates(self):
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        rows = list(csv.DictReader(io.StringIO(self.export(formato='csv'))))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['observacoes'], 'linha, com "aspas"')
+        api = self.client.get(f"/api/v1/historico-treinos/{rows[0]['id']}/").data
+        self.assertEqual(rows[0]['created_at'], api['created_at'])
+        self.assertEqual(rows[0]['data_fim'], '')
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        with CaptureQueriesContext(connection) as small:
+            self.export()
+        treino = Treino.objects.first()
+        HistoricoTreino.objects.bulk_create([
+            HistoricoTreino(cliente=self.cliente, treino=treino, data_inicio='2025-02-01') for _ in range(50)
+        ])
+        with CaptureQueriesContext(connection) as large:
+            self.export()
+        self.assertEqual(len(small), len(large))
+
+    def test_swap_export_and_invalid_format(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.export('/api/v1/trocas-exercicios/export/', formato='csv').splitlines()[0],
+                         'id,cliente,cliente_nome,exercicio_antigo,exercicio_antigo_nome,exercicio_novo,'
+                         'exercicio_novo_nome,data_troca,motivo,created_at,updated_at')
+        self.assertEqual(self.client.get('/api/v1/trocas-exercicios/export/', {'formato': 'xml'}).status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportacaoClientesTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.plano = self.create_tipo_plano()
+        self.create_user('existente', Perfil.CLIENTE)
+
+    def csv(self, *linhas):
+        cabecalho = 'username,email,password,password_hash,nome,tipo_plano,data_fim_plano\n'
+        return io.StringIO(cabecalho + ''.join(linha + '\n' for linha in linhas))
+
+    def test_creates_linked_triples_and_reports_row_errors(self):
+        hash_ = make_password('SenhaForte!123')
+        resultado = importar_clientes(self.csv(
+            f'ana,ana@fittrack.test,,{hash_},Ana,{self.plano.pk},2025-12-31',
+            'bia,bia@fittrack.test,,,,,',
+            'ana,outra@fittrack.test,,,,,',
+            'existente,novo@fittrack.test,,,,,',
+            f'caio,email-invalido,,,,{self.plano.pk + 100},',
+            'duda,duda@fittrack.test,,hash-invalido,,,',
+        ), 'csv', lote=2)
+
+        self.assertEqual((resultado['linhas'], resultado['importados']), (6, 2))
+        self.assertEqual([erro['linha'] for erro in resultado['erros']], [4, 5, 6, 7])
+        self.assertIn('username', resultado['erros'][0]['erros'])
+        self.assertEqual(set(resultado['erros'][2]['erros']), {'email', 'tipo_plano'})
+
+        ana = Cliente.objects.select_related('perfil__usuario').get(email='ana@fittrack.test')
+        self.assertEqual((ana.nome, ana.tipo_plano_id, str(ana.data_fim_plano)), ('Ana', self.plano.pk, '2025-12-31'))
+        self.assertEqual(ana.perfil.tipo, Perfil.CLIENTE)
+        self.assertTrue(ana.perfil.usuario.check_password('SenhaForte!123'))
+        bia = User.objects.get(username='bia')
+        self.assertFalse(bia.has_usable_password())
+        self.assertEqual(bia.perfil.cliente.nome, 'bia')
+
+    def test_plain_passwords_are_hashed_in_process_pool(self):
+        linhas = [f'user{i},user{i}@fittrack.test,SenhaForte!{i}23,,,,' for i in range(6)]
+        resultado = importar_clientes(self.csv(*linhas), 'csv', processos=2)
+        self.assertEqual(resultado['importados'], 6)
+        self.assertTrue(User.objects.get(username='user3').check_password('SenhaForte!323'))
+
+    def test_admin_endpoint_accepts_ndjson_upload(self):
+        conteudo = '\n'.join([
+            json.dumps({'username': 'ana', 'email': 'ana@fittrack.test', 'renovacao_automatica': True}),
+            'não é json',
+        ]).encode()
+        arquivo = SimpleUploadedFile('clientes.ndjson', conteudo)
+        self.client.force_authenticate(self.create_user('personal', Perfil.PERSONAL))
+        self.assertEqual(self.client.post('/api/v1/clientes/importar/', {'arquivo': arquivo}).status_code, 403)
+
+        arquivo.seek(0)
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        response = self.client.post('/api/v1/clientes/importar/', {'arquivo': arquivo})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['importados'], 1)
+        self.assertEqual(response.data['erros'][0]['linha'], 2)
+        self.assertTrue(Cliente.objects.get(email='ana@fittrack.test').renovacao_automatica)
+
+
+    def test_admin_endpoint_hashes_passwords_in_process(self):
+        linhas = ''.join(f'user{i},user{i}@fittrack.test,SenhaForte!{i}23\n' for i in range(6))
+        arquivo = SimpleUploadedFile('clientes.csv', f'username,email,password\n{linhas}'.encode())
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        with mock.patch('core.importacao.ProcessPoolExecutor') as pool:
+            response = self.client.post('/api/v1/clientes/importar/', {'arquivo': arquivo})
+        self.assertEqual(response.data['importados'], 6, response.data)
+        pool.assert_not_called()
+
+    def test_undecodable_or_malformed_csv_is_a_row_error(self):
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        casos = [
+            (b'username,email\nana,ana@fittrack.test\n\xff\xfe,x\n', 3),
+            (b'username,email\nana,ana@fittrack.test\nbia,' + b'x' * (csv.field_size_limit() + 1) + b'\n', 3),
+        ]
+        for conteudo, linha in casos:
+            with self.subTest(linha=linha):
+                Cliente.all_objects.filter(email='ana@fittrack.test').delete()
+                User.objects.filter(username='ana').delete()
+                arquivo = SimpleUploadedFile('clientes.csv', conteudo)
+                response = self.client.post('/api/v1/clientes/importar/', {'arquivo': arquivo})
+                self.assertEqual(response.status_code, 201, response.data)
+                self.assertEqual(response.data['importados'], 1)
+                self.assertEqual([erro['linha'] for erro in response.data['erros']], [linha])
+
+class AsyncReadViewTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        plano = self.create_tipo_plano()
+        self.admin = self.create_user('admin', Perfil.ADMIN)
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        self.cliente = self.create_cliente('joao', tipo_plano=plano, usuario=self.user)
+        self.outro = self.create_cliente('maria', tipo_plano=plano)
+        for cliente in (self.cliente, self.outro):
+            treino = Treino.objects.create(nome=f'Treino {cliente.nome}', descricao='', duracao=60, cliente=cliente)
+            dieta = Dieta.objects.create(nome=f'Dieta {cliente.nome}', descricao='', calorias=2000, cliente=cliente)
+            Exercicio.objects.create(nome='Supino', descricao='', treino=treino)
+            Refeicao.objects.create(nome='Almoço', descricao='', calorias=700, dieta=dieta)
+        self.treino_outro = Treino.objects.get(cliente=self.outro)
+
+    def headers(self, user, with_claims=True):
+        token = RefreshToken.for_user(user)
+        if with_claims:
+            add_principal_claims(token, user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+        return {'authorization': f'Bearer {token.access_token}'}
+
+    def async_get(self, url, headers=None, **extra):
+        return async_to_sync(self.async_client.get)(url, headers={**(headers or {}), **extra})
+
+    def test_responses_match_sync_views(self):
+        headers = self.headers(self.admin)
+        for prefix in ('treinos', 'dietas', 'exercicios', 'refeicoes', 'clientes'):
+            sync = self.client.get(f'/api/v1/{prefix}/')
+            response = self.async_get(f'/api/v1/async/{prefix}/', headers)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.json()['results'], json.loads(sync.content)['results'], prefix)
+            self.assertEqual(response.json()['count'], sync.data['count'])
+
+            pk = sync.data['results'][0]['id']
+            detail = self.async_get(f'/api/v1/async/{prefix}/{pk}/', headers)
+            self.assertEqual(detail.content, self.client.get(f'/api/v1/{prefix}/{pk}/').content, prefix)
+
+    def test_scoping_and_permissions(self):
+        headers = self.headers(self.user, with_claims=False)
+        response = self.async_get('/api/v1/async/treinos/', headers)
+        self.assertEqual([t['cliente'] for t in response.json()['results']], [self.cliente.pk])
+        self.assertEqual(self.async_get(f'/api/v1/async/treinos/{self.treino_outro.pk}/', headers).status_code, 404)
+        self.assertEqual(self.async_get('/api/v1/async/clientes/', headers).status_code, 403)
+        self.assertEqual(self.async_get(f'/api/v1/async/clientes/{self.cliente.pk}/', headers).status_code, 200)
+        self.assertEqual(self.async_get(f'/api/v1/async/clientes/{self.outro.pk}/', headers).status_code, 404)
+
+        anonymous = self.async_get('/api/v1/async/treinos/')
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertIn('Bearer', anonymous['WWW-Authenticate'])
+
+    def test_cache_conditional_requests_and_pagination(self):
+        headers = self.headers(self.admin)
+        first = self.async_get('/api/v1/async/treinos/', headers)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(self.async_get('/api/v1/async/treinos/', headers)['X-Cache'], 'HIT')
+        self.assertEqual(self.async_get('/api/v1/async/treinos/', headers, **{'if-none-match': first['ETag']}).status_code, 304)
+
+        url = f'/api/v1/async/exercicios/{Exercicio.objects.first().pk}/'
+        detail = self.async_get(url, headers)
+        self.assertEqual(self.async_get(url, headers, **{'if-none-match': detail['ETag']}).status_code, 304)
+        self.assertEqual(self.async_get('/api/v1/async/exercicios/?page=9', headers).status_code, 404)
+        self.assertEqual(self.async_get('/api/v1/async/exercicios/abc/', headers).status_code, 404)
+
+
+class FastJSONTests(FitTrackDataMixin, APITestCase):
+
+    def assertSameRender(self, data, media_type=None):
+        expected = JSONRenderer().render(data, media_type)
+        self.assertEqual(FastJSONRenderer().render(data, media_type), expected)
+        return expected
+
+    def test_render_matches_drf_byte_for_byte(self):
+        sao_paulo = zoneinfo.ZoneInfo('America/Sao_Paulo')
+        data = {
+            'decimal': Decimal('59.90'),
+            'data': date(2025, 1, 31),
+            'utc': datetime(2025, 1, 31, 10, 0, 0, 123456, tzinfo=dt_timezone.utc),
+            'local': datetime(2025, 1, 31, 10, 0, tzinfo=sao_paulo),
+            'ingenuo': datetime(2025, 1, 31, 10, 0),
+            'hora': time(7, 30),
+            'duracao': timedelta(minutes=90),
+            'uuid': uuid.UUID(int=1),
+            'texto': 'João\u2028 "\\" \u2029 \x1b \x7f </script>',
+            'erro': ErrorDetail('inválido', code='invalid'),
+            'lazy': gettext_lazy('Not found.'),
+            'floats': [0.1, 1.0, -0.0, 175.5, 1e-05, 0.00012, 1e16, 1.5e300],
+            'inteiros': [0, -1, 2 ** 63, 2 ** 64, -2 ** 63 - 1],
+            'chaves': {1: 'um', None: 'nulo'},
+            'conjunto': {1},
+            'vazio': [{}, [], None, True, False],
+        }
+        for key, value in data.items():
+            self.assertSameRender({key: value})
+        self.assertSameRender(data)
+        self.assertSameRender(data, 'application/json; indent=4')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_api_responses_and_fallback(self):
+        plano = self.create_tipo_plano()
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        cliente = self.create_cliente('joão', tipo_plano=plano)
+        Cliente.objects.filter(pk=cliente.pk).update(altura=175.5, peso=0.00001, data_fim_plano=date(2025, 1, 31))
+        for url in ('/api/v1/clientes/', '/api/v1/tipos-plano/', f'/api/v1/clientes/{cliente.pk}/'):
+            response = self.client.get(url)
+            self.assertEqual(response.content, JSONRenderer().render(response.data), url)
+
+        with mock.patch('core.api.v1.renderers.orjson', None):
+            self.assertSameRender({'preco': Decimal('1.10'), 'quando': timezone.now()})
+
+    def test_parse_matches_drf(self):
+        payloads = [
+            b'{"nome": "Jo\\u00e3o", "peso": 80.5, "itens": [1, 2.0, -0.0, 1e-7, true, null]}',
+            '{"nome": "João \u2028"}'.encode(),
+            b'{"a": 9223372036854775807, "b": -9223372036854775809, "c": 99999999999999999999}',
+            b'{"a": 1e400, "b": "\\ud800"}',
+        ]
+        for payload in payloads:
+            expected = JSONParser().parse(io.BytesIO(payload))
+            self.assertEqual(repr(FastJSONParser().parse(io.BytesIO(payload))), repr(expected))
+        for payload in (b'', b'{"a": NaN}', b'[1,]', b'\xff'):
+            with self.assertRaises(ParseError) as drf:
+                JSONParser().parse(io.BytesIO(payload))
+            with self.assertRaises(ParseError) as fast:
+                FastJSONParser().parse(io.BytesIO(payload))
+            self.assertEqual(str(fast.exception), str(drf.exception))
+
+        self.client.force_authenticate(self.create_user('admin', Perfil.ADMIN))
+        response = self.client.post('/api/v1/tipos-plano/', data=json.dumps({
+            'nome': 'Pro', 'descricao': 'ção', 'preco': '99.90', 'duracao_dias': 30,
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['descricao'], 'ção')
+        self.assertEqual(self.client.post('/api/v1/tipos-plano/', data='{', content_type='application/json').status_code, 400)
+
+
+class ValuesListSerializerTests(FitTrackDataMixin, APITestCase):
+    rounds = 5
+    texts = ['', 'João', 'ação "aspas" \\ barra', '😀 emoji', '  separador', 'x' * 100, '0', '<b>html</b>']
+
+    def setUp(self):
+        cache.clear()
+        self.admin = self.create_user('admin', Perfil.ADMIN, is_superuser=True)
+        self.client.force_authenticate(self.admin)
+
+    def maybe(self, rng, value):
+        return None if rng.random() < 0.3 else value
+
+    def populate(self, rng, seq):
+        planos = [
+            TipoPlano.objects.create(
+                nome=rng.choice(self.texts) or 'Plano', descricao=rng.choice(self.texts),
+                preco=Decimal(rng.randint(0, 10 ** 8)) / 100, duracao_dias=rng.randint(-5, 400),
+                trocas_ilimitadas=rng.random() < 0.5,
+            ) for _ in range(2)
+        ]
+        for i in range(6):
+            username = f'u{seq}-{i}'
+            perfil = None
+            if rng.random() < 0.7:
+                user = User.objects.create(username=username, first_name=rng.choice(self.texts),
+                                           last_name=rng.choice(self.texts), is_staff=rng.random() < 0.2)
+                perfil = Perfil.objects.create(
+                    usuario=user, tipo=rng.choice([tipo for tipo, _ in Perfil.TIPO_CHOICES]),
+                    telefone=self.maybe(rng, rng.choice(self.texts)[:15]),
+                    data_nascimento=self.maybe(rng, date(1950, 1, 1) + timedelta(days=rng.randint(0, 25000))),
+                )
+            cliente = Cliente.objects.create(
+                nome=rng.choice(self.texts), email=f'{username}@fittrack.test', perfil=perfil,
+                telefone=self.maybe(rng, '(11) 9999-0000'), tipo_plano=self.maybe(rng, rng.choice(planos)),
+                altura=self.maybe(rng, rng.choice([rng.uniform(0, 250), 175, 1e-5, 0.1])),
+                peso=self.maybe(rng, rng.uniform(-1, 1e6)),
+                data_fim_plano=self.maybe(rng, date(2025, 1, 1) + timedelta(days=rng.randint(-400, 400))),
+                status_plano=rng.choice([status for status, _ in Cliente.STATUS_PLANO_CHOICES]),
+                trocas_exercicios_restantes=rng.randint(-2 ** 31, 2 ** 31 - 1),
+            )
+            treino = Treino.objects.create(nome=rng.choice(self.texts), descricao=rng.choice(self.texts),
+                                           duracao=rng.randint(0, 300), cliente=self.maybe(rng, cliente))
+            dieta = Dieta.objects.create(nome=rng.choice(self.texts), descricao=rng.choice(self.texts),
+                                         calorias=rng.randint(0, 5000), cliente=self.maybe(rng, cliente))
+            exercicios = [Exercicio.objects.create(nome=rng.choice(self.texts), descricao='', treino=treino)
+                          for _ in range(2)]
+            refeicoes = [Refeicao.objects.create(nome=rng.choice(self.texts), descricao='', calorias=rng.randint(0, 900),
+                                                 dieta=dieta) for _ in range(2)]
+            HistoricoTreino.objects.create(cliente=cliente, treino=treino, data_inicio=date(2025, 1, 1),
+                                           data_fim=self.maybe(rng, date(2025, 2, 1)),
+                                           observacoes=self.maybe(rng, rng.choice(self.texts)))
+            HistoricoDieta.objects.create(cliente=cliente, dieta=dieta, data_inicio=date(2025, 1, 1))
+            TrocaExercicio.objects.create(cliente=cliente, exercicio_antigo=exercicios[0],
+                                          exercicio_novo=exercicios[1], motivo=rng.choice(self.texts))
+            TrocaRefeicao.objects.create(cliente=cliente, refeicao_antiga=refeicoes[0],
+                                         refeicao_nova=refeicoes[1], motivo=rng.choice(self.texts))
+        # Registros removidos e horários com microssegundos em outro fuso
+        Treino.all_objects.filter(pk=treino.pk).update(deleted_at=timezone.now())
+        Exercicio.all_objects.filter(pk=exercicios[0].pk).update(
+            updated_at=datetime(2025, 1, 31, 23, 59, 59, rng.randint(0, 999999), tzinfo=dt_timezone.utc))
+        fittrack_cache.invalidate_model(Treino)
+        fittrack_cache.invalidate_model(Exercicio)
+
+    def list_viewsets(self):
+        return [(prefix, viewset) for prefix, viewset, _ in router.registry if issubclass(viewset, ValuesListMixin)]
+
+    def test_matches_model_serializer(self):
+        viewsets = self.list_viewsets()
+        self.assertGreaterEqual(len(viewsets), 12)
+        for seq in range(self.rounds):
+            rng = random.Random(seq)
+            self.populate(rng, seq)
+            for prefix, viewset in viewsets:
+                serializer_class = viewset.serializer_class
+                values_serializer = ValuesListSerializer(serializer_class())
+                queryset = serializer_class.Meta.model._default_manager.order_by('pk')
+                expected = serializer_class(list(queryset), many=True).data
+                data = values_serializer.to_representation(values_serializer.values(queryset))
+                self.assertEqual(data, expected, prefix)
+                self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected), prefix)
+
+        # O fuso é resolvido a cada listagem, não quando o plano é montado
+        values_serializer = ValuesListSerializer(ExercicioSerializer())
+        with timezone.override(zoneinfo.ZoneInfo('Asia/Tokyo')):
+            queryset = Exercicio.objects.order_by('pk')
+            self.assertEqual(values_serializer.to_representation(values_serializer.values(queryset)),
+                             ExercicioSerializer(list(queryset), many=True).data)
+
+    def test_list_responses_match_serializer_path(self):
+        self.populate(random.Random(42), 0)
+        for prefix, viewset in self.list_viewsets():
+            queries = ['', '?page=2', '?pagination=cursor&page_size=3']
+            expandable = getattr(viewset.serializer_class, 'expandable_fields', {})
+            if expandable:
+                queries.append(f'?expand={",".join(expandable)}&omit=id')
+            for query in queries:
+                url = f'/api/v1/{prefix}/{query}'
+                cache.clear()
+                fast = self.client.get(url)
+                cache.clear()
+                with mock.patch.object(ValuesListMixin, 'get_values_serializer', return_value=None):
+                    slow = self.client.get(url)
+                self.assertEqual(fast.status_code, slow.status_code, url)
+                self.assertEqual(fast.content, slow.content, url)
+
+    def test_unsupported_fields_fall_back(self):
+        with self.assertRaises(UnsupportedValuesField):
+            ValuesListSerializer(ClienteDashboardSerializer())
+
+
+class FieldSelectionTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        plano = self.create_tipo_plano()
+        self.admin = self.create_user('admin', Perfil.ADMIN)
+        self.user = self.create_user('joao', Perfil.CLIENTE)
+        self.cliente = self.create_cliente('joao', tipo_plano=plano, usuario=self.user)
+        self.treino = Treino.objects.create(nome='Treino A', descricao='texto longo', duracao=60, cliente=self.cliente)
+        Exercicio.objects.create(nome='Supino', descricao='texto longo', treino=self.treino)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        # A consulta que carrega os registros é a última (as anteriores são o aggregate e o COUNT)
+        return response, ctx.captured_queries[-1]['sql']
+
+    def test_fields_and_omit_narrow_output_and_sql(self):
+        self.client.force_authenticate(self.admin)
+        response, sql = self.get('/api/v1/exercicios/?fields=id,nome')
+        self.assertEqual(response.data['results'], [{'id': self.treino.exercicios.get().pk, 'nome': 'Supino'}])
+        self.assertNotIn('descricao', sql)
+
+        response, sql = self.get('/api/v1/clientes/?omit=perfil,tipo_plano_nome')
+        self.assertNotIn('perfil', response.data['results'][0])
+        self.assertNotIn('tipo_plano_nome', response.data['results'][0])
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('core_tipoplano', sql)
+
+        self.client.force_authenticate(self.user)
+        response, sql = self.get(f'/api/v1/treinos/{self.treino.pk}/?fields=id,nome')
+        self.assertEqual(response.data, {'id': self.treino.pk, 'nome': 'Treino A'})
+        self.assertNotIn('descricao', sql)
+        self.assertNotIn('"core_cliente"."nome"', sql)
+
+    def test_expand_replaces_id_with_object(self):
+        self.client.force_authenticate(self.admin)
+        expected = {'id': self.cliente.pk, 'nome': 'joao', 'email': 'joao@fittrack.test'}
+        response, _ = self.get('/api/v1/treinos/?expand=cliente&fields=id,cliente')
+        self.assertEqual(response.data['results'], [{'id': self.treino.pk, 'cliente': expected}])
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.get(f'/api/v1/treinos/{self.treino.pk}/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/v1/treinos/{self.treino.pk}/?expand=cliente')
+        self.assertEqual(response.data['cliente'], expected)
+        self.assertEqual(response.data['cliente_nome'], 'joao')
+        self.assertEqual(len(ctx.captured_queries), len(baseline.captured_queries))
+
+        headers = {'authorization': f'Bearer {RefreshToken.for_user(self.admin).access_token}'}
+        url = f'/api/v1/async/treinos/?expand=cliente&omit=descricao'
+        response = async_to_sync(self.async_client.get)(url, headers=headers)
+        self.assertEqual(response.json(), json.loads(self.client.get(url.replace('/async', '')).content))
+
+    def test_expanded_relation_is_part_of_etag(self):
+        self.client.force_authenticate(self.admin)
+        historico = HistoricoTreino.objects.create(cliente=self.cliente, treino=self.treino, data_inicio='2025-01-01')
+        urls = ['/api/v1/historico-treinos/?expand=treino', f'/api/v1/historico-treinos/{historico.pk}/?expand=treino']
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.treino.nome = 'Treino B'
+        self.treino.save()
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_values_serializers_are_bounded(self):
+        self.client.force_authenticate(self.admin)
+        campos = ['id', 'nome', 'descricao', 'duracao', 'cliente', 'cliente_nome', 'created_at', 'updated_at']
+        with mock.patch.object(mixins, 'VALUES_SERIALIZERS_MAX', 4), \
+                mock.patch.object(mixins, '_values_serializers', collections.OrderedDict()):
+            for tamanho in range(1, len(campos) + 1):
+                self.get(f'/api/v1/treinos/?fields={",".join(campos[:tamanho])}')
+            self.assertLessEqual(len(mixins._values_serializers), 4)
+
+    def test_unknown_fields_and_writes(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/v1/treinos/?fields=id,senha&expand=nome')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'fields', 'expand'})
+
+        # Em escritas os parâmetros são ignorados
+        response = self.client.patch(f'/api/v1/treinos/{self.treino.pk}/?fields=id', {'nome': 'B'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['descricao'], 'texto longo')
+
+
+class DietaTotaisTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = self.create_user('admin', Perfil.ADMIN)
+        self.client.force_authenticate(self.admin)
+        self.cliente = self.create_cliente('joao')
+        self.dieta = Dieta.objects.create(nome='Dieta', descricao='', calorias=2000, cliente=self.cliente)
+        self.outra = Dieta.objects.create(nome='Outra', descricao='', calorias=1800, cliente=self.cliente)
+
+    def assertTotais(self, dieta, total, quantidade):
+        dieta.refresh_from_db()
+        self.assertEqual((dieta.total_calorias, dieta.quantidade_refeicoes), (total, quantidade))
+
+    def test_incremental_updates(self):
+        almoco = Refeicao.objects.create(nome='Almoço', descricao='', calorias=700, dieta=self.dieta)
+        jantar = Refeicao.objects.create(nome='Jantar', descricao='', calorias=500, dieta=self.dieta)
+        self.assertTotais(self.dieta, 1200, 2)
+
+        almoco.calorias = 800
+        almoco.save()
+        self.assertTotais(self.dieta, 1300, 2)
+
+        # Alteração fora de update_fields não chega ao banco nem aos totais
+        almoco.calorias = 5000
+        almoco.save(update_fields=['nome'])
+        self.assertTotais(self.dieta, 1300, 2)
+
+        response = self.client.patch(f'/api/v1/refeicoes/{jantar.pk}/', {'dieta': self.outra.pk}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotais(self.dieta, 800, 1)
+        self.assertTotais(self.outra, 500, 1)
+
+        self.assertEqual(self.client.delete(f'/api/v1/refeicoes/{almoco.pk}/').status_code, 204)
+        self.assertTotais(self.dieta, 0, 0)
+        almoco = Refeicao.all_objects.get(pk=almoco.pk)
+        almoco.deleted_at = None
+        almoco.save()
+        self.assertTotais(self.dieta, 800, 1)
+
+        Refeicao.objects.filter(pk=almoco.pk).soft_delete()
+        self.assertTotais(self.dieta, 0, 0)
+        jantar.delete()
+        self.assertTotais(self.outra, 0, 0)
+        self.assertEqual(call_command_output('recalcular_totais_dietas'), '0 dieta(s) corrigida(s)')
+
+    def test_nested_create_and_bulk(self):
+        response = self.client.post('/api/v1/dietas/', {
+            'nome': 'Nova', 'descricao': 'Hipertrofia', 'calorias': 2000, 'cliente': self.cliente.pk,
+            'refeicoes': [{'nome': 'Café', 'descricao': 'Ovos', 'calorias': 300},
+                          {'nome': 'Almoço', 'descricao': 'Frango', 'calorias': 900}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response.data['total_calorias'], response.data['quantidade_refeicoes']), (1200, 2))
+
+        refeicao = Refeicao.objects.filter(dieta_id=response.data['id']).order_by('pk').first()
+        response = self.client.post('/api/v1/refeicoes/bulk/', [
+            {'id': refeicao.pk, 'calorias': 100, 'dieta': self.dieta.pk},
+            {'nome': 'Ceia', 'descricao': 'Iogurte', 'calorias': 250, 'dieta': self.dieta.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTotais(Dieta.objects.get(nome='Nova'), 900, 1)
+        self.assertTotais(self.dieta, 350, 2)
+        self.assertEqual(call_command_output('recalcular_totais_dietas'), '0 dieta(s) corrigida(s)')
+
+    def test_list_reflects_totals_and_repair(self):
+        first = self.client.get('/api/v1/dietas/')
+        Refeicao.objects.create(nome='Almoço', descricao='', calorias=700, dieta=self.dieta)
+        response = self.client.get('/api/v1/dietas/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        totais = {dieta['id']: dieta['total_calorias'] for dieta in response.data['results']}
+        self.assertEqual(totais, {self.dieta.pk: 700, self.outra.pk: 0})
+
+        Dieta.objects.filter(pk=self.outra.pk).update(total_calorias=99, quantidade_refeicoes=3)
+        self.assertEqual(call_command_output('recalcular_totais_dietas'), '1 dieta(s) corrigida(s)')
+        self.assertTotais(self.outra, 0, 0)
+        self.assertTotais(self.dieta, 700, 1)
+
+
+
+@override_settings(FITTRACK_PROFILING_SAMPLE_RATE=1.0, FITTRACK_PROFILING_DUPLICATE_THRESHOLD=3)
+class ProfilingTests(FitTrackDataMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        metricas.limpar()
+        self.addCleanup(metricas.limpar)
+        self.admin = self.create_user('admin', Perfil.ADMIN)
+        cliente = self.create_cliente('joao')
+        self.treino = Treino.objects.create(nome='Treino', descricao='', duracao=60, cliente=cliente)
+
+    def metric(self, text, name, **labels):
+        prefix = name + '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '} '
+        values = [float(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix)]
+        return values[0] if values else None
+
+    def test_records_sync_and_async_endpoints(self):
+        token = add_principal_claims(RefreshToken.for_user(self.admin), self.admin).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get('/api/v1/treinos/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/v1/treinos/{self.treino.pk}/').status_code, 200)
+        response = async_to_sync(self.async_client.get)('/api/v1/async/treinos/',
+                                                         headers={'authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/v1/metricas/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        for endpoint in ('TreinoViewSet.list', 'TreinoViewSet.retrieve', 'TreinoViewSet.list[async]'):
+            self.assertEqual(self.metric(text, 'fittrack_requests_total', endpoint=endpoint, status=200), 1, endpoint)
+            self.assertEqual(self.metric(text, 'fittrack_request_duration_seconds_bucket', endpoint=endpoint,
+                                         le='+Inf'), 1)
+            self.assertGreater(self.metric(text, 'fittrack_db_queries_sum', endpoint=endpoint), 0, endpoint)
+            self.assertGreater(self.metric(text, 'fittrack_db_duration_seconds_sum', endpoint=endpoint), 0)
+            self.assertGreater(self.metric(text, 'fittrack_serialization_duration_seconds_sum', endpoint=endpoint), 0)
+        self.assertIn('fittrack_profiling_sample_rate 1.0', text)
+
+    def test_flags_repeated_sql(self):
+        def view(request):
+            for quantidade in range(1, 4):
+                list(Treino.objects.filter(pk__in=range(quantidade)))
+            Dieta.objects.count()
+            Dieta.objects.count()
+            return HttpResponse()
+
+        metricas.ProfilingMiddleware(view)(RequestFactory().get('/'))
+        duplicated = [line for line in metricas.exportar().splitlines()
+                      if line.startswith('fittrack_duplicate_sql_total{')]
+        self.assertEqual(len(duplicated), 1, duplicated)
+        self.assertIn('endpoint="desconhecido"', duplicated[0])
+        self.assertIn('IN (...)', duplicated[0])
+        self.assertIn('core_treino', duplicated[0])
+        self.assertTrue(duplicated[0].endswith(' 1'))
+
+    def test_sampling_off_and_admin_only(self):
+        self.client.force_authenticate(self.admin)
+        with override_settings(FITTRACK_PROFILING_SAMPLE_RATE=0):
+            self.client.get('/api/v1/treinos/')
+            text = self.client.get('/api/v1/metricas/').content.decode()
+        self.assertNotIn('fittrack_requests_total{', text)
+
+        self.client.force_authenticate(self.create_user('maria', Perfil.CLIENTE))
+        self.assertEqual(self.client.get('/api/v1/metricas/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/v1/metricas/').status_code, 401)
+
+
+
+class BenchmarkApiTests(TestCase):
+
+    def test_massa_is_deterministic(self):
+        primeira = gerar_massa(clientes=4, semente=7, prefixo='a')
+        segunda = gerar_massa(clientes=4, semente=7, prefixo='b')
+        self.assertEqual(primeira.contagem, segunda.contagem)
+        for massa in (primeira, segunda):
+            self.assertEqual(set(massa.usuarios), {Perfil.ADMIN, Perfil.NUTRICIONISTA, Perfil.PERSONAL, Perfil.CLIENTE})
+
+        def linhas(prefixo):
+            dominio = f'@{prefixo}.test'
+            return (
+                list(Treino.objects.filter(cliente__email__endswith=dominio).order_by('pk').values_list('nome', 'duracao')),
+                list(Exercicio.objects.filter(treino__cliente__email__endswith=dominio).order_by('pk')
+                     .values_list('nome', 'descricao')),
+                list(Refeicao.objects.filter(dieta__cliente__email__endswith=dominio).order_by('pk')
+                     .values_list('nome', 'calorias')),
+            )
+
+        self.assertEqual(linhas('a'), linhas('b'))
+        dieta = Dieta.objects.get(pk=primeira.alvos[Dieta])
+        self.assertEqual(dieta.total_calorias, sum(dieta.refeicoes.values_list('calorias', flat=True)))
+
+    def test_report_covers_every_route_and_role(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            saida = os.path.join(pasta, 'relatorio.json')
+            call_command('benchmark_api', clientes=3, requisicoes=1, aquecimento=0, escrita=True, saida=saida,
+                         stdout=io.StringIO())
+            with open(saida, encoding='utf-8') as arquivo:
+                relatorio = json.load(arquivo)
+        self.assertFalse(Cliente.all_objects.exists())
+        cenarios = relatorio['cenarios']
+        for prefix, _, _ in router.registry:
+            papeis = {c['papel'] for c in cenarios if c['rota'] == prefix and c['metodo'] == 'GET'}
+            self.assertEqual(papeis, {Perfil.ADMIN, Perfil.NUTRICIONISTA, Perfil.PERSONAL, Perfil.CLIENTE}, prefix)
+        self.assertIn(('POST', 'treinos', 'create'), {(c['metodo'], c['rota'], c['action']) for c in cenarios})
+        falhas = [c for c in cenarios if any(codigo.startswith('5') for codigo in c['status'])]
+        self.assertEqual(falhas, [])
+        self.assertTrue(all(c['consultas'] >= 1 and c['p95_ms'] >= c['p50_ms'] > 0 for c in cenarios))
+
+
+
+# Consultas SQL permitidas por requisição em cada (rota, action) do router, para qualquer papel e tamanho de
+# página, com o cache de respostas vazio. Rotas novas precisam entrar aqui; aumentar um número deve ser intencional.
+QUERY_BUDGETS = {
+    ('treinos', 'list'): 5, ('treinos', 'retrieve'): 3, ('treinos', 'create'): 9,
+    ('dietas', 'list'): 5, ('dietas', 'retrieve'): 3, ('dietas', 'create'): 9,
+    ('tipos-plano', 'list'): 5, ('tipos-plano', 'retrieve'): 3, ('tipos-plano', 'create'): 3,
+    ('clientes', 'list'): 5, ('clientes', 'retrieve'): 3, ('clientes', 'create'): 4,
+    ('clientes', 'expirando'): 3, ('clientes', 'dashboard'): 7,
+    ('historico-treinos', 'list'): 5, ('historico-treinos', 'retrieve'): 3, ('historico-treinos', 'create'): 5,
+    ('historico-treinos', 'export'): 5,
+    ('historico-dietas', 'list'): 5, ('historico-dietas', 'retrieve'): 3, ('historico-dietas', 'create'): 5,
+    ('historico-dietas', 'export'): 5,
+    ('exercicios', 'list'): 5, ('exercicios', 'retrieve'): 3, ('exercicios', 'create'): 4,
+    ('refeicoes', 'list'): 5, ('refeicoes', 'retrieve'): 3, ('refeicoes', 'create'): 8,
+    ('trocas-exercicios', 'list'): 5, ('trocas-exercicios', 'retrieve'): 3, ('trocas-exercicios', 'create'): 8,
+    ('trocas-exercicios', 'export'): 5,
+    ('trocas-refeicoes', 'list'): 5, ('trocas-refeicoes', 'retrieve'): 3, ('trocas-refeicoes', 'create'): 8,
+    ('trocas-refeicoes', 'export'): 5,
+    ('usuarios', 'list'): 4, ('usuarios', 'retrieve'): 3, ('usuarios', 'create'): 4, ('usuarios', 'me'): 2,
+    ('perfis', 'list'): 5, ('perfis', 'retrieve'): 3,
+    ('sync', 'list'): 8,
+    ('metricas', 'list'): 2,
+}
+
+
+class RouterQueryBudgetTests(APITestCase):
+    """Orçamento de consultas de list, retrieve, create e demais GETs de todas as rotas do router, por papel."""
+    papeis = (Perfil.ADMIN, Perfil.NUTRICIONISTA, Perfil.PERSONAL, Perfil.CLIENTE)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.massa = gerar_massa(clientes=4, semente=1, prefixo='orcamento')
+
+    def setUp(self):
+        cache.clear()
+        self.alvos = {model.__name__: pk for model, pk in self.massa.alvos.items()}
+        self.tokens = {
+            papel: str(add_principal_claims(RefreshToken.for_user(usuario), usuario).access_token)
+            for papel, usuario in self.massa.usuarios.items()
+        }
+
+    def scenarios(self):
+        """(prefixo, action, método, url, paginada) de cada rota com orçamento verificável."""
+        scenarios = []
+        for prefix, viewset, basename in router.registry:
+            model = getattr(getattr(viewset, 'queryset', None), 'model', None)
+            for route in router.get_routes(viewset):
+                kwargs = {}
+                if route.detail:
+                    if model is None:
+                        continue
+                    lookup = getattr(viewset, 'lookup_url_kwarg', None) or getattr(viewset, 'lookup_field', 'pk')
+                    kwargs[lookup] = self.massa.alvos[model]
+                url = reverse(route.name.format(basename=basename), kwargs=kwargs)
+                for method, action in router.get_method_map(viewset, route.mapping).items():
+                    if method == 'get' or (method, action) == ('post', 'create') and (prefix, action) in ESCRITAS:
+                        paginated = action == 'list' and getattr(viewset, 'pagination_class', None) is not None
+                        scenarios.append((prefix, action, method, url, paginated))
+        return scenarios
+
+    def request(self, papel, method, url, data=None):
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens[papel]}')
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500, f'{method.upper()} {url} como {papel}')
+        rows = None
+        if not response.streaming and response.get('Content-Type') == 'application/json':
+            content = response.json()
+            rows = len(content['results']) if isinstance(content, dict) and 'results' in content else None
+        return [query['sql'] for query in ctx.captured_queries], rows
+
+    def assertWithinBudget(self, prefix, action, papel, queries):
+        budget = QUERY_BUDGETS[prefix, action]
+        if len(queries) > budget:
+            sql = '\n'.join(f'{i}. {query}' for i, query in enumerate(queries, 1))
+            self.fail(f'{prefix}.{action} como {papel}: {len(queries)} consultas, orçamento {budget}\n{sql}')
+
+    def test_every_route_has_a_budget(self):
+        routes = {(prefix, action) for prefix, action, *_ in self.scenarios()}
+        self.assertEqual(sorted(routes - set(QUERY_BUDGETS)), [], 'rotas sem orçamento')
+        self.assertEqual(sorted(set(QUERY_BUDGETS) - routes), [], 'orçamentos de rotas inexistentes')
+
+    def test_reads_within_budget_and_independent_of_page_size(self):
+        grown = 0
+        for prefix, action, method, url, paginated in self.scenarios():
+            if method != 'get':
+                continue
+            for papel in self.papeis:
+                with self.subTest(route=f'{prefix}.{action}', papel=papel):
+                    if not paginated:
+                        self.assertWithinBudget(prefix, action, papel, self.request(papel, method, url)[0])
+                        continue
+                    with mock.patch.object(PageNumberPagination, 'page_size', 1):
+                        small, small_rows = self.request(papel, method, url)
+                    with mock.patch.object(PageNumberPagination, 'page_size', 100):
+                        large, large_rows = self.request(papel, method, url)
+                    self.assertWithinBudget(prefix, action, papel, large)
+                    self.assertEqual(len(small), len(large), (
+                        f'{prefix}.{action} como {papel}: {len(small)} consultas com 1 linha por página, '
+                        f'{len(large)} com {large_rows}\n' + '\n'.join(large)))
+                    grown += (large_rows or 0) > (small_rows or 0)
+        # Sem várias linhas por página a comparação acima não prova nada
+        self.assertGreaterEqual(grown, 20)
+
+    def test_creates_within_budget(self):
+        for prefix, action, method, url, _ in self.scenarios():
+            if method != 'post':
+                continue
+            for numero, papel in enumerate(self.papeis):
+                with self.subTest(route=f'{prefix}.{action}', papel=papel):
+                    queries, _ = self.request(papel, method, url, ESCRITAS[prefix, action](self.alvos, numero))
+                    self.assertWithinBudget(prefix, action, papel, queries)
+
+
+def call_command_output(*args, **kwargs):
+    out = io.StringIO()
+    call_command(*args, stdout=out, **kwargs)
+    return out.getvalue().strip()
@@ -0,0 +1,136 @@
+"""
+Totais desnormalizados da dieta: `total_calorias` e `quantidade_refeicoes`
+somam as refeições não removidas, para que as listagens não precisem de JOIN.
+
+Cada gravação de Refeicao ajusta os totais das dietas afetadas com um UPDATE
+incremental (expressões F()) na mesma transação: a criação soma, a remoção
+(lógica ou física) subtrai e a alteração de calorias ou de dieta aplica a
+diferença. Gravações em lote (bulk_create/bulk_update) chamam
+`ajustar_totais` explicitamente. `recalcular_totais` refaz os valores a partir
+das refeições com uma única UPDATE (comando recalcular_totais_dietas).
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+from core.cache import invalidate_model
+from core.models import Dieta, Refeicao
+from core.signals import removidos_logicamente
+
+CAMPOS = ('dieta_id', 'calorias', 'deleted_at')
+
+
+def contribuicao(refeicao):
+    """(dieta_id, calorias) que a refeição soma aos totais; None se removida."""
+    if refeicao.deleted_at is not None:
+        return None
+    return refeicao.dieta_id, refeicao.calorias
+
+
+def ajustar_totais(anteriores=(), atuais=()):
+    """
+    Subtrai as contribuições `anteriores` e soma as `atuais` nos totais das
+    dietas. Deve ser chamada dentro da transação que gravou as refeições.
+    """
+    deltas = {}
+    for sinal, contribuicoes in ((-1, anteriores), (1, atuais)):
+        for item in contribuicoes:
+            if item is None:
+                continue
+            dieta_id, calorias = item
+            total, quantidade = deltas.get(dieta_id, (0, 0))
+            deltas[dieta_id] = (total + sinal * calorias, quantidade + sinal)
+    deltas = {dieta_id: delta for dieta_id, delta in deltas.items() if delta != (0, 0)}
+    if not deltas:
+        return
+
+    agora = timezone.now()
+    # Ordem fixa: transações concorrentes bloqueiam as dietas na mesma sequência
+    for dieta_id in sorted(deltas):
+        total, quantidade = deltas[dieta_id]
+        # updated_at muda para que ETag, cache e sincronização vejam os novos totais
+        Dieta.all_objects.filter(pk=dieta_id).update(
+            total_calorias=F('total_calorias') + total,
+            quantidade_refeicoes=F('quantidade_refeicoes') + quantidade,
+            updated_at=agora,
+        )
+    # update() não dispara signals
+    invalidate_model(Dieta, Dieta.all_objects.filter(pk__in=deltas).values_list('cliente_id', flat=True))
+
+
+def recalcular_totais(dieta_ids=None):
+    """
+    Recalcula os totais a partir das refeições com uma única UPDATE, apenas
+    nas dietas divergentes, e devolve quantas foram corrigidas.
+    """
+    refeicoes = Refeicao.objects.filter(dieta=OuterRef('pk')).order_by().values('dieta')
+    total = Coalesce(Subquery(refeicoes.annotate(valor=Sum('calorias')).values('valor')), Value(0))
+    quantidade = Coalesce(Subquery(refeicoes.annotate(valor=Count('pk')).values('valor')), Value(0))
+
+    dietas = Dieta.all_objects.all()
+    if dieta_ids is not None:
+        dietas = dietas.filter(pk__in=dieta_ids)
+    divergentes = dietas.annotate(total=total, quantidade=quantidade).exclude(
+        total_calorias=F('total'), quantidade_refeicoes=F('quantidade'),
+    )
+    corrigidas = Dieta.all_objects.filter(pk__in=divergentes.values('pk')).update(
+        total_calorias=total, quantidade_refeicoes=quantidade, updated_at=timezone.now(),
+    )
+    if corrigidas:
+        invalidate_model(Dieta, all_clientes=True)
+    return corrigidas
+
+
+def _linha_salva(instance):
+    # Linha atual com bloqueio: gravações concorrentes da mesma refeição aplicam as diferenças em sequência
+    return Refeicao.all_objects.select_for_update().filter(pk=instance.pk).values(*CAMPOS).first()
+
+
+def _antes_de_salvar(sender, instance, raw=False, **kwargs):
+    instance._totais_salvos = None
+    if not raw and instance.pk is not None:
+        instance._totais_salvos = _linha_salva(instance)
+
+
+def _depois_de_salvar(sender, instance, raw=False, update_fields=None, **kwargs):
+    salvos = instance.__dict__.pop('_totais_salvos', None)
+    if raw:
+        return
+    atual = Refeicao(pk=instance.pk)
+    for campo in CAMPOS:
+        nome = campo.removesuffix('_id')
+        if salvos is None or update_fields is None or campo in update_fields or nome in update_fields:
+            setattr(atual, campo, getattr(instance, campo))
+        else:
+            # Campos fora de update_fields continuam com o valor do banco
+            setattr(atual, campo, salvos[campo])
+    anterior = None
+    if salvos is not None:
+        anterior = contribuicao(Refeicao(**salvos))
+    ajustar_totais([anterior], [contribuicao(atual)])
+
+
+def _antes_de_remover(sender, instance, origin=None, **kwargs):
+    # Só a instância removida diretamente pode estar desatualizada; as demais acabaram de ser lidas pelo Collector
+    if origin is instance:
+        instance._totais_salvos = _linha_salva(instance)
+
+
+def _depois_de_remover(sender, instance, **kwargs):
+    salvos = instance.__dict__.pop('_totais_salvos', None)
+    ajustar_totais(anteriores=[contribuicao(Refeicao(**salvos) if salvos is not None else instance)])
+
+
+def _depois_de_remover_logicamente(sender, ids, **kwargs):
+    linhas = Refeicao.all_objects.filter(pk__in=ids).values_list('dieta_id', 'calorias')
+    ajustar_totais(anteriores=list(linhas))
+
+
+def connect_signals():
+    pre_save.connect(_antes_de_salvar, sender=Refeicao, dispatch_uid='fittrack-totais-pre-save')
+    post_save.connect(_depois_de_salvar, sender=Refeicao, dispatch_uid='fittrack-totais-save')
+    pre_delete.connect(_antes_de_remover, sender=Refeicao, dispatch_uid='fittrack-totais-pre-delete')
+    post_delete.connect(_depois_de_remover, sender=Refeicao, dispatch_uid='fittrack-totais-delete')
+    removidos_logicamente.connect(_depois_de_remover_logicamente, sender=Refeicao,
+                                  dispatch_uid='fittrack-totais-soft-delete')
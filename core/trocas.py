@@ -0,0 +1,78 @@
+"""
+Regras de consumo das trocas de exercícios e refeições.
+
+O saldo do cliente é decrementado por um único UPDATE condicional
+(`restantes > 0` e janela de trocas aberta) com expressão F(), de modo que
+requisições concorrentes nunca consomem mais trocas do que o plano permite e
+sem precisar de SELECT ... FOR UPDATE.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.cache import invalidate_model
+from core.models import Cliente
+from core.rules import get_plan_rules
+
+EXERCICIO = 'exercicio'
+REFEICAO = 'refeicao'
+
+# tipo -> (contador no cliente, data de início da janela, limite no plano)
+CAMPOS = {
+    EXERCICIO: ('trocas_exercicios_restantes', 'data_ultimo_treino', 'limite_trocas_exercicios'),
+    REFEICAO: ('trocas_refeicoes_restantes', 'data_ultima_dieta', 'limite_trocas_refeicoes'),
+}
+
+
+class TrocaNegada(Exception):
+    pass
+
+
+def limite_trocas(cliente, tipo):
+    """Saldo concedido ao cliente quando recebe um novo treino/dieta."""
+    rules = get_plan_rules(cliente.tipo_plano_id)
+    if rules is None:
+        return 0
+    return getattr(rules, CAMPOS[tipo][2])
+
+
+def consumir_troca(cliente, tipo, hoje=None):
+    """
+    Valida a janela do plano e consome uma troca do cliente.
+
+    Deve ser chamada dentro de uma transação junto com a criação da troca,
+    para que o saldo volte caso a inserção falhe.
+    """
+    contador, campo_data, _ = CAMPOS[tipo]
+    rules = get_plan_rules(cliente.tipo_plano_id)
+    if rules is None or cliente.status_plano != Cliente.PLANO_ATIVO:
+        raise TrocaNegada('Cliente sem plano ativo.')
+
+    hoje = hoje or timezone.now().date()
+    inicio_janela = hoje - timedelta(days=rules.periodo_trocas_dias)
+    data_inicio = getattr(cliente, campo_data)
+    if data_inicio is None or data_inicio < inicio_janela:
+        raise TrocaNegada('O período para trocas deste plano já terminou.')
+
+    if rules.trocas_ilimitadas:
+        return
+
+    # updated_at muda para que ETag, cache e sincronização vejam o novo saldo
+    updated = Cliente.objects.filter(**{
+        'pk': cliente.pk,
+        'status_plano': Cliente.PLANO_ATIVO,
+        f'{contador}__gt': 0,
+        f'{campo_data}__gte': inicio_janela,
+    }).update(**{contador: F(contador) - 1, 'updated_at': timezone.now()})
+    if not updated:
+        raise TrocaNegada('Limite de trocas do período atingido.')
+    # update() não dispara signals
+    invalidate_model(Cliente, [cliente.pk])
+
+
+def registrar_troca(serializer, tipo):
+    with transaction.atomic():
+        consumir_troca(serializer.validated_data['cliente'], tipo)
+        return serializer.save()